@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares the timestamp parser of timelog_parse against datetime.strptime
+
+    python benchmarks/bench_parse.py [number of lines]
+"""
+
+import os
+import sys
+import timeit
+from datetime import datetime
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timelog_parse  # noqa: E402
+
+NUM_LINES = 100000
+REPEAT = 5
+
+
+def get_lines(num_lines):
+    """Returns a list of log lines, a few minutes apart from each other
+    """
+    start = datetime(2020, 1, 1, 8, 0)
+    lines = []
+    for num in range(num_lines):
+        task_date = start + timedelta(minutes=num * 7)
+        lines.append("{}: PROJ: task {}".format(
+            task_date.strftime(timelog_parse.DATE_FORMAT), num % 50))
+    return lines
+
+
+def parse_strptime(lines):
+    for line in lines:
+        datetime.strptime(line[:16], timelog_parse.DATE_FORMAT)
+
+
+def parse_fast(lines):
+    for line in lines:
+        timelog_parse.parse_timestamp(line)
+
+
+def parse_fast_cold(lines):
+    timelog_parse._parse_prefix.cache_clear()
+    timelog_parse._parse_day.cache_clear()
+    parse_fast(lines)
+
+
+def bench(func, lines):
+    """Returns the best time of the function over the lines, in seconds
+    """
+    return min(timeit.repeat(lambda: func(lines), number=1, repeat=REPEAT))
+
+
+def main(num_lines=NUM_LINES):
+    lines = get_lines(num_lines)
+
+    # Both parsers must agree
+    for line in lines[:1000]:
+        expected = datetime.strptime(line[:16], timelog_parse.DATE_FORMAT)
+        assert timelog_parse.parse_timestamp(line) == expected
+
+    # Same line parsed three times in a row, as get_tasks used to do
+    repeated = [line for line in lines[:num_lines // 3] for _ in range(3)]
+
+    print("{} lines, best of {}".format(num_lines, REPEAT))
+    for name, data in (("distinct lines", lines), ("repeated x3", repeated)):
+        base = bench(parse_strptime, data)
+        fast = bench(parse_fast_cold, data)
+        print("{}: strptime {:.3f}s, parse_timestamp {:.3f}s ({:.1f}x)".format(
+            name.ljust(14), base, fast, base / fast))
+
+
+if __name__ == "__main__":
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or NUM_LINES)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares the ways of reading a range of dates from a timelog file: the
+text loop that decodes and parses every line, the bisecting reader and the
+memory-mapped bytes scanner
+
+    python benchmarks/bench_scan.py [number of lines]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timelog_reader  # noqa: E402
+from timelog_parse import DATE_FORMAT  # noqa: E402
+from timelog_parse import parse_timestamp  # noqa: E402
+
+NUM_LINES = 1000000
+REPEAT = 3
+
+
+def write_log(path, num_lines):
+    """Writes a log with the number of lines passed-in, ten tasks a day
+    """
+    start = datetime(2000, 1, 1, 8, 0)
+    with open(path, "w") as writer:
+        for num in range(num_lines):
+            day, task = divmod(num, 10)
+            task_date = start + timedelta(days=day, minutes=task * 45)
+            if not task:
+                writer.write("\n{}: arrived**\n".format(
+                    task_date.strftime(DATE_FORMAT)))
+            writer.write("{}: PROJ{}: task {}\n".format(
+                task_date.strftime(DATE_FORMAT), num % 7, num % 300))
+    return start + timedelta(days=num_lines // 10)
+
+
+def read_text(path, since, until):
+    """Reads the range as the scripts used to: line by line, decoding,
+    stripping and parsing each one of them
+    """
+    with open(path, "r") as reader:
+        for line in reader:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                task_date = parse_timestamp(line)
+            except ValueError:
+                continue
+            if since <= task_date <= until:
+                yield task_date, line
+
+
+def bench(func, *args):
+    """Returns the best time and the number of lines returned by the reader
+    """
+    best = None
+    for num in range(REPEAT):
+        start = time.perf_counter()
+        count = sum(1 for l in func(*args))
+        elapsed = time.perf_counter() - start
+        best = best is None and elapsed or min(best, elapsed)
+    return best, count
+
+
+def main(num_lines=NUM_LINES):
+    path = os.path.join(tempfile.gettempdir(),
+                        "timelog-bench-{}.txt".format(num_lines))
+    end = write_log(path, num_lines)
+    print("{} lines, {:.1f} MB, best of {}".format(
+        num_lines, os.path.getsize(path) / 1e6, REPEAT))
+
+    ranges = (
+        ("last month", end - timedelta(days=31), end),
+        ("last year", end - timedelta(days=365), end),
+        ("whole file", datetime(2000, 1, 1), end),
+    )
+    readers = (
+        ("text", read_text),
+        ("seek", timelog_reader.read_range),
+        ("mmap", timelog_reader.scan_lines),
+    )
+    for name, since, until in ranges:
+        base = None
+        for reader_name, reader in readers:
+            elapsed, count = bench(reader, path, since, until)
+            base = base or elapsed
+            print("{} {}: {:.3f}s, {} lines ({:.1f}x)".format(
+                name.ljust(10), reader_name.ljust(4), elapsed, count,
+                base / elapsed))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or NUM_LINES)
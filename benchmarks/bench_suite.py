@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Times the main functions of timelog and report_count_hours against
+synthetic logs of several sizes, with the throughput in lines per second and
+the peak memory allocated. Results can be stored as JSON and compared with
+a previous run
+
+    python benchmarks/bench_suite.py [--sizes 10000,100000] [--output FILE]
+                                     [--compare FILE] [--only NAME,...]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_count_hours  # noqa: E402
+import timelog  # noqa: E402
+from generate_log import generate  # noqa: E402
+
+SIZES = (10000, 100000, 1000000)
+REPEAT = 3
+
+
+def read_timelog():
+    timelog.read_timelog()
+
+
+def read_timelog_cached():
+    timelog.USE_CACHE = True
+    try:
+        timelog.read_timelog()
+    finally:
+        timelog.USE_CACHE = False
+
+
+def get_tasks():
+    # A term that is rarely found, so most of the log is read
+    timelog.get_tasks(term="docs 199", purge=True, limit=10)
+
+
+def period_summary():
+    # Without running totals, so the log is read on every run
+    timelog.reset_running_totals()
+    timelog.period_summary(timelog.YEAR)
+
+
+def period_summary_cached():
+    # Running totals up-to-date after the first run
+    timelog.period_summary(timelog.YEAR)
+
+
+def show_summary():
+    timelog.reset_running_totals()
+    timelog.show_summary()
+
+
+def show_summary_cached():
+    timelog.show_summary()
+
+
+def compute_totals():
+    # Full pass over the log, when the running totals are not up-to-date
+    timelog.compute_totals()
+
+
+def report_hours():
+    # Same work as report_hours, for the last year and without sending it
+    now = datetime.now()
+    window = (now - timedelta(days=365), now)
+    report_count_hours.report_batch([window], send=False)
+
+
+BENCHMARKS = (
+    ("read_timelog", read_timelog),
+    ("read_timelog_cached", read_timelog_cached),
+    ("get_tasks", get_tasks),
+    ("period_summary", period_summary),
+    ("period_summary_cached", period_summary_cached),
+    ("show_summary", show_summary),
+    ("show_summary_cached", show_summary_cached),
+    ("compute_totals", compute_totals),
+    ("report_hours", report_hours),
+)
+
+
+def use_log(path):
+    """Points both scripts to the log file passed-in, without cache
+    """
+    timelog.LOG_FILE = path
+    timelog.USE_CACHE = False
+    timelog.reset_task_index()
+    timelog.reset_running_totals()
+    report_count_hours.FILE_IN = path
+
+
+def bench(func, repeat=REPEAT):
+    """Returns the best time of the function and the peak memory allocated by
+    it, measured on a separate run
+    """
+    best = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for num in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = best is None and elapsed or min(best, elapsed)
+
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes, names=None, repeat=REPEAT):
+    """Returns a list of results, one for each benchmark and size
+    """
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix="timelog-bench-")
+    for size in sizes:
+        path = os.path.join(tmp_dir, "timelog-{}.txt".format(size))
+        generate(path, lines=size)
+        use_log(path)
+        for name, func in BENCHMARKS:
+            if names and name not in names:
+                continue
+            seconds, peak = bench(func, repeat=repeat)
+            result = {
+                "name": name,
+                "lines": size,
+                "seconds": seconds,
+                "lines_per_second": size / seconds,
+                "peak_bytes": peak,
+            }
+            results.append(result)
+            print(format_result(result))
+            sys.stdout.flush()
+
+        for tmp_file in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, tmp_file))
+    os.rmdir(tmp_dir)
+    return results
+
+
+def format_result(result, previous=None):
+    output = "{} {:>8} lines: {:8.4f}s {:>14,.0f} lines/s {:8.1f} MB".format(
+        result["name"].ljust(24), result["lines"], result["seconds"],
+        result["lines_per_second"], result["peak_bytes"] / 1e6)
+    if previous:
+        output = "{} ({:.2f}x)".format(
+            output, previous["seconds"] / result["seconds"])
+    return output
+
+
+def compare(results, path):
+    """Displays the results next to the speedup against a previous run
+    """
+    with open(path) as reader:
+        previous = json.load(reader)["results"]
+    previous = dict([((r["name"], r["lines"]), r) for r in previous])
+    print("Compared with {}".format(path))
+    for result in results:
+        print(format_result(result, previous.get((result["name"],
+                                                  result["lines"]))))
+
+
+def to_names(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the benchmarks")
+    parser.add_argument("--sizes", type=to_names,
+                        default=[str(s) for s in SIZES],
+                        help="comma-separated number of lines of the logs")
+    parser.add_argument("--only", type=to_names, metavar="NAME,...",
+                        help="benchmarks to run: {}".format(
+                            ", ".join([b[0] for b in BENCHMARKS])))
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--output", help="file to store the results as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="JSON file of a previous run to compare with")
+    args = parser.parse_args(argv)
+
+    results = run([int(s) for s in args.sizes], names=args.only,
+                  repeat=args.repeat)
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.output:
+        with open(args.output, "w") as writer:
+            json.dump({
+                "date": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "results": results,
+            }, writer, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Generates synthetic timelog files that look like real ones: working days
+starting with an arrived** line, a few more arrived** lines after breaks,
+tasks of a weighted mix of projects, some of them non-billable (SEN, NAR
+and tasks starting with a dash)
+
+    python benchmarks/generate_log.py FILE [--lines N | --years N] [...]
+"""
+
+import argparse
+import random
+from datetime import datetime
+from datetime import timedelta
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+# Projects and their weight in the mix. SEN and NAR are non-billable
+PROJECT_MIX = (
+    ("ACME", 40),
+    ("FOO", 25),
+    ("BAR", 15),
+    ("SEN", 10),
+    ("NAR", 10),
+)
+
+TASKS = (
+    "code review",
+    "meeting",
+    "deploy",
+    "fix bug",
+    "support",
+    "planning",
+    "emails",
+    "docs",
+)
+
+ENTRIES_PER_DAY = 10
+
+# Ratio of tasks starting with a dash (non-billable) and of tasks followed
+# by a break, that is an arrived** line
+DASH_RATE = 0.1
+BREAK_RATE = 0.05
+
+# Ratio of weekend days with some work done
+WEEKEND_RATE = 0.05
+
+# Minutes of a working day
+DAY_MINUTES = 9 * 60
+
+
+def generate(path, lines=None, years=1, entries_per_day=ENTRIES_PER_DAY,
+             projects=PROJECT_MIX, seed=0, end=None):
+    """Writes a log with the number of non-blank lines passed-in, or with the
+    number of years passed-in, ending on the end date (today by default).
+    Returns the number of non-blank lines written
+    """
+    end = end or datetime.now()
+    end = datetime(end.year, end.month, end.day)
+    start = end - timedelta(days=int(years * 365.25) - 1)
+
+    # Days are built backwards from the end, until there are enough lines
+    days = []
+    total = 0
+    day = end
+    while (lines and total < lines) or (not lines and day >= start):
+        day_lines = get_day_lines(day, entries_per_day, projects, seed)
+        days.append(day_lines)
+        total += len(day_lines)
+        day -= timedelta(days=1)
+
+    if lines and total > lines:
+        days[-1] = days[-1][total - lines:]
+        total = lines
+
+    with open(path, "w") as writer:
+        for day_lines in reversed(days):
+            if not day_lines:
+                continue
+            if day_lines[0].endswith("**"):
+                writer.write("\n")
+            writer.write("\n".join(day_lines))
+            writer.write("\n")
+    return total
+
+
+def get_day_lines(day, entries_per_day, projects, seed=0):
+    """Returns the lines of a single day, the same ones for the same seed
+    """
+    rand = random.Random(seed * 1000003 + day.toordinal())
+    if day.weekday() >= 5 and rand.random() >= WEEKEND_RATE:
+        return []
+
+    names = [p[0] for p in projects]
+    weights = [p[1] for p in projects]
+    num_entries = rand.randint(max(entries_per_day // 2, 1),
+                               max(entries_per_day * 3 // 2, 1))
+    step = max(DAY_MINUTES // num_entries, 1)
+
+    minutes = 8 * 60 + rand.randint(0, 90)
+    output = [format_line(day, minutes, "arrived**")]
+    for num in range(num_entries):
+        minutes = min(minutes + rand.randint(1, step * 2), 24 * 60 - 1)
+        task = "{} {}".format(rand.choice(TASKS), rand.randint(1, 200))
+        if rand.random() < DASH_RATE:
+            task = "-{}".format(task)
+        project = rand.choices(names, weights)[0]
+        output.append(format_line(day, minutes, "{}: {}".format(project,
+                                                               task)))
+        if rand.random() < BREAK_RATE and num < num_entries - 1:
+            minutes = min(minutes + rand.randint(15, 60), 24 * 60 - 1)
+            output.append(format_line(day, minutes, "arrived**"))
+    return output
+
+
+def format_line(day, minutes, task):
+    task_date = day + timedelta(minutes=minutes)
+    return "{}: {}".format(task_date.strftime(DATE_FORMAT), task)
+
+
+def to_mix(value):
+    """Returns the project mix of a PROJ:WEIGHT,PROJ:WEIGHT string
+    """
+    mix = []
+    for item in value.split(","):
+        name, sep, weight = item.partition(":")
+        mix.append((name.strip(), sep and float(weight) or 1))
+    return tuple(mix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generates a synthetic timelog file")
+    parser.add_argument("path", help="file to write")
+    parser.add_argument("--lines", type=int,
+                        help="number of non-blank lines, overrides --years")
+    parser.add_argument("--years", type=float, default=1,
+                        help="number of years of entries")
+    parser.add_argument("--entries-per-day", type=int,
+                        default=ENTRIES_PER_DAY,
+                        help="average number of tasks per working day")
+    parser.add_argument("--projects", type=to_mix, default=PROJECT_MIX,
+                        metavar="PROJ:WEIGHT,...", help="mix of projects")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    total = generate(args.path, lines=args.lines, years=args.years,
+                     entries_per_day=args.entries_per_day,
+                     projects=args.projects, seed=args.seed)
+    print("{} lines written to {}".format(total, args.path))
+
+
+if __name__ == "__main__":
+    main()
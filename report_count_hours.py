@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import contextlib
+import glob
+import importlib.util
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 from datetime import datetime
 from datetime import timedelta
-import smtplib
 from functools import cmp_to_key
 
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from timelog_parse import to_minutes
+from timelog_pipeline import TASK_START
+from timelog_pipeline import get_detail
+from timelog_pipeline import get_project
+from timelog_pipeline import only_tasks
+from timelog_pipeline import only_worked
+from timelog_pipeline import pair
+from timelog_pipeline import read_range
+from timelog_pipeline import read_store
+from timelog_pipeline import to_entries
 
 smtp_port = 25
 smtp_server = "mail.example.com"
@@ -17,8 +32,29 @@ recipients = [
     "me@example.com",
 ]
 
+# Connections kept open (and reports sent at once), retries on transient
+# failures and seconds to wait before the first retry, doubled on each one
+SMTP_CONNECTIONS = 2
+SMTP_RETRIES = 3
+SMTP_BACKOFF = 1.0
+SMTP_TIMEOUT = 30
+
 FILE_IN = "/home/jordi/.timelog/timelog.txt"
 
+# SQLite database to read the tasks from instead of FILE_IN, filled with
+# timelog_db.py import
+DATABASE = None
+
+# Processes used to aggregate the files of a team, by default one per core
+TEAM_WORKERS = None
+
+# Timelog files of a team directory
+TEAM_FILES = "*.txt"
+
+# Files kept next to a timelog file that are not timelog files: archived
+# segments, their manifest and the database. The sidecars are hidden files
+NOT_TEAM_FILES = (".gz", ".manifest.json", ".db")
+
 LINE_WIDTH = 80
 
 # Month to report (YESTERDAY, CURRENT, PREVIOUS, LASTWEEK)
@@ -26,6 +62,14 @@ REPORT_MONTH = "PREVIOUS"
 
 SINCE = None # datetime(2025,9,1)
 
+# Backend used to aggregate the hours (auto, numpy, python). With auto,
+# NumPy is used when installed
+BACKEND = "auto"
+
+# How the log file is read (seek, mmap). With seek, the start of the period
+# is bisected in the file. With mmap, the whole file is scanned as bytes
+SCANNER = "seek"
+
 
 def get_since():
     """Returns the since date
@@ -56,83 +100,396 @@ def get_since():
 
 
 def get_until():
-    since = get_since()
+    return get_month_end(get_since())
+
+
+def get_month_end(since):
+    """Returns the last second of the month of the date passed-in
+    """
     tmp = datetime(since.year, since.month, 1)
     tmp = tmp + timedelta(days=32)
     tmp = datetime(tmp.year, tmp.month, 1)
     return tmp - timedelta(seconds=1)
 
 
-def report_hours():
-    start_from = None
-    report = {}
-    with open(FILE_IN, 'r') as reader:
-        for line in reader:
-            if not line:
-                continue
-
-            line = line.strip()
-            if not is_task(line):
-                continue
-
-            if not start_from:
-                start_from = get_datetime(line)
-
-            project = get_project(line)
-            if project:
-                task_dt = get_datetime(line)
-                seconds = get_diff_seconds(start_from, task_dt)
-                if seconds > 0:
-                    base_info = get_project_base_info()
-                    proj_info = report.get(project, base_info)
-
-                    # Task hours
-                    task_detail = get_task_detail(line)
-                    task_seconds = proj_info.get("tasks").get(task_detail, 0)
-                    proj_info["tasks"].update({
-                        task_detail: task_seconds + seconds,
-                    })
-
-                    # Accumulated hours
-                    acumm = proj_info.get("seconds", 0)
-                    proj_info.update({
-                        "seconds": acumm + seconds,
-                    })
-                    report.update({project: proj_info})
-
-                    hs = "{:.2f}".format(float(seconds/60/60))
-                    print("{}: {}".format(line, hs))
-
-            start_from = get_datetime(line)
+def get_month_windows(year):
+    """Returns a list of (since, until) tuples, one for each month of the year
+    """
+    windows = []
+    for month in range(1, 13):
+        since = datetime(year, month, 1)
+        windows.append((since, get_month_end(since)))
+    return windows
 
+
+def get_week_windows(year):
+    """Returns a list of (since, until) tuples, one for each ISO week of the
+    year, from monday to sunday
+    """
+    windows = []
+    monday = date.fromisocalendar(year, 1, 1)
+    while monday.isocalendar()[0] == year:
+        since = datetime(monday.year, monday.month, monday.day)
+        windows.append((since, since + timedelta(days=7, seconds=-1)))
+        monday += timedelta(days=7)
+    return windows
+
+
+def get_range_window(since, until):
+    """Returns a (since, until) tuple for the days passed-in, both included
+    """
+    since = datetime(since.year, since.month, since.day)
+    until = datetime(until.year, until.month, until.day)
+    return since, until + timedelta(days=1, seconds=-1)
+
+
+def report_hours(store=None):
+    """Reports the hours of the period from the log file, or from the
+    EntryStore passed-in
+    """
+    since = get_since()
+    until = get_until()
+    report = aggregate_hours(get_report_lines(store, since, until))
     if report:
-        send_report(report)
+        send_report(report, since, until)
 
 
-def get_project_base_info():
-    return {
-        "seconds": 0,
-        "tasks": {}
-    }
+def report_batch(windows, store=None, send=True):
+    """Builds the reports for all the (since, until) windows passed-in with a
+    single pass over the log. Returns a list of (window, report) tuples
+    """
+    since = min([w[0] for w in windows])
+    until = max([w[1] for w in windows])
+    entries = get_report_lines(store, since, until)
+    output = []
+    for window, window_entries in zip(windows, route(windows, entries)):
+        report = aggregate_hours(window_entries)
+        output.append((window, report))
+        if report and not send:
+            print(format_report(report, *window))
+
+    if send:
+        send_reports([(r[1], r[0][0], r[0][1]) for r in output if r[1]])
+    return output
+
+
+def report_team(pattern, windows, send=True, workers=None):
+    """Builds the reports for all the (since, until) windows passed-in from
+    the timelog files of a team, in a directory or matching a glob pattern.
+    Every file is aggregated in its own process. Returns a list of (window,
+    report, people) tuples, with the combined report and a dict with the
+    report of each person
+    """
+    log_files = get_team_files(pattern)
+    if not log_files:
+        raise ValueError("No timelog files found in {}".format(pattern))
+
+    workers = workers or TEAM_WORKERS or os.cpu_count() or 1
+    workers = min(workers, len(log_files))
+    tasks = [(log_file, windows) for log_file in log_files]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(report_file, tasks))
+    else:
+        results = [report_file(task) for task in tasks]
 
+    output = []
+    for pos, window in enumerate(windows):
+        people = {}
+        for log_file, reports in zip(log_files, results):
+            if reports[pos]:
+                person = get_person(log_file)
+                people[person] = merge_reports([people.get(person, {}),
+                                                reports[pos]])
+        report = merge_reports(people.values())
+        output.append((window, report, people))
+        if report and not send:
+            print(format_report(report, *window))
+            print(format_people(people))
+
+    if send:
+        send_reports([(r[1], r[0][0], r[0][1], r[2])
+                      for r in output if r[1]])
+    return output
+
+
+def report_file(task):
+    """Returns the list of reports of a (log_file, windows) tuple, one for
+    each window. Runs in the worker processes of report_team
+    """
+    log_file, windows = task
+    since = min([w[0] for w in windows])
+    until = max([w[1] for w in windows])
+
+    # The hours of every single task are not printed for a whole team
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            entries = get_report_lines(None, since, until, log_file)
+            return [aggregate_hours(window_entries)
+                    for window_entries in route(windows, entries)]
+
+
+def get_team_files(pattern):
+    """Returns the sorted list of timelog files in the directory passed-in
+    (the *.txt files), or matching the glob pattern. Hidden files, archived
+    segments, their manifest and databases are skipped
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, TEAM_FILES)
+    return sorted([path for path in glob.glob(pattern)
+                   if is_team_file(path)])
 
-def get_diff_seconds(start_date, end_date):
-    diff = (end_date - start_date)
-    return diff.total_seconds()
 
+def is_team_file(path):
+    name = os.path.basename(path)
+    return (os.path.isfile(path) and not name.startswith(".")
+            and not name.endswith(NOT_TEAM_FILES))
 
-def get_diff_hours(start_date, end_date):
-    diff = end_date - start_date
 
-    days, seconds = diff.days, diff.seconds
-    hours = days * 24 + seconds // 3600
-    minutes = (seconds % 3600) // 60
-    return hours + (minutes/60)
+def get_person(log_file):
+    """Returns the name of the person of a timelog file: the name of the
+    file, or the name of the home directory for ~/.timelog/timelog.txt
+    """
+    path, name = os.path.split(os.path.abspath(log_file))
+    if name != "timelog.txt":
+        return os.path.splitext(name)[0]
+    if os.path.basename(path) == ".timelog":
+        path = os.path.dirname(path)
+    return os.path.basename(path)
 
 
-def format_report(report):
-    since = get_since()
-    until = get_until()
+def merge_reports(reports):
+    """Returns a report with the hours of all the reports passed-in added
+    """
+    merged = {}
+    for report in reports:
+        for project, proj_info in report.items():
+            merged_info = merged.get(project)
+            if merged_info is None:
+                merged_info = get_project_base_info()
+                merged[project] = merged_info
+            merged_info["seconds"] += proj_info["seconds"]
+            for name in ("tasks", "days", "weeks"):
+                for key, seconds in proj_info[name].items():
+                    add_seconds(merged_info[name], key, seconds)
+    return merged
+
+
+def route(windows, entries):
+    """Returns a list with the entries of each window. Bounds are sorted
+    beforehand, so each entry is routed to its windows by bisection
+    """
+    order = sorted(range(len(windows)), key=lambda idx: windows[idx])
+    sinces = [windows[idx][0] for idx in order]
+    untils = [windows[idx][1] for idx in order]
+
+    # With no overlaps, an entry belongs at most to the last window started
+    disjoint = all([untils[idx] < sinces[idx + 1]
+                    for idx in range(len(order) - 1)])
+
+    buckets = [[] for window in windows]
+    for entry in entries:
+        task_dt = entry.date
+        last = bisect_right(sinces, task_dt)
+        first = disjoint and max(last - 1, 0) or 0
+        for pos in range(first, last):
+            if task_dt <= untils[pos]:
+                buckets[order[pos]].append(entry)
+    return buckets
+
+
+def aggregate_hours(entries):
+    """Returns the report from the entries, with the backend configured
+    """
+    if use_numpy():
+        return aggregate_numpy(entries)
+    return aggregate(entries)
+
+
+def use_numpy():
+    """Returns whether the hours have to be aggregated with NumPy
+    """
+    if BACKEND == "python":
+        return False
+    # Only imported once used, it takes longer than the whole report
+    return importlib.util.find_spec("numpy") is not None
+
+
+def aggregate(entries):
+    """Returns the report with the seconds per project, task, day and week
+    from the entries passed-in
+    """
+    report = {}
+    for interval in only_worked(pair(entries)):
+        project = interval.project
+        seconds = interval.seconds
+        proj_info = report.get(project)
+        if proj_info is None:
+            proj_info = get_project_base_info()
+            report[project] = proj_info
+
+        # Task hours
+        add_seconds(proj_info["tasks"], interval.detail, seconds)
+
+        # Day and week hours
+        task_day = interval.date.date()
+        add_seconds(proj_info["days"], task_day, seconds)
+        add_seconds(proj_info["weeks"], get_week(task_day), seconds)
+
+        # Accumulated hours
+        proj_info["seconds"] += seconds
+
+        hs = "{:.2f}".format(float(seconds/60/60))
+        print("{}: {}".format(interval.line, hs))
+
+    return report
+
+
+def aggregate_numpy(entries):
+    """Returns the same report as aggregate, but computing the durations and
+    the totals per project, task, day and week with NumPy arrays at once
+    """
+    import numpy
+    minutes = []
+    lines = []
+    task_keys = []
+    keys = {}
+    key_projects = []
+    key_details = []
+    for entry in entries:
+        line = entry.line
+        minutes.append(to_minutes(entry.date))
+        lines.append(line)
+
+        # Project and task detail only depend on the text after the date
+        task = line[TASK_START:]
+        key = keys.get(task)
+        if key is None:
+            key = len(key_projects)
+            keys[task] = key
+            key_projects.append(get_project(line))
+            key_details.append(get_detail(line))
+        task_keys.append(key)
+
+    if not minutes:
+        return {}
+
+    # Intern the projects and the (project, task detail) pairs
+    project_names = sorted(set([p for p in key_projects if p]))
+    project_ids = dict([(p[1], p[0]) for p in enumerate(project_names)])
+    pairs = {}
+    key_project_ids = []
+    key_pair_ids = []
+    for project, detail in zip(key_projects, key_details):
+        key_project_ids.append(project_ids.get(project, -1))
+        key_pair_ids.append(pairs.setdefault((project, detail), len(pairs)))
+
+    minutes = numpy.array(minutes, dtype=numpy.int64)
+    task_keys = numpy.array(task_keys, dtype=numpy.int64)
+    seconds = numpy.diff(minutes, prepend=minutes[:1]) * 60
+    entry_projects = numpy.array(key_project_ids, dtype=numpy.int64)[task_keys]
+    entry_pairs = numpy.array(key_pair_ids, dtype=numpy.int64)[task_keys]
+    selected = (seconds > 0) & (entry_projects >= 0)
+
+    seconds = seconds[selected].astype(numpy.float64)
+    entry_projects = entry_projects[selected]
+    entry_pairs = entry_pairs[selected]
+    days = minutes[selected] // 1440
+    weeks = days - (days - 1) % 7
+
+    report = {}
+    project_totals = numpy.bincount(entry_projects, weights=seconds,
+                                    minlength=len(project_names))
+    for project_id in numpy.flatnonzero(project_totals):
+        proj_info = get_project_base_info()
+        proj_info["seconds"] = float(project_totals[project_id])
+        report[project_names[project_id]] = proj_info
+
+    pair_totals = numpy.bincount(entry_pairs, weights=seconds,
+                                 minlength=len(pairs))
+    for (project, detail), pair_id in pairs.items():
+        if pair_totals[pair_id]:
+            tasks = report[project]["tasks"]
+            tasks[detail] = float(pair_totals[pair_id])
+
+    for name, values, to_key in (("days", days, date.fromordinal),
+                                 ("weeks", weeks, date.fromordinal)):
+        for project_id, value, total in group_sum(entry_projects, values,
+                                                  seconds):
+            project = project_names[project_id]
+            report[project][name][to_key(int(value))] = float(total)
+
+    for idx in numpy.flatnonzero(selected):
+        hs = "{:.2f}".format(float(minutes[idx] - minutes[idx - 1]) / 60)
+        print("{}: {}".format(lines[idx], hs))
+
+    return report
+
+
+def group_sum(groups, values, weights):
+    """Returns a list of (group, value, sum of weights) for each distinct
+    pair of group and value
+    """
+    import numpy
+    offset = values.min()
+    width = int(values.max() - offset) + 1
+    totals = numpy.bincount(groups * width + (values - offset),
+                            weights=weights)
+    output = []
+    for idx in numpy.flatnonzero(totals):
+        group, value = divmod(int(idx), width)
+        output.append((group, value + offset, totals[idx]))
+    return output
+
+
+def add_seconds(totals, key, seconds):
+    totals[key] = totals.get(key, 0) + seconds
+
+
+def get_week(day):
+    """Returns the date of the monday of the week of the day passed-in
+    """
+    return day - timedelta(days=day.weekday())
+
+
+def get_report_lines(store=None, since=None, until=None, log_file=None):
+    """Yields the entries of the tasks between since and until, by default
+    the period to report
+    """
+    since = since or get_since()
+    until = until or get_until()
+    if store is None and log_file is None and DATABASE:
+        from timelog_db import LogDatabase
+        # Query the date range on the index of the database
+        with LogDatabase(DATABASE) as database:
+            yield from only_tasks(to_entries(database.read_range(since,
+                                                                 until)))
+        return
+
+    if store is None:
+        # Seek to the first line since the date, instead of reading them all,
+        # or scan the memory-mapped file skipping the lines out of the period.
+        # Older years might be archived in segments, read before the log
+        entries = read_range(log_file or FILE_IN, since, until,
+                             scanner=SCANNER)
+    else:
+        # Compare the dates of the entries as minutes, without building them
+        entries = read_store(store, since, until)
+    yield from only_tasks(entries)
+
+
+def get_project_base_info():
+    return {
+        "seconds": 0,
+        "tasks": {},
+        "days": {},
+        "weeks": {},
+    }
+
+
+def format_report(report, since=None, until=None):
+    since = since or get_since()
+    until = until or get_until()
     month_str = since.strftime("%y-%m (%B %Y)")
     since_str = since.strftime("%Y-%m-%d %H:%M:%S")
     until_str = until.strftime("%Y-%m-%d %H:%M:%S")
@@ -194,84 +551,153 @@ def format_report(report):
     return "\n".join(report_out)
 
 
-def send_report(report):
-    since = get_since()
-    month_str = since.strftime("%y-%m (%B %Y)")
-    text = format_report(report)
-    subject = "Detall mensual d'hores {}".format(month_str)
-
-    # Try to log in to server and send email
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.login(sender_email, sender_pass)  # user & password
-        message = MIMEMultipart("related")
-        message["Subject"] = subject
-        message["From"] = sender_email
-        message["To"] = ",".join(recipients)
-        #message.preamble = 'This is a multi-part MIME message.'
-        message.attach(MIMEText(text, 'plain'))
-        # The msg['To'] needs to be a string
-        # While recipients in sendmail needs to be a list
-        server.sendmail(sender_email, recipients,  message.as_string())
-    except Exception as e:
-        # Print any error messages to stdout
-        print(e)
-    finally:
-        server.quit()
-
-
-def is_task(line):
-    if not line:
-        return False
-    line = line.strip()
-    if not line:
-        return False
-    if len(line) < 19:
-        return False
-
-    task_dt = get_datetime(line)
-    if not task_dt:
-        return False
-
-    if task_dt < get_since():
-        return False
-
-    if task_dt > get_until():
-        return False
-
-    return True
+def format_people(people):
+    """Returns the hours of each project of every person, as text
+    """
+    output = ["Detall per persona", ""]
+    for person in sorted(people):
+        report = people[person]
+        total_seconds = 0
+        output.append(person)
+        for project in sorted(report):
+            seconds = report[project]["seconds"]
+            hours = "{:.2f}".format(float(seconds) / 60.0 / 60.0)
+            project_out = "  {}".format(project)[:LINE_WIDTH]
+            project_out = project_out.ljust(LINE_WIDTH, ".")
+            output.append("{} {}".format(project_out, hours))
+            total_seconds += seconds
+
+        total_hours = "{:.2f}".format(float(total_seconds) / 60.0 / 60.0)
+        output.append("{} {}".format("TOTAL".rjust(LINE_WIDTH), total_hours))
+        output.append("")
+    return "\n".join(output)
 
 
-def is_start(line):
-    if not line or len(line) < 19:
-        return False
-    return line[18:].endswith("*")
+def send_report(report, since=None, until=None):
+    since = since or get_since()
+    until = until or get_until()
+    return send_reports([(report, since, until)])
 
 
-def get_project(line):
-    line = line[18:].split(":")
-    if not line or len(line) < 2:
-        return None
-    project = line[0]
-    if project.endswith("*"):
-        return None
-    return project
+def send_reports(reports):
+    """Sends the (report, since, until) tuples passed-in, reusing the same
+    authenticated connections and sending them concurrently. Team reports
+    are (report, since, until, people) tuples
+    """
+    from timelog_mail import deliver
+    messages = [get_message(*report) for report in reports]
+    with get_smtp_pool() as pool:
+        deliveries = deliver(messages, pool, retries=SMTP_RETRIES,
+                             backoff=SMTP_BACKOFF)
+
+    # Print the outcome of each message to stdout
+    for delivery in deliveries:
+        subject = delivery.message["Subject"]
+        if delivery.ok:
+            print("{}: sent in {:.2f}s".format(subject, delivery.seconds))
+        else:
+            print("{}: {} ({} attempts)".format(subject, delivery.error,
+                                                delivery.attempts))
+    return deliveries
+
+
+def get_smtp_pool():
+    from timelog_mail import SMTPPool
+    return SMTPPool(smtp_server, smtp_port, user=sender_email,
+                    password=sender_pass, size=SMTP_CONNECTIONS,
+                    timeout=SMTP_TIMEOUT)
+
+
+def get_message(report, since, until, people=None):
+    """Returns a tuple (sender, recipients, message) with the email of the
+    report for the period passed-in, plus the breakdown per person if given
+    """
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    month_str = since.strftime("%y-%m (%B %Y)")
+    text = format_report(report, since, until)
+    if people:
+        text = "{}\n{}".format(text, format_people(people))
+    subject = "Detall mensual d'hores {}".format(month_str)
 
+    message = MIMEMultipart("related")
+    message["Subject"] = subject
+    message["From"] = sender_email
+    message["To"] = ",".join(recipients)
+    #message.preamble = 'This is a multi-part MIME message.'
+    message.attach(MIMEText(text, 'plain'))
+    # The msg['To'] needs to be a string
+    # While recipients in sendmail needs to be a list
+    return sender_email, recipients, message
 
-def get_task_detail(line):
-    line = line[18:].split(":")
-    if not line or len(line) < 2:
-        return None
-    return "".join(line[1:]).strip()
 
+def get_windows(args):
+    """Returns the list of (since, until) windows requested in the command
+    line arguments
+    """
+    windows = []
+    for year in args.months:
+        windows.extend(get_month_windows(year))
+    for year in args.weeks:
+        windows.extend(get_week_windows(year))
+    if len(args.since) != len(args.until):
+        raise ValueError("Each --since requires its own --until")
+    for since, until in zip(args.since, args.until):
+        windows.append(get_range_window(since, until))
+    return windows
+
+
+def to_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reports the hours from the timelog file. Without "
+                    "arguments, reports the period set in REPORT_MONTH")
+    parser.add_argument("--months", type=int, action="append", default=[],
+                        metavar="YEAR", help="one report per month of YEAR")
+    parser.add_argument("--weeks", type=int, action="append", default=[],
+                        metavar="YEAR", help="one report per week of YEAR")
+    parser.add_argument("--since", type=to_date, action="append", default=[],
+                        metavar="YYYY-MM-DD", help="start of a report range")
+    parser.add_argument("--until", type=to_date, action="append", default=[],
+                        metavar="YYYY-MM-DD", help="end of a report range")
+    parser.add_argument("--print", dest="send", action="store_false",
+                        help="print the reports instead of sending them")
+    parser.add_argument("--db", metavar="DATABASE",
+                        help="read the tasks from the SQLite database "
+                             "instead of the timelog file")
+    parser.add_argument("--team", metavar="PATH",
+                        help="combined report of the timelog files in the "
+                             "directory or matching the glob PATH")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="processes used with --team, one per core by "
+                             "default")
+    args = parser.parse_args(argv)
 
-def get_datetime(line):
     try:
-        return datetime.strptime(line[:16], "%Y-%m-%d %H:%M")
-    except:
-        return None
+        windows = get_windows(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.db:
+        global DATABASE
+        DATABASE = args.db
+
+    if args.team:
+        windows = windows or [(get_since(), get_until())]
+        try:
+            report_team(args.team, windows, send=args.send,
+                        workers=args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+    elif windows:
+        report_batch(windows, send=args.send)
+    else:
+        report_hours()
 
 
 if __name__ == "__main__":
 
-    report_hours()
+    main()
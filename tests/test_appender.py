@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fcntl
+import os
+import threading
+import time
+
+import pytest
+
+import timelog_appender
+from timelog_appender import LogAppender
+from timelog_files import atomic_write
+
+FIRST = "2024-03-04 09:00: arrived**\n"
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "timelog.txt"
+    path.write_text(FIRST)
+    return str(path)
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """Returns a list where the descriptors synced are recorded
+    """
+    synced = []
+    monkeypatch.setattr(timelog_appender.os, "fsync", synced.append)
+    return synced
+
+
+def read(log_file):
+    with open(log_file) as reader:
+        return reader.read()
+
+
+def test_append_waits_for_lock(log_file):
+    with LogAppender(log_file) as appender:
+        with open(log_file, "ab") as other:
+            fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+            thread = threading.Thread(target=appender.append,
+                                      args=("2024-03-04 10:00: ACME: a\n", ))
+            thread.start()
+            thread.join(0.2)
+            assert thread.is_alive()
+            assert read(log_file) == FIRST
+
+            other.write(b"2024-03-04 09:30: ACME: other\n")
+            other.flush()
+            fcntl.flock(other.fileno(), fcntl.LOCK_UN)
+            thread.join(2)
+
+    # Records are never interleaved
+    assert read(log_file) == (FIRST + "2024-03-04 09:30: ACME: other\n"
+                              "2024-03-04 10:00: ACME: a\n")
+
+
+def test_records_of_other_sessions(log_file):
+    with LogAppender(log_file) as mine, LogAppender(log_file) as other:
+        assert mine.poll() == []
+        assert other.append("2024-03-04 10:00: ACME: a\n") == []
+        assert mine.append("2024-03-04 11:00: ACME: b\n") == [
+            "2024-03-04 10:00: ACME: a"]
+        assert other.poll() == ["2024-03-04 11:00: ACME: b"]
+        assert mine.poll() == []
+
+
+def test_line_being_written_read_once_complete(log_file):
+    with LogAppender(log_file) as appender:
+        with open(log_file, "a") as writer:
+            writer.write("2024-03-04 10:00: ACME: des")
+        assert appender.poll() == []
+        with open(log_file, "a") as writer:
+            writer.write("ign\n\n")
+        assert appender.read_new() == ["2024-03-04 10:00: ACME: design"]
+        assert appender.offset == os.path.getsize(log_file)
+
+
+def test_log_replaced_by_other_session(log_file):
+    with LogAppender(log_file) as appender:
+        appender.append("2024-03-04 10:00: ACME: a\n")
+        assert not appender.is_replaced()
+
+        # Edited and saved as a new file
+        atomic_write(log_file, FIRST.encode())
+        assert appender.is_replaced()
+        assert appender.poll() is None
+        assert not appender.is_replaced()
+        assert appender.poll() == []
+
+        atomic_write(log_file, b"")
+        assert appender.append("2024-03-04 11:00: ACME: b\n") is None
+        assert read(log_file) == "2024-03-04 11:00: ACME: b\n"
+
+        # Truncated in place
+        with open(log_file, "w"):
+            pass
+        assert appender.is_replaced()
+        assert appender.poll() is None
+
+
+def test_always_synced(log_file, fsyncs):
+    with LogAppender(log_file, sync="always") as appender:
+        appender.append("2024-03-04 10:00: ACME: a\n")
+        appender.append("2024-03-04 11:00: ACME: b\n")
+        assert len(fsyncs) == 2
+    assert len(fsyncs) == 2
+
+
+def test_batched_synced_every_batch(log_file, fsyncs):
+    with LogAppender(log_file) as appender:
+        for num in range(timelog_appender.SYNC_BATCH + 1):
+            appender.append("2024-03-04 10:{:02d}: ACME: a\n".format(num))
+        assert len(fsyncs) == 1
+        assert appender.pending == 1
+    # The last one on close
+    assert len(fsyncs) == 2
+
+
+def test_batched_synced_when_idle(log_file, fsyncs, monkeypatch):
+    monkeypatch.setattr(timelog_appender, "SYNC_INTERVAL", 0.2)
+    with LogAppender(log_file) as appender:
+        appender.append("2024-03-04 10:00: ACME: a\n")
+        assert fsyncs == []
+
+        # Nothing else is written, the timer syncs it
+        deadline = time.monotonic() + 2
+        while not fsyncs and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(fsyncs) == 1
+        assert appender.pending == 0
+
+
+def test_batched_synced_on_poll(log_file, fsyncs, monkeypatch):
+    monkeypatch.setattr(timelog_appender, "SYNC_INTERVAL", 0.1)
+    with LogAppender(log_file) as appender:
+        appender.append("2024-03-04 10:00: ACME: a\n")
+        appender.timer.cancel()
+        time.sleep(0.15)
+        assert fsyncs == []
+        appender.poll()
+        assert len(fsyncs) == 1
+
+
+def test_not_synced(log_file, fsyncs, monkeypatch):
+    monkeypatch.setattr(timelog_appender, "SYNC_INTERVAL", 0)
+    appender = LogAppender(log_file, sync="none")
+    appender.append("2024-03-04 10:00: ACME: a\n")
+    appender.poll()
+    assert fsyncs == []
+    appender.close()
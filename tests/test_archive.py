@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+
+import pytest
+
+import timelog_archive
+from timelog_archive import archive
+from timelog_archive import get_segment_file
+from timelog_archive import load_segments
+from timelog_archive import read_manifest
+from timelog_archive import split_years
+from timelog_pipeline import read_lines
+from timelog_pipeline import read_range
+
+LINES = [
+    "2022-11-02 09:00: arrived**",
+    "2022-11-02 10:00: ACME: design",
+    "",
+    "2023-03-04 09:00: arrived**",
+    "2023-03-04 10:00: ACME: code",
+    "2024-01-08 09:00: arrived**",
+    "2024-01-08 11:00: ACME: review",
+]
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "timelog.txt"
+    path.write_text("\n".join(LINES) + "\n")
+    return str(path)
+
+
+def get_lines(lines=LINES):
+    return [l for l in lines if l]
+
+
+def check_lines(log_file, lines=LINES):
+    """Checks that every reader finds each line once, in file order
+    """
+    assert list(read_lines(log_file)) == get_lines(lines)
+    assert [e.line for e in read_range(log_file)] == get_lines(lines)
+    archived = load_segments(log_file)
+    assert [l for d, l in archived] == get_lines(lines)[:len(archived)]
+
+
+def split(lines, before):
+    data = "\n".join(lines).encode() + b"\n"
+    years, cut = split_years(data, before)
+    return [(y, d.decode().split("\n")[:-1]) for y, d in years], cut
+
+
+def test_split_years():
+    years, cut = split(LINES, 2024)
+    assert years == [(2022, LINES[:3]), (2023, LINES[3:5])]
+    assert cut == len("\n".join(LINES[:5])) + 1
+
+
+def test_split_years_out_of_order():
+    lines = [
+        "2023-03-04 09:00: arrived**",
+        "2022-11-02 10:00: ACME: late",
+        "lunch",
+        "2023-03-05 10:00: ACME: code",
+        "2024-01-08 09:00: arrived**",
+        "2023-12-30 10:00: ACME: after the cut",
+    ]
+    years, cut = split(lines, 2024)
+    # Lines without date go with the line before, years are joined in file
+    # order and nothing after the first line of a year kept is archived
+    assert years == [(2022, lines[1:3]), (2023, [lines[0], lines[3]])]
+    assert cut == len("\n".join(lines[:4])) + 1
+
+
+def test_split_years_nothing_to_archive():
+    assert split(LINES[5:], 2024) == ([], 0)
+    assert split(LINES, 2022) == ([], 0)
+
+
+def test_archive(log_file):
+    assert archive(log_file, before=2024) == {2022: 2, 2023: 2}
+    with open(log_file) as reader:
+        assert reader.read() == "\n".join(LINES[5:]) + "\n"
+    segments = read_manifest(log_file)
+    assert [(s["year"], s["lines"], s["since"], s["until"])
+            for s in segments] == [
+        (2022, 2, "2022-11-02 09:00", "2022-11-02 10:00"),
+        (2023, 2, "2023-03-04 09:00", "2023-03-04 10:00"),
+    ]
+    for segment in segments:
+        segment_file = get_segment_file(log_file, segment["year"])
+        assert segment["size"] == os.path.getsize(segment_file)
+    check_lines(log_file)
+
+
+def test_archive_appends_to_segment(log_file):
+    archive(log_file, before=2024)
+    # Lines of an archived year added back to the log file
+    lines = ["2023-12-30 09:00: arrived**", "2023-12-30 10:00: FOO: late"]
+    with open(log_file) as reader:
+        data = reader.read()
+    with open(log_file, "w") as writer:
+        writer.write("\n".join(lines) + "\n" + data)
+
+    assert archive(log_file, before=2024) == {2023: 2}
+    segment = read_manifest(log_file)[1]
+    assert segment["lines"] == 4
+    assert segment["until"] == "2023-12-30 10:00"
+    segment_file = get_segment_file(log_file, 2023)
+    with gzip.open(segment_file) as reader:
+        assert reader.read().decode().split("\n")[:-1] == LINES[3:5] + lines
+    check_lines(log_file, LINES[:5] + lines + LINES[5:])
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt(monkeypatch, name, calls):
+    """Makes the function of timelog_archive fail on the calls passed-in,
+    counted from 1
+    """
+    function = getattr(timelog_archive, name)
+    count = [0]
+
+    def fail(*args, **kwargs):
+        count[0] += 1
+        if count[0] in calls:
+            raise Interrupted()
+        return function(*args, **kwargs)
+
+    monkeypatch.setattr(timelog_archive, name, fail)
+
+
+@pytest.mark.parametrize("name, calls", [
+    # Before the manifest: segments written, but not in the manifest
+    ("write_manifest", [1]),
+    # Before the log file is replaced: the new segments are pending
+    ("atomic_write", [1]),
+    # Before the manifest is cleaned up: the log file is already replaced
+    ("write_manifest", [2]),
+])
+def test_interrupted_archive(log_file, monkeypatch, name, calls):
+    archive(log_file, before=2023)
+    with monkeypatch.context() as patch:
+        interrupt(patch, name, calls)
+        with pytest.raises(Interrupted):
+            archive(log_file, before=2024)
+    check_lines(log_file)
+
+    # Run again, the lines are archived once
+    archive(log_file, before=2024)
+    assert [s["lines"] for s in read_manifest(log_file)] == [2, 2]
+    assert "pending" not in timelog_archive.load_manifest(log_file)
+    check_lines(log_file)
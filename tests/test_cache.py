@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import timelog_cache
+from timelog_cache import load_entries
+from timelog_cache import read_log_entries
+
+LINES = [
+    "2024-03-04 09:00: arrived**",
+    "2024-03-04 10:00: ACME: design",
+    "2024-03-04 12:00: ACME: code",
+    "",
+    "2024-03-05 09:00: arrived**",
+    "2024-03-05 10:30: ACME: review",
+]
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "timelog.txt"
+    path.write_text("\n".join(LINES) + "\n")
+    return str(path)
+
+
+def append(log_file, text):
+    with open(log_file, "a") as writer:
+        writer.write(text)
+
+
+def count_parsed(monkeypatch):
+    """Returns a list where the bytes parsed by the cache are recorded
+    """
+    parsed = []
+    parse_entries = timelog_cache.parse_entries
+
+    def record(data, store=None):
+        parsed.append(data)
+        return parse_entries(data, store)
+
+    monkeypatch.setattr(timelog_cache, "parse_entries", record)
+    return parsed
+
+
+def check_entries(log_file):
+    assert list(load_entries(log_file)) == list(read_log_entries(log_file))
+
+
+def test_unchanged_log_not_parsed(log_file, monkeypatch):
+    check_entries(log_file)
+    parsed = count_parsed(monkeypatch)
+    check_entries(log_file)
+    # Only read_log_entries parsed the file
+    assert len(parsed) == 1
+
+
+def test_appended_lines_parsed_alone(log_file, monkeypatch):
+    check_entries(log_file)
+    parsed = count_parsed(monkeypatch)
+    append(log_file, "2024-03-05 12:00: ACME: deploy\n")
+    store = load_entries(log_file)
+    assert parsed == [b"2024-03-05 12:00: ACME: deploy\n"]
+    assert store[-1].line == "2024-03-05 12:00: ACME: deploy"
+    check_entries(log_file)
+
+
+def test_truncated_log(log_file):
+    check_entries(log_file)
+    with open(log_file, "w") as writer:
+        writer.write("\n".join(LINES[:2]) + "\n")
+    check_entries(log_file)
+    assert len(load_entries(log_file)) == 2
+
+
+def test_log_rewritten_with_same_size(log_file):
+    check_entries(log_file)
+    stat = os.stat(log_file)
+    with open(log_file, "r+") as writer:
+        writer.write(LINES[0].replace("09:00", "08:00"))
+    # Filesystems with a coarse mtime might keep the same one
+    os.utime(log_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert os.stat(log_file).st_size == stat.st_size
+    check_entries(log_file)
+    assert load_entries(log_file)[0].line == "2024-03-04 08:00: arrived**"
+
+
+def test_unterminated_last_line(log_file):
+    check_entries(log_file)
+    append(log_file, "2024-03-05 12:00: ACME: dep")
+    for run in range(2):
+        # Returned, also when the log did not change since last run
+        store = load_entries(log_file)
+        assert store[-1].line == "2024-03-05 12:00: ACME: dep"
+        assert len(store) == 6
+
+    append(log_file, "loy\n")
+    store = load_entries(log_file)
+    assert store[-1].line == "2024-03-05 12:00: ACME: deploy"
+    assert len(store) == 6
+    check_entries(log_file)
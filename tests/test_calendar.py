@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+from datetime import date
+
+import pytest
+
+import timelog
+from timelog_calendar import WorkCalendar
+from timelog_calendar import parse_holidays
+from timelog_render import Renderer
+
+
+@pytest.fixture
+def holidays_file(tmp_path, monkeypatch):
+    path = tmp_path / "holidays.txt"
+    monkeypatch.setattr(timelog, "HOLIDAYS_FILE", str(path))
+    monkeypatch.setattr(timelog, "work_calendar", None)
+    return path
+
+
+def test_count_skips_weekends_and_holidays():
+    calendar = WorkCalendar([date(2025, 1, 6)], [(12, 25)])
+    # Wednesday 1st to Sunday 12th, without the 6th
+    assert calendar.count(date(2025, 1, 1), date(2025, 1, 12)) == 7
+    assert not calendar.is_working(date(2026, 12, 25))
+    assert calendar.count_year(2025) == 261 - 2
+
+
+def test_parse_holidays():
+    holidays, yearly = parse_holidays("# comment\n2025-05-01 Labour\n\n"
+                                      "12-25 Christmas\n")
+    assert holidays == set([date(2025, 5, 1)])
+    assert yearly == set([(12, 25)])
+    with pytest.raises(ValueError):
+        parse_holidays("2025-13-01\n")
+
+
+def test_official_days_of_the_year(holidays_file):
+    # No holidays file, official days of FREE_OFFICIAL_DAYS_YEAR or default
+    assert timelog.get_working_days(2025) == 261 - 11 - 22
+    assert timelog.get_working_days(2026) == 261 - 12 - 22
+
+
+def test_official_days_from_holidays_file(holidays_file):
+    holidays_file.write_text("2025-01-06\n2025-12-25\n")
+    assert timelog.get_working_days(2025) == 261 - 2 - 22
+
+
+def test_invalid_holidays_file_warns_on_screen(holidays_file, monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(timelog, "screen", Renderer(stream))
+    holidays_file.write_text("not a date\n")
+    assert timelog.get_working_days(2026) == 261 - 12 - 22
+    assert "Could not read holidays file" in stream.getvalue()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+import pytest
+
+import timelog
+from timelog_db import LogDatabase
+from timelog_db import import_log
+
+# The late lines are older than the ones before them
+LINES = [
+    "2024-03-04 09:00: arrived**",
+    "2024-03-04 10:00: ACME: design",
+    "2024-03-04 12:00: ACME: code",
+    "2024-03-05 09:00: arrived**",
+    "2024-03-05 10:00: FOO: deploy",
+    "2024-03-04 11:00: ACME: late",
+    "2024-03-05 12:00: ACME: review",
+    "2024-03-06 09:00: arrived**",
+    "2024-03-06 10:30: BAR: meeting",
+]
+
+SINCES = [None, datetime(2024, 3, 4, 11, 30), datetime(2024, 3, 5),
+          datetime(2024, 3, 5, 10, 0, 30), datetime(2030, 1, 1)]
+
+
+@pytest.fixture
+def storages(tmp_path, monkeypatch):
+    log_file = tmp_path / "timelog.txt"
+    log_file.write_text("\n".join(LINES) + "\n")
+    path = str(tmp_path / "timelog.db")
+    import_log(str(log_file), path)
+    monkeypatch.setattr(timelog, "LOG_FILE", str(log_file))
+    monkeypatch.setattr(timelog, "DATABASE", path)
+    monkeypatch.setattr(timelog, "database", None)
+    yield path
+    if timelog.database is not None:
+        timelog.database.close()
+
+
+def get_tasks(monkeypatch, storage, **kwargs):
+    monkeypatch.setattr(timelog, "STORAGE", storage)
+    return timelog.get_tasks(**kwargs)
+
+
+@pytest.mark.parametrize("since", SINCES)
+def test_tasks_since_same_as_text(storages, monkeypatch, since):
+    for purge in (False, True):
+        expected = get_tasks(monkeypatch, "text", since=since, purge=purge,
+                             limit=0)
+        assert get_tasks(monkeypatch, timelog.SQLITE, since=since,
+                         purge=purge, limit=0) == expected
+
+
+def test_read_reversed_stops_at_older_line(storages):
+    with LogDatabase(storages) as database:
+        assert list(database.read_reversed()) == LINES[::-1]
+        # The line of 12:00 is newer, but read after the late one
+        lines = database.read_reversed(since=datetime(2024, 3, 4, 11, 30))
+        assert list(lines) == LINES[:5:-1]
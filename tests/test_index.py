@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+import timelog
+from timelog_index import LiveSearch
+from timelog_index import TaskIndex
+
+PROJECTS = ["ACME", "FOO", "BAR", "Acme Labs"]
+WORDS = ["design", "code review", "deploy", "Fix bug", "meeting", "docs",
+         "support ACME", "planning"]
+
+# Terms searched, with matches in the project, the detail or both, short
+# ones, different case and no matches
+TERMS = ["acme", "ACME: d", "des", "review", "me: c", "bug 1", "labs: de",
+         "e", "de", "xyz", "fix BUG 12", "support acme"]
+
+
+def get_lines(count=3000, seed=1):
+    """Returns a log with a few hundred distinct tasks, repeated in random
+    order, and breaks with start tasks
+    """
+    rand = random.Random(seed)
+    task_date = datetime(2024, 1, 1, 8, 0)
+    lines = []
+    for idx in range(count):
+        task_date += timedelta(minutes=rand.randint(5, 120))
+        if rand.random() < 0.05:
+            task = "arrived**"
+        else:
+            task = "{}: {} {}".format(rand.choice(PROJECTS),
+                                      rand.choice(WORDS), rand.randint(1, 20))
+        lines.append("{}: {}".format(task_date.strftime("%Y-%m-%d %H:%M"),
+                                     task))
+    return lines
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    path = tmp_path / "timelog.txt"
+    path.write_text("\n".join(get_lines()) + "\n")
+    monkeypatch.setattr(timelog, "LOG_FILE", str(path))
+    monkeypatch.setattr(timelog, "STORAGE", "text")
+    monkeypatch.setattr(timelog, "appender", None)
+    monkeypatch.setattr(timelog, "task_index", None)
+    yield path
+    if timelog.appender is not None:
+        timelog.appender.close()
+
+
+@pytest.mark.parametrize("limit", [10, 3, 0])
+def test_index_matches_full_scan(log_file, limit):
+    for term in TERMS:
+        expected = timelog.get_tasks(term=term, limit=limit, purge=True)
+        assert timelog.find_tasks(term, limit=limit) == expected, term
+
+
+def test_index_follows_new_tasks(log_file):
+    timelog.find_tasks("acme")
+    timelog.write("ACME: design 3")
+    timelog.write("ACME: brand new")
+    for term in TERMS + ["new"]:
+        expected = timelog.get_tasks(term=term, limit=10, purge=True)
+        assert timelog.find_tasks(term, limit=10) == expected, term
+
+
+def get_index():
+    index = TaskIndex()
+    for line in get_lines():
+        timelog.add_to_index(index, line)
+    return index
+
+
+def test_live_search_typing_and_backspace():
+    index = get_index()
+    live = LiveSearch(index)
+    typed = ["a", "ac", "acm", "acme", "acme:", "acme: d", "acme: de",
+             "acme: d", "acme:", "acm", "acme l", "acme la", "", "f", "fo",
+             "fix", "fi", "fix bug 1", "fix bug 1x", "fix bug 1"]
+    for term in typed:
+        for limit in (5, 0):
+            assert live.search(term, limit=limit) == index.search(
+                term, limit=limit), term
+
+
+def test_live_search_after_new_tasks():
+    index = get_index()
+    live = LiveSearch(index)
+    live.search("acme: d", limit=0)
+    index.add("ACME: design brand new", "2030-01-01 10:00: ACME: design "
+                                        "brand new")
+    # The term grows, but the new task is not in the previous matches
+    for term in ("acme: de", "acme: des"):
+        assert live.search(term, limit=3) == index.search(term, limit=3)
+    assert live.search("acme: des", limit=1) == [
+        "2030-01-01 10:00: ACME: design brand new"]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+import pytest
+
+from timelog_input import DELETE
+from timelog_input import DOWN
+from timelog_input import EOT
+from timelog_input import ESCAPE
+from timelog_input import HOME
+from timelog_input import KeyReader
+from timelog_input import LEFT
+from timelog_input import PASTE_END
+from timelog_input import PASTE_START
+from timelog_input import UP
+from timelog_input import is_paste
+from timelog_input import is_special
+from timelog_input import parse_keys
+
+
+@pytest.fixture
+def pipe():
+    read_fd, write_fd = os.pipe()
+    yield read_fd, write_fd
+    for fd in (read_fd, write_fd):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def test_typed_burst():
+    keys, rest = parse_keys("ACME: design\r")
+    assert keys == ["ACME: design", "\r"]
+    assert is_paste(keys[0])
+    assert rest == ""
+
+    # A single character is a key, control characters split the burst
+    keys = parse_keys("a\tb\x7fcd")[0]
+    assert keys == ["a", "\t", "b", "\x7f", "cd"]
+    assert [is_paste(k) for k in keys] == [False, False, False, False, True]
+
+
+def test_arrow_keys():
+    keys = parse_keys("\x1b[A\x1bOB\x1b[D\x1b[1~\x1b[3~x")[0]
+    assert keys == [UP, DOWN, LEFT, HOME, DELETE, "x"]
+
+    # Sequences without a name are kept whole
+    keys = parse_keys("\x1b[1;5C")[0]
+    assert keys == ["\x1b[1;5C"]
+    assert is_special(keys[0])
+
+
+def test_bracketed_paste():
+    keys, rest = parse_keys("a{}ACME:\tx\ny{}\r".format(PASTE_START,
+                                                       PASTE_END))
+    assert keys == ["a", "ACME:\tx\ny", "\r"]
+    assert is_paste(keys[1])
+
+    keys, rest = parse_keys("a{}ACME".format(PASTE_START))
+    assert keys == ["a"]
+    assert rest == PASTE_START + "ACME"
+
+
+def test_paste_split_across_reads(pipe):
+    read_fd, write_fd = pipe
+    reader = KeyReader(read_fd)
+    os.write(write_fd, "{}ACME: des".format(PASTE_START).encode())
+    assert reader.read_burst() == []
+    os.write(write_fd, "ign\n{}\r".format(PASTE_END).encode())
+    keys = reader.read_burst()
+    assert keys == ["ACME: design\n", "\r"]
+    assert is_paste(keys[0])
+
+
+def test_sequence_split_across_reads(pipe):
+    read_fd, write_fd = pipe
+    reader = KeyReader(read_fd, timeout=1)
+    os.write(write_fd, b"\x1b[")
+    timer = threading.Timer(0.05, os.write, args=(write_fd, b"A"))
+    timer.start()
+    assert reader.read_burst() == [UP]
+    timer.join()
+
+
+def test_lone_escape_after_timeout(pipe):
+    read_fd, write_fd = pipe
+    reader = KeyReader(read_fd, timeout=0.1)
+    os.write(write_fd, ESCAPE.encode())
+    start = time.monotonic()
+    assert reader.read_burst() == [ESCAPE]
+    assert time.monotonic() - start >= 0.1
+
+    os.write(write_fd, b"x")
+    assert reader.read_key() == "x"
+
+
+def test_end_of_input(pipe):
+    read_fd, write_fd = pipe
+    reader = KeyReader(read_fd)
+    os.write(write_fd, b"ab")
+    os.close(write_fd)
+    assert reader.read_key() == "ab"
+    assert reader.read_key() == EOT
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import smtplib
+import socket
+import socketserver
+import threading
+from email.mime.text import MIMEText
+
+import pytest
+
+from timelog_mail import SMTPPool
+from timelog_mail import deliver
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP session. The reply to each message comes from the
+    actions of the server: ok, a reply code, or drop to close the connection
+    """
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 fake")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().split(" ")[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250-fake")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command == "AUTH":
+                self.reply("235 ok")
+            elif command == "DATA":
+                self.reply("354 go")
+                if not self.read_message():
+                    return
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+    def reply(self, text):
+        self.wfile.write("{}\r\n".format(text).encode())
+
+    def read_message(self):
+        """Reads the message and replies to it. Returns whether the session
+        goes on
+        """
+        lines = []
+        for line in self.rfile:
+            line = line.decode().rstrip("\r\n")
+            if line == ".":
+                break
+            lines.append(line)
+        with self.server.lock:
+            action = self.server.actions and self.server.actions.pop(0)
+        if action == "drop":
+            return False
+        if action and action != "ok":
+            self.reply("{} refused".format(action))
+            return True
+        self.server.received.append("\n".join(lines))
+        self.reply("250 ok")
+        return True
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0),
+                                                 SMTPHandler)
+        self.lock = threading.Lock()
+        self.actions = []
+        self.received = []
+        self.connections = 0
+
+
+@pytest.fixture
+def server():
+    server = FakeSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05, ),
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_messages(count):
+    messages = []
+    for num in range(count):
+        message = MIMEText("Report {}".format(num))
+        message["Subject"] = "Report {}".format(num)
+        messages.append(("me@example.com", ["you@example.com"], message))
+    return messages
+
+
+def get_pool(server, size=1):
+    host, port = server.server_address
+    return SMTPPool(host, port, user="me", password="secret", size=size,
+                    timeout=5)
+
+
+def test_connections_reused(server):
+    with get_pool(server, size=2) as pool:
+        deliveries = deliver(get_messages(6), pool)
+    assert [d.ok for d in deliveries] == [True] * 6
+    assert len(server.received) == 6
+    assert server.connections <= 2
+
+
+def test_reconnect_after_server_drops_connection(server):
+    server.actions = ["ok", "drop"]
+    sleeps = []
+    with get_pool(server) as pool:
+        deliveries = deliver(get_messages(3), pool, sleep=sleeps.append,
+                             backoff=0.5)
+    assert [d.ok for d in deliveries] == [True] * 3
+    assert [d.attempts for d in deliveries] == [1, 2, 1]
+    assert sleeps == [0.5]
+    assert len(server.received) == 3
+    assert server.connections == 2
+
+
+def test_attempts_limited_when_connection_refused():
+    # A port nobody listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    sleeps = []
+    with SMTPPool("127.0.0.1", port, timeout=5) as pool:
+        deliveries = deliver(get_messages(1), pool, retries=3, backoff=1.0,
+                             sleep=sleeps.append)
+    assert not deliveries[0].ok
+    assert isinstance(deliveries[0].error, ConnectionRefusedError)
+    assert deliveries[0].attempts == 4
+    assert sleeps == [1.0, 2.0, 4.0]
+
+
+def test_transient_reply_retried_on_same_connection(server):
+    server.actions = ["451"]
+    sleeps = []
+    with get_pool(server) as pool:
+        deliveries = deliver(get_messages(1), pool, sleep=sleeps.append)
+    assert deliveries[0].ok
+    assert deliveries[0].attempts == 2
+    assert len(sleeps) == 1
+    assert server.connections == 1
+
+
+def test_permanent_reply_not_retried(server):
+    server.actions = ["550"]
+    sleeps = []
+    with get_pool(server) as pool:
+        deliveries = deliver(get_messages(2), pool, sleep=sleeps.append)
+    assert not deliveries[0].ok
+    assert isinstance(deliveries[0].error, smtplib.SMTPDataError)
+    assert deliveries[0].error.smtp_code == 550
+    assert deliveries[0].attempts == 1
+    assert sleeps == []
+    # The connection is still usable for the next message
+    assert deliveries[1].ok
+    assert server.connections == 1
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+import timelog
+from timelog_pipeline import by_project
+from timelog_pipeline import get_detail
+from timelog_pipeline import get_project
+from timelog_pipeline import get_task
+from timelog_pipeline import group_seconds
+from timelog_pipeline import pair
+from timelog_pipeline import parse
+from timelog_pipeline import skip_starts
+
+LINES = [
+    "2024-03-04 09:00: arrived**",
+    "2024-03-04 10:00: ACME: design",
+    "not a task",
+    "2024-03-04 12:00: FOO: deploy",
+    "2024-03-04 13:00: lunch**",
+    "2024-03-04 14:00: ACME: code",
+]
+
+
+def test_get_task():
+    assert get_task("2024-03-04 10:00: ACME: design") == "ACME: design"
+    assert get_task("  a note without date  ") == "a note without date"
+    assert get_task("2024-03-04 10:00:") == ""
+    assert timelog.get_task is get_task
+
+
+def test_project_and_detail():
+    assert get_project("2024-03-04 10:00: ACME: design: v2") == "ACME"
+    assert get_detail("2024-03-04 10:00: ACME: design: v2") == "design v2"
+    assert get_project("2024-03-04 10:00: lunch**") is None
+    assert get_detail("2024-03-04 10:00: lunch") is None
+
+
+def test_pair_and_group():
+    intervals = list(skip_starts(pair(parse(LINES))))
+    assert [i.task for i in intervals] == ["ACME: design", "FOO: deploy",
+                                           "ACME: code"]
+    assert [i.seconds for i in intervals] == [3600, 7200, 3600]
+    assert group_seconds(intervals, by_project) == {"ACME": 7200,
+                                                    "FOO": 7200}
+
+
+def test_pair_since():
+    since = datetime(2024, 3, 4, 11, 0)
+    intervals = list(pair(parse(LINES), since=since))
+    assert [i.seconds for i in intervals] == [3600, 3600, 3600]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import json
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+import timelog
+
+TASKS = ["ACME: design", "SEN: lunch", "ACME: code", "FOO: -meeting",
+         "FOO: deploy", "arrived**", "ACME: review"]
+
+
+def get_line(task_date, task):
+    return "{}: {}".format(task_date.strftime("%Y-%m-%d %H:%M"), task)
+
+
+def get_lines():
+    """Returns a sorted log with some tasks a day since three days ago, all
+    of them in the current year
+    """
+    now = datetime.now().replace(second=0, microsecond=0)
+    start = max(now - timedelta(days=3), datetime(now.year, 1, 1, 8, 0))
+    lines = [get_line(start, "arrived**")]
+    for idx in range(40):
+        task_date = start + timedelta(minutes=97 * (idx + 1))
+        lines.append(get_line(task_date, TASKS[idx % len(TASKS)]))
+    return lines
+
+
+def get_unsorted_lines():
+    """Returns the log with lines older than the ones before them
+    """
+    lines = get_lines()
+    first = timelog.parse_timestamp(lines[0])
+    lines.insert(30, get_line(first + timedelta(minutes=5), "ACME: late"))
+    lines.insert(10, get_line(first - timedelta(days=1), "ACME: old"))
+    lines.insert(5, lines[25].replace("ACME", "BAR"))
+    return lines
+
+
+@pytest.fixture(params=["sorted", "unsorted"])
+def log_file(request, tmp_path, monkeypatch):
+    lines = request.param == "sorted" and get_lines() or get_unsorted_lines()
+    path = tmp_path / "timelog.txt"
+    path.write_text("\n".join(lines) + "\n")
+    monkeypatch.setattr(timelog, "LOG_FILE", str(path))
+    monkeypatch.setattr(timelog, "STORAGE", "text")
+    monkeypatch.setattr(timelog, "appender", None)
+    monkeypatch.setattr(timelog, "running_totals", None)
+    yield path
+    if timelog.appender is not None:
+        timelog.appender.close()
+
+
+def run_query(capsys, *args):
+    assert timelog.query(list(args) + ["--format", "json"]) == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def get_totals(rows, column="seconds"):
+    return sum([row[column] for row in rows])
+
+
+@pytest.mark.parametrize("period", timelog.PERIODS)
+def test_query_matches_summary(log_file, capsys, period):
+    since = timelog.get_since_date(period).strftime("%Y-%m-%d")
+    total, billable = timelog.get_summary_totals()[period]
+
+    rows = run_query(capsys, "--since", since)
+    assert get_totals(rows) == total
+    assert all([row["seconds"] > 0 for row in rows])
+
+    for group_by in ("day", "week", "project", "task"):
+        rows = run_query(capsys, "--since", since, "--group-by", group_by)
+        assert get_totals(rows) == total
+        assert get_totals(rows, "billable_seconds") == billable
+        # Every group once, even when its lines are not together
+        groups = [row[group_by] for row in rows]
+        assert len(groups) == len(set(groups))
+
+
+def test_query_without_since_matches_year(log_file, capsys):
+    total, billable = timelog.get_summary_totals()[timelog.YEAR]
+    rows = run_query(capsys)
+    assert get_totals(rows) == total
+    assert all([row["seconds"] > 0 for row in rows])
+
+    for group_by in ("day", "week", "project"):
+        rows = run_query(capsys, "--group-by", group_by)
+        assert get_totals(rows) == total
+        assert get_totals(rows, "billable_seconds") == billable
+        groups = [row[group_by] for row in rows]
+        assert len(groups) == len(set(groups))
+
+
+def test_billable_formatted_the_same(log_file, capsys):
+    assert timelog.query(["--format", "csv"]) == 0
+    rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    assert set([row["billable"] for row in rows]) == set(["yes", "no"])
+
+    assert timelog.query([]) == 0
+    table = capsys.readouterr().out.split("\n")[1:-1]
+    start = sum([timelog.TABLE_WIDTHS[c] + 1
+                 for c in ("start", "end", "seconds", "time")])
+    billable = [line[start:start + 8].strip() for line in table]
+    assert billable == [row["billable"] for row in rows]
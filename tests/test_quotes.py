@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import http.server
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import timelog
+from timelog_quotes import QuoteFetcher
+from timelog_quotes import QuotePool
+from timelog_quotes import fetch_quote
+
+
+class QuoteHandler(http.server.BaseHTTPRequestHandler):
+    """Replies with a new quote, written a byte at a time every drip seconds
+    """
+
+    def do_GET(self):
+        self.server.requests += 1
+        body = json.dumps({
+            "content": "Quote {}".format(self.server.requests),
+            "author": "Author",
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not self.server.drip:
+            self.wfile.write(body)
+            return
+        for idx in range(len(body)):
+            time.sleep(self.server.drip)
+            self.wfile.write(body[idx:idx + 1])
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), QuoteHandler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.drip = 0
+    thread = threading.Thread(target=server.serve_forever, args=(0.05, ),
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server):
+    return "http://127.0.0.1:{}/random".format(server.server_address[1])
+
+
+def get_offline_url():
+    # A port nobody listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return "http://127.0.0.1:{}/random".format(sock.getsockname()[1])
+
+
+def test_fetch_quote(server):
+    quote = fetch_quote(get_url(server), timeout=2)
+    assert quote == {"content": "Quote 1", "author": "Author"}
+
+
+def test_fetch_quote_deadline(server):
+    # Every read is faster than the timeout, the whole body is not
+    server.drip = 0.05
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        fetch_quote(get_url(server), timeout=0.3)
+    assert time.monotonic() - start < 0.6
+
+
+def test_pool_evicts_least_recently_used(tmp_path):
+    pool = QuotePool(str(tmp_path / "quotes.json"), size=3, ttl=100)
+    for num in range(5):
+        pool.add({"content": str(num)}, now=10 + num)
+    assert sorted([q["content"] for q in pool.quotes]) == ["2", "3", "4"]
+
+    # Picked from the least recently used on
+    picked = [pool.pick(now=20 + num)["content"] for num in range(4)]
+    assert picked == ["2", "3", "4", "2"]
+
+    # "3" is now the least recently used one
+    pool.add({"content": "5"}, now=30)
+    assert sorted([q["content"] for q in pool.quotes]) == ["2", "4", "5"]
+
+
+def test_pool_expires_quotes(tmp_path):
+    pool = QuotePool(str(tmp_path / "quotes.json"), size=3, ttl=100)
+    pool.add({"content": "old"}, now=10)
+    pool.add({"content": "new"}, now=50)
+    assert pool.pick(now=120)["content"] == "new"
+    assert pool.pick(now=160) is None
+    assert len(pool) == 0
+
+
+def test_pool_stored(tmp_path):
+    path = str(tmp_path / "quotes.json")
+    pool = QuotePool(path)
+    pool.add({"content": "stored", "author": "Author"})
+    pool.save()
+    assert [q["content"] for q in QuotePool(path).quotes] == ["stored"]
+
+    with open(path, "w") as writer:
+        writer.write("not json")
+    assert len(QuotePool(path)) == 0
+
+
+def test_fetcher_adds_quote_to_pool(server, tmp_path):
+    path = str(tmp_path / "quotes.json")
+    fetcher = QuoteFetcher(QuotePool(path), url=get_url(server)).start()
+    assert fetcher.get(wait=2)["content"] == "Quote 1"
+    assert [q["content"] for q in QuotePool(path).quotes] == ["Quote 1"]
+
+
+def test_offline_quote_from_pool(tmp_path, monkeypatch):
+    pool = QuotePool(str(tmp_path / ".quotes.json"))
+    pool.add({"content": "Offline", "author": "Author"})
+    pool.save()
+    monkeypatch.setattr(timelog, "LOG_FILE", str(tmp_path / "timelog.txt"))
+    monkeypatch.setattr(timelog, "QUOTE_URL", get_offline_url())
+    monkeypatch.setattr(timelog, "quote_fetcher", None)
+
+    assert timelog.get_quote() == "Offline\n.. Author"
+    timelog.quote_fetcher.thread.join(2)
+    assert isinstance(timelog.quote_fetcher.error, Exception)
+    assert timelog.quote_fetcher.get()["content"] == "Offline"
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+from timelog_reader import get_line_date
+from timelog_reader import get_unsorted_ranges
+from timelog_reader import read_range
+from timelog_reader import scan_lines
+
+START = datetime(2024, 1, 1, 8, 0)
+
+# Ranges read, from the middle of the log to its end
+RANGES = [
+    (None, None),
+    (datetime(2024, 3, 1), None),
+    (datetime(2024, 3, 1), datetime(2024, 3, 31, 23, 59)),
+    (datetime(2024, 6, 10, 12, 30, 30), datetime(2024, 6, 20)),
+    (datetime(2030, 3, 1), datetime(2030, 3, 31, 23, 59)),
+    (None, datetime(2024, 2, 1)),
+    (datetime(2040, 1, 1), None),
+]
+
+
+def get_line(task_date, task):
+    return "{}: {}".format(task_date.strftime("%Y-%m-%d %H:%M"), task)
+
+
+def get_lines(count=8000):
+    """Returns a sorted log of count lines, two tasks a day, from 2024 to
+    2034
+    """
+    lines = []
+    for idx in range(count):
+        task_date = START + timedelta(hours=12 * idx)
+        if idx % 50 == 0:
+            lines.append("")
+            lines.append(get_line(task_date, "arrived**"))
+        else:
+            lines.append(get_line(task_date, "ACME: task {}".format(idx)))
+    return lines
+
+
+def write_log(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def read_all(log_file, since, until):
+    """Returns the lines in the range, parsing every line of the file
+    """
+    output = []
+    with open(log_file) as reader:
+        for line in reader:
+            line = line.strip()
+            task_date = get_line_date(line)
+            if task_date is None:
+                continue
+            if since is not None and task_date < since:
+                continue
+            if until is not None and task_date > until:
+                continue
+            output.append((task_date, line))
+    return output
+
+
+def check_ranges(log_file):
+    for since, until in RANGES:
+        expected = read_all(log_file, since, until)
+        assert list(read_range(log_file, since, until)) == expected
+        assert list(scan_lines(log_file, since, until)) == expected
+
+
+def test_sorted_log(tmp_path):
+    log_file = write_log(tmp_path / "timelog.txt", get_lines())
+    check_ranges(log_file)
+    # The whole file is sorted
+    with open(log_file, "rb") as reader:
+        assert get_unsorted_ranges(log_file) == [(len(reader.read()), None)]
+
+
+@pytest.mark.parametrize("position", [10, 2000, 5000, 7990])
+def test_lines_out_of_order_far_from_their_date(tmp_path, position):
+    lines = get_lines()
+    # Lines in the ranges written blocks away from where they belong, before
+    # or after it
+    lines.insert(position, get_line(datetime(2024, 3, 15, 9, 0), "BAR: a"))
+    lines.insert(position, get_line(datetime(2030, 3, 15, 9, 0), "BAR: b"))
+    lines.insert(position, get_line(datetime(2023, 6, 15, 9, 0), "BAR: c"))
+    log_file = write_log(tmp_path / "timelog.txt", lines)
+    check_ranges(log_file)
+
+
+def test_lines_appended_after_stored_sorted_part(tmp_path):
+    log_file = write_log(tmp_path / "timelog.txt", get_lines())
+    check_ranges(log_file)
+    checked = get_unsorted_ranges(log_file)[-1][0]
+
+    with open(log_file, "a") as writer:
+        writer.write(get_line(datetime(2040, 1, 1), "ACME: later") + "\n")
+    assert get_unsorted_ranges(log_file)[-1][0] > checked
+    check_ranges(log_file)
+
+    with open(log_file, "a") as writer:
+        writer.write(get_line(datetime(2024, 3, 2), "ACME: backfill") + "\n")
+        writer.write(get_line(datetime(2040, 1, 2), "ACME: unfinished"))
+    check_ranges(log_file)
+
+
+def test_log_edited_in_place(tmp_path):
+    lines = get_lines()
+    log_file = write_log(tmp_path / "timelog.txt", lines)
+    check_ranges(log_file)
+
+    lines[100] = get_line(datetime(2024, 6, 12, 9, 0), "BAR: moved")
+    lines[6000] = get_line(datetime(2030, 3, 3, 9, 0), "BAR: moved")
+    write_log(tmp_path / "timelog.txt", lines)
+    check_ranges(log_file)
+
+
+@pytest.mark.parametrize("moved", [datetime(2023, 6, 15, 9, 0),
+                                   datetime(2033, 6, 15, 9, 0)])
+def test_early_line_out_of_order(tmp_path, moved):
+    lines = get_lines()
+    # Older or much newer than the lines around it
+    lines.insert(20, get_line(moved, "BAR: moved"))
+    log_file = write_log(tmp_path / "timelog.txt", lines)
+    check_ranges(log_file)
+
+    # Only that line is read line by line, the rest is still bisected
+    line = "{}\n".format(lines[20]).encode()
+    with open(log_file, "rb") as reader:
+        data = reader.read()
+    start = data.index(line)
+    assert get_unsorted_ranges(log_file) == [
+        (start, start + len(line)), (len(data), None)]
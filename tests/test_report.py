@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+import report_count_hours
+from timelog_archive import archive
+from timelog_cache import load_entries
+from timelog_reader import get_unsorted_ranges
+
+ANNA = """
+2024-03-04 09:00: arrived**
+2024-03-04 10:00: ACME: design
+2024-03-04 12:00: ACME: code
+
+2025-03-04 09:00: arrived**
+2025-03-04 10:30: ACME: review
+"""
+
+BERNAT = """
+2025-03-05 09:00: arrived**
+2025-03-05 11:00: FOO: deploy
+"""
+
+# Sorted, except the late lines, with breaks, start tasks and lines without
+# date or project
+LOG = """
+2024-03-04 09:00: arrived**
+2024-03-04 10:00: ACME: design
+2024-03-04 10:45: SEN: lunch
+2024-03-04 12:00: ACME: code
+2024-03-04 11:30: ACME: late
+lunch
+2024-03-04 13:15: FOO: -meeting
+2024-03-04 17:20: bored
+2024-03-05 09:00: arrived**
+2024-03-05 12:10: FOO: deploy
+2024-03-11 09:00: arrived**
+2024-03-11 09:50: ACME: review
+2024-03-11 09:50: ACME: review again
+"""
+
+WINDOWS = [(datetime(2024, 1, 1), datetime(2025, 12, 31, 23, 59))]
+
+
+@pytest.fixture
+def team_dir(tmp_path):
+    (tmp_path / "anna.txt").write_text(ANNA)
+    (tmp_path / "bernat.txt").write_text(BERNAT)
+    anna = str(tmp_path / "anna.txt")
+
+    # 2024 archived into anna-2024.txt.gz and anna.manifest.json
+    assert archive(anna, before=2025) == {2024: 3}
+    # Sidecars of the cache and the unsorted ranges, and other files
+    load_entries(anna)
+    get_unsorted_ranges(anna)
+    (tmp_path / ".anna.txt.totals").write_text("{}")
+    (tmp_path / "team.db").write_bytes(b"SQLite format 3\x00")
+    return tmp_path
+
+
+def test_team_files_in_directory(team_dir):
+    names = [os.path.basename(path)
+             for path in report_count_hours.get_team_files(str(team_dir))]
+    assert names == ["anna.txt", "bernat.txt"]
+    assert sorted(os.listdir(str(team_dir))) == [
+        ".anna.txt.cache", ".anna.txt.sorted", ".anna.txt.totals",
+        "anna-2024.txt.gz", "anna.manifest.json", "anna.txt", "bernat.txt",
+        "team.db"]
+
+
+def test_team_files_matching_pattern(team_dir):
+    pattern = os.path.join(str(team_dir), "*")
+    names = [os.path.basename(path)
+             for path in report_count_hours.get_team_files(pattern)]
+    assert names == ["anna.txt", "bernat.txt"]
+
+
+def test_team_report_with_archived_segments(team_dir, capsys):
+    output = report_count_hours.report_team(str(team_dir), WINDOWS,
+                                            send=False, workers=1)
+    window, report, people = output[0]
+    assert sorted(people) == ["anna", "bernat"]
+    # The archived hours of 2024 are counted once
+    assert people["anna"]["ACME"]["seconds"] == 4.5 * 3600
+    assert report["FOO"]["seconds"] == 2 * 3600
+
+
+@pytest.mark.parametrize("since", [datetime(2024, 3, 1),
+                                   datetime(2024, 3, 4, 11)])
+def test_backends_same_report(tmp_path, capsys, monkeypatch, since):
+    log_file = tmp_path / "timelog.txt"
+    log_file.write_text(LOG)
+    until = since + timedelta(days=30)
+
+    def get_output(backend):
+        monkeypatch.setattr(report_count_hours, "BACKEND", backend)
+        entries = report_count_hours.get_report_lines(
+            since=since, until=until, log_file=str(log_file))
+        report = report_count_hours.aggregate_hours(entries)
+        output = report_count_hours.format_report(report, since, until)
+        return report, output, capsys.readouterr().out
+
+    report, output, printed = get_output("numpy")
+    assert get_output("python") == (report, output, printed)
+    assert report
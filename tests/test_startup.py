@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_imported(module, tmp_path):
+    """Returns the set of modules loaded by importing the module passed-in
+    in a new interpreter
+    """
+    code = "import sys, {}; print(' '.join(sys.modules))".format(module)
+    env = dict(os.environ, HOME=str(tmp_path))
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT,
+                                     env=env)
+    return set(output.decode().split())
+
+
+@pytest.mark.parametrize("module", ["timelog", "report_count_hours"])
+def test_optional_subsystems_not_imported(module, tmp_path):
+    imported = get_imported(module, tmp_path)
+    lazy = set(["gzip", "numpy", "sqlite3", "smtplib", "requests",
+                "timelog_archive",
+                "timelog_db", "timelog_input", "timelog_mail",
+                "timelog_quotes"])
+    assert not imported & lazy
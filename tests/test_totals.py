@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+import timelog
+
+
+def restart(monkeypatch, log_file):
+    """Drops the state kept in memory, as a new run of timelog would
+    """
+    if timelog.appender is not None:
+        timelog.appender.close()
+    monkeypatch.setattr(timelog, "LOG_FILE", str(log_file))
+    monkeypatch.setattr(timelog, "STORAGE", "text")
+    monkeypatch.setattr(timelog, "appender", None)
+    monkeypatch.setattr(timelog, "running_totals", None)
+    monkeypatch.setattr(timelog, "task_index", None)
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    path = tmp_path / "timelog.txt"
+    start = datetime.now().replace(second=0, microsecond=0)
+    start -= timedelta(days=2)
+    lines = ["{}: arrived**".format(start.strftime("%Y-%m-%d %H:%M"))]
+    for idx, task in enumerate(["ACME: design", "SEN: lunch", "ACME: code"]):
+        task_date = start + timedelta(minutes=45 * (idx + 1))
+        lines.append("{}: {}".format(task_date.strftime("%Y-%m-%d %H:%M"),
+                                     task))
+    path.write_text("\n".join(lines) + "\n")
+    restart(monkeypatch, path)
+    yield path
+    if timelog.appender is not None:
+        timelog.appender.close()
+
+
+def test_totals_match_full_pass(log_file):
+    totals = timelog.get_running_totals().get_totals()
+    assert totals == timelog.compute_totals().get_totals()
+    assert totals[timelog.YEAR][0] == 3 * 45 * 60
+
+
+def test_stored_totals_read_on_next_run(log_file, monkeypatch):
+    totals = timelog.get_running_totals().get_totals()
+
+    restart(monkeypatch, log_file)
+
+    def compute_totals():
+        raise AssertionError("running totals computed again")
+
+    monkeypatch.setattr(timelog, "compute_totals", compute_totals)
+    assert timelog.get_running_totals().get_totals() == totals
+
+
+def test_appended_lines_update_stored_totals(log_file, monkeypatch):
+    timelog.get_running_totals()
+    task_date = datetime.now().replace(second=0, microsecond=0)
+    with open(log_file, "a") as writer:
+        writer.write("{}: ACME: review\n".format(
+            task_date.strftime("%Y-%m-%d %H:%M")))
+
+    restart(monkeypatch, log_file)
+    expected = timelog.compute_totals().get_totals()
+    assert timelog.get_running_totals().get_totals() == expected
+
+
+def test_log_edited_with_same_size(log_file, monkeypatch):
+    totals = timelog.get_running_totals().get_totals()
+
+    # One task moved an hour later, the size does not change
+    stat = log_file.stat()
+    lines = log_file.read_text().split("\n")
+    task_date = timelog.parse_timestamp(lines[1]) + timedelta(hours=1)
+    lines[1] = "{}{}".format(task_date.strftime("%Y-%m-%d %H:%M"),
+                             lines[1][16:])
+    log_file.write_text("\n".join(lines))
+    # Filesystems with a coarse mtime might keep the same one
+    os.utime(str(log_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert log_file.stat().st_size == stat.st_size
+
+    restart(monkeypatch, log_file)
+    expected = timelog.compute_totals().get_totals()
+    assert expected != totals
+    assert timelog.get_running_totals().get_totals() == expected
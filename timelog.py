@@ -1,22 +1,70 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import calendar
+import time
+
+# Moment this module started loading, for --startup-profile
+STARTED = time.perf_counter()
+
 import configparser
 import contextlib
+import itertools
 import os
 import re
-import subprocess
 import sys
-import sys
-import termios
 import termios
-import tty
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
 
-import requests
+from timelog_appender import LogAppender
+from timelog_cache import invalidate_cache
+from timelog_cache import load_entries
+from timelog_cache import read_log_entries
+from timelog_calendar import WorkCalendar
+from timelog_calendar import read_holidays
+from timelog_index import LiveSearch
+from timelog_index import TaskIndex
+from timelog_parse import has_timestamp
+from timelog_parse import parse_timestamp
+from timelog_parse import from_minutes
+from timelog_parse import to_minutes
+from timelog_pipeline import by_day
+from timelog_pipeline import by_project
+from timelog_pipeline import by_task
+from timelog_pipeline import by_week
+from timelog_pipeline import get_task
+from timelog_pipeline import is_start
+from timelog_pipeline import only_billable
+from timelog_pipeline import only_projects
+from timelog_pipeline import pair
+from timelog_pipeline import parse
+from timelog_pipeline import read_range
+from timelog_pipeline import skip_starts
+from timelog_pipeline import to_entries
+from timelog_reader import read_lines_reversed
+from timelog_reader import scan_lines
+from timelog_render import Renderer
+from timelog_render import get_columns
+from timelog_store import UNDATED
+from timelog_store import from_lines
+from timelog_totals import RunningTotals
+from timelog_totals import get_log_key
+from timelog_totals import invalidate_totals
+from timelog_totals import read_totals
+from timelog_totals import write_totals
+
+# Timings of the startup phases, for --startup-profile
+timings = [("start", STARTED)]
+
+
+def mark(phase):
+    """Records the moment the startup phase passed-in finished
+    """
+    timings.append((phase, time.perf_counter()))
+
+
+mark("import")
 
 # Load configuration from ini file
 config = configparser.ConfigParser()
@@ -31,11 +79,30 @@ default_log_file = os.path.join(
     ".timelog",
     "timelog.txt"
 )
+default_database = os.path.join(
+    os.path.expanduser("~"),
+    ".timelog",
+    "timelog.db"
+)
+default_holidays_file = os.path.join(
+    os.path.expanduser("~"),
+    ".timelog",
+    "holidays.txt"
+)
 config["DEFAULT"] = {
     "log_file": default_log_file,
     "editor": "nano",
     "non_billable": "SEN,NAR",
-    "price_hour": "170"
+    "price_hour": "170",
+    "cache": "yes",
+    "fsync": "batched",
+    "quote": "no",
+    "quote_url": "",
+    "live_search": "yes",
+    "holidays": default_holidays_file,
+    "official_days": "12",
+    "storage": "text",
+    "database": default_database,
 }
 
 # Read the config file if it exists
@@ -59,13 +126,43 @@ NON_BILLABLE = [
 # Price per hour
 PRICE_HOUR = config.getfloat("DEFAULT", "price_hour")
 
+# Keep the parsed entries in a sidecar cache next to the log file
+USE_CACHE = config.getboolean("DEFAULT", "cache")
+
+# Where tasks are stored: text (the log file) or sqlite (the database,
+# filled with timelog_db.py import)
+STORAGE = config.get("DEFAULT", "storage")
+DATABASE = os.path.expanduser(config.get("DEFAULT", "database"))
+
+# When new tasks are flushed to disk: always, batched or none
+FSYNC = config.get("DEFAULT", "fsync")
+
+# Show a quote below the header, fetched in the background. The default
+# url of timelog_quotes is used when quote_url is empty
+SHOW_QUOTE = config.getboolean("DEFAULT", "quote")
+QUOTE_URL = config.get("DEFAULT", "quote_url")
+
+# Show the matches below the prompt while typing
+LIVE_SEARCH = config.getboolean("DEFAULT", "live_search")
+
+# Holidays, a date per line or an iCalendar file
+HOLIDAYS_FILE = os.path.expanduser(config.get("DEFAULT", "holidays"))
+
+# Number of official non-working days per year (weekends excluded), for the
+# years without holidays in the holidays file and not in
+# FREE_OFFICIAL_DAYS_YEAR
+FREE_OFFICIAL_DAYS = config.getint("DEFAULT", "official_days")
+
+mark("config")
+
 # Working hours range per day (minimum, optimal, excellent)
 HOURS_DAY_RANGE = (4, 6, 8)
 
 # Number of non-working days per week
 FREE_DAYS_WEEK = 2
 
-# Number of official non-working days per year (weekends excluded)
+# Number of official non-working days of some years (weekends excluded), for
+# the years without holidays in the holidays file
 FREE_OFFICIAL_DAYS_YEAR = (
     (2025, 11),
 )
@@ -82,10 +179,16 @@ INTRO = '\x0a'
 BACK = '\x7f'
 EOT = '\x04'
 CMD = "> "
+STARTUP_PROFILE = "--startup-profile"
+ARCHIVE = "--archive"
+VERIFY_CACHE = "--verify-cache"
+QUERY = "query"
 DAY = "Day"
 WEEK = "Week"
 MONTH = "Month"
 YEAR = "Year"
+PERIODS = (DAY, WEEK, MONTH, YEAR)
+SQLITE = "sqlite"
 
 # Colors
 # https://www.geeksforgeeks.org/print-colors-python-terminal/
@@ -98,52 +201,154 @@ CYAN = 96
 LIGHT_GRAY = 97
 BLACK = 98
 
+# Characters a YYYY-MM-DD HH:MM: date prefix is made of
+DATE_CHARS = "0123456789-: "
+
+# Matches shown while typing, and seconds to wait for the next key before
+# showing them
+LIVE_LIMIT = 5
+LIVE_DEBOUNCE = 0.03
+
 cached = {}
 skip = False
 
+# Index of distinct tasks for autocomplete, built on first use
+task_index = None
+
+# Search of the text being typed, over the index of distinct tasks
+live_search = None
+
+# Working days with the holidays file, loaded on first use
+work_calendar = None
+
+# Append channel to the log file, opened on first write
+appender = None
+
+# Database of the tasks with the sqlite storage, opened on first use
+database = None
+
+# Worked seconds of the current day, week, month and year, loaded on first use
+running_totals = None
+
+# Background fetch of the quote of the header, started on first use
+quote_fetcher = None
+
+# Output of the interactive UI, written a screen at a time
+screen = Renderer()
+
+# Keys pressed, read from stdin on first use
+key_reader = None
+
 @contextlib.contextmanager
 def raw_mode(file):
-    old_attrs = termios.tcgetattr(file.fileno())
+    # exit() closes stdin, keep the descriptor to restore the terminal
+    fd = file.fileno()
+    old_attrs = termios.tcgetattr(fd)
     new_attrs = old_attrs[:]
     new_attrs[3] = new_attrs[3] & ~(termios.ECHO | termios.ICANON)
     try:
-        termios.tcsetattr(file.fileno(), termios.TCSADRAIN, new_attrs)
+        termios.tcsetattr(fd, termios.TCSADRAIN, new_attrs)
         yield
     finally:
-        termios.tcsetattr(file.fileno(), termios.TCSADRAIN, old_attrs)
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_attrs)
+
+
+def read_entries(since=None):
+    """Returns an EntryStore with all the non-blank lines from the timelog
+    file. Only the lines added since last run are parsed when the cache is
+    enabled. Otherwise, when since is set, the store might only contain the
+    lines dated since then. The lines of the archived segments come first,
+    only from the segments with lines since then
+    """
+    from timelog_archive import load_segments
+    if USE_CACHE:
+        store = load_entries(LOG_FILE)
+    elif since is not None:
+        store = scan_entries(since=since)
+    else:
+        store = read_log_entries(LOG_FILE)
 
+    segments = load_segments(LOG_FILE, since=since)
+    if segments is None:
+        return store
+    segments.extend(store)
+    return segments
 
-def read_timelog():
+
+def scan_entries(since=None, until=None):
+    """Returns an EntryStore with the lines from the timelog file dated
+    between since and until, scanning the memory-mapped file as bytes
+    """
+    lines = scan_lines(LOG_FILE, since=since, until=until)
+    return from_lines([l[1] for l in lines])
+
+
+def read_timelog(store=None):
     """Returns a list with all the tasks from the timelog file
     """
+    if store is None:
+        store = read_entries()
     output = []
-    with open(LOG_FILE, "r") as reader:
-        prev = None
-        for line in reader:
-            line = line.strip()
-            if not line:
-                continue
-            if is_star(line):
-                prev = line
-            else:
-                if prev:
-                    output.append(prev)
-                output.append(line)
-                prev = None
+    prev = None
+    for idx in range(len(store)):
+        line = store.get_line(idx)
+        if store.is_star(idx):
+            prev = line
+        else:
+            if prev:
+                output.append(prev)
+            output.append(line)
+            prev = None
     if prev:
         output.append(prev)
     return output
 
 
+def read_timelog_reversed(store=None, since=None):
+    """Yields the tasks from the timelog file, newest first. Same as
+    reversed(read_timelog()), but reading the file backwards on demand,
+    followed by the archived segments with tasks since the date passed-in
+    """
+    if store is None and STORAGE == SQLITE:
+        lines = get_database().read_reversed(since=since)
+    elif store is None:
+        from timelog_archive import read_segments_reversed
+        lines = itertools.chain(read_lines_reversed(LOG_FILE),
+                                read_segments_reversed(LOG_FILE, since))
+    else:
+        lines = (store.get_line(idx) for idx in reversed(range(len(store))))
+
+    prev_star = False
+    for line in lines:
+        star = is_star(line)
+        if star and prev_star:
+            # Only the last start task of a row of start tasks is kept
+            continue
+        prev_star = star
+        yield line
+
+
 def get_quote():
+    """Returns the quote fetched in the background if it already arrived, or
+    one of the quotes fetched before. Never waits on the network
     """
-    {"_id":"rHScBNdsDKp","tags":["film"],"author":"Woody Allen",
-    "content":"I took a speed reading course and read 'War and Peace' in twenty minutes. It involves Russia.","length":93}
-    :return:
+    from timelog_quotes import format_quote
+    quote = get_quote_fetcher().get()
+    return quote and format_quote(quote) or ""
+
+
+def get_quote_fetcher():
+    """Returns the fetcher of the quote, starting it on first use
     """
-    response = requests.get("https://api.quotable.io/random")
-    res = response.json()
-    return "{}\n.. {}".format(res.get("content"), res.get("author"))
+    global quote_fetcher
+    if quote_fetcher is None:
+        import timelog_quotes
+        pool_file = os.path.join(os.path.dirname(LOG_FILE), ".quotes.json")
+        pool = timelog_quotes.QuotePool(pool_file)
+        url = QUOTE_URL or timelog_quotes.QUOTE_URL
+        quote_fetcher = timelog_quotes.QuoteFetcher(pool, url=url)
+        quote_fetcher.start()
+    return quote_fetcher
 
 def get_bar(value, max_value, size=15, left_bracket="", right_bracket="", fill_char="■", empty_char="□", header=""):
     completed = int(value * size / max_value)
@@ -171,151 +376,555 @@ def main():
     """
     cached = {}
     skip = False
+    profile = STARTUP_PROFILE in sys.argv[1:]
 
-    # Timelog header
-    now = datetime.now()
-    week_idx = datetime.now().strftime("%W")
-    work_days = get_working_days(now.year)
-    year_days = get_year_days(now.year)
-    day_of_year = datetime.now().timetuple().tm_yday
+    if sys.argv[1:2] == [QUERY]:
+        sys.exit(query(sys.argv[2:]))
 
-    out(colorize("[TIMELOG - W{} - {} wd/year]".format(int(week_idx), work_days), LIGHT_PURPLE))
+    if ARCHIVE in sys.argv[1:]:
+        archive_log()
+        return
 
-    # BARS
-    day_bar = get_bar(now.hour, 24, header="D:")
-    days_month = calendar.monthrange(now.year, now.month)[1]
-    month_bar = get_bar(now.day, days_month, header="M:")
-    year_bar = get_bar(day_of_year, year_days, header="Y:")
+    if VERIFY_CACHE in sys.argv[1:]:
+        sys.exit(not verify_totals() and 1 or 0)
 
-    out("{} {} {}".format(day_bar, month_bar, year_bar))
+    # Fetch the quote while the rest of the screen is prepared
+    if SHOW_QUOTE:
+        get_quote_fetcher()
 
+    # The whole first screen is written at once
+    with screen.frame():
+        # Timelog header
+        now = datetime.now()
+        week_idx = datetime.now().strftime("%W")
+        work_days = get_working_days(now.year)
+        year_days = get_year_days(now.year)
+        day_of_year = datetime.now().timetuple().tm_yday
 
-    # Print last 7 tasks from timelog file
-    #less(limit=7)
+        out(colorize("[TIMELOG - W{} - {} wd/year]".format(int(week_idx), work_days), LIGHT_PURPLE))
 
-    # Print a nice quote?
-    #print("\n"+colorize(get_quote(), LIGHT_GRAY))
+        # BARS
+        day_bar = get_bar(now.hour, 24, header="D:")
+        days_month = get_month_days(now.year, now.month)
+        month_bar = get_bar(now.day, days_month, header="M:")
+        year_bar = get_bar(day_of_year, year_days, header="Y:")
 
-    # Print summary
-    show_summary()
+        out("{} {} {}".format(day_bar, month_bar, year_bar))
+        mark("header")
 
-    # Assume autocomplete
-    out("")
-    tasks = show_matches(term="", limit=10)
 
-    # Prompt
-    prompt()
+        # Print last 7 tasks from timelog file
+        #less(limit=7)
+
+        # Print a nice quote?
+        if SHOW_QUOTE:
+            quote = get_quote()
+            if quote:
+                out("\n"+colorize(quote, LIGHT_GRAY))
 
+        # Print summary
+        totals = get_summary_totals()
+        mark("parse")
+        show_summary(totals)
+        mark("render")
+
+        # Assume autocomplete
+        out("")
+        tasks = show_matches(term="", limit=10)
+        mark("matches")
+
+        if profile:
+            show_timings()
+
+        # Prompt
+        prompt()
+
+    # Index the tasks while the first key is awaited
+    if LIVE_SEARCH:
+        get_task_index()
+
+    # The terminal stays in raw mode until the session ends
+    try:
+        with interactive():
+            loop(tasks)
+    except KeyboardInterrupt:
+        newline()
+
+
+def loop(tasks):
+    """Handles the keys pressed until the session ends
+    """
+    from timelog_input import ESCAPE
+    from timelog_input import is_paste
+    from timelog_input import is_special
     text = ""
     while True:
         key = wait_for_key()
 
-        # Press 'q' without text
-        if not text and is_quit(key):
-            exit()
+        # Everything displayed for the key is written at once
+        with screen.frame():
+            # Text pasted, or typed at once
+            if is_paste(key):
+                text = "{}{}".format(text, clean_paste(key, text))
+                screen.update_line(text)
+                show_live_matches(text)
+                continue
 
-        # Press Enter without text
-        if not text and is_intro(key):
-            continue
+            # Escape clears the text, other special keys are not used yet
+            if is_special(key):
+                if key == ESCAPE and text:
+                    text = ""
+                    screen.update_line(text)
+                    screen.clear_below()
+                continue
 
-        # Press Back without text
-        if not text and is_back(key):
-            continue
+            # Press 'q' without text
+            if not text and is_quit(key):
+                exit()
 
-        # Press whitespace without text
-        if not text and is_whitespace(key):
-            continue
+            # Press Enter without text
+            if not text and is_intro(key):
+                continue
 
-        # Press a number without text
-        if not text and is_num(key):
-            task = tasks.get(to_int(key))
-            if task:
-                write(get_task(task))
-                prompt(newline=True)
-                tasks = {}
-            continue
+            # Press Back without text
+            if not text and is_back(key):
+                continue
 
-        # Back key
-        if text and is_back(key):
-            text = text[:-1]
-            out("\x1b[2K\r{}{}".format(CMD, text), newline=False)
-            continue
+            # Press whitespace without text
+            if not text and is_whitespace(key):
+                continue
+
+            # Press a number without text
+            if not text and is_num(key):
+                task = tasks.get(to_int(key))
+                if task:
+                    write(get_task(task))
+                    prompt(newline=True)
+                    tasks = {}
+                continue
+
+            # Back key
+            if text and is_back(key):
+                text = text[:-1]
+                screen.update_line(text)
+                show_live_matches(text)
+                continue
+
+            # Auto-complete
+            if is_autocomplete(key):
+                screen.clear_below()
+                follow_log()
+                newline()
+                if text:
+                    tasks = show_matches(term=text, limit=10)
+                prompt()
+                text = ""
+                continue
+
+            # Plain text
+            if not is_intro(key):
+                text = "{}{}".format(text, key)
+                screen.update_line(text)
+                show_live_matches(text)
+                continue
 
-        # Auto-complete
-        if is_autocomplete(key):
-            newline()
-            if text:
+            # ---------------------------------------------
+            # ENTER PRESSED - HANDLE TEXT FROM HERE ONWARDS
+            # ---------------------------------------------
+
+            # Catch up with the tasks added from other terminals
+            screen.clear_below()
+            follow_log()
+
+            if is_quit(text):
+                exit()
+
+            elif is_list_tasks(text):
+                less(limit=20)
+
+            elif is_summary(text):
+                show_summary()
+
+            elif is_arrived(text):
+                write("arrived**")
+
+            elif is_edit(text):
+                open_editor()
+
+            elif is_search(text):
+                # Autocomplete
+                newline()
                 tasks = show_matches(term=text, limit=10)
-            prompt()
+
+            else:
+                # store the task
+                write(text)
+
+            # flush the text and prompt again
             text = ""
-            continue
+            prompt(newline=True)
+
+
+def show_live_matches(text):
+    """Displays the last tasks that match with the text being typed below the
+    prompt line. Nothing is searched while more keys are coming
+    """
+    if not LIVE_SEARCH:
+        return
+    # The text typed shows up right away, the matches once typing pauses
+    screen.flush()
+    if key_reader is not None and key_reader.has_pending(LIVE_DEBOUNCE):
+        return
+
+    # Terms starting with a digit, dash or colon can match the date of the
+    # line, not indexed. Lines are not redrawn when the prompt line wraps
+    columns = get_columns()
+    if (not text or text[0] in DATE_CHARS
+            or len(screen.prefix) + len(text) >= columns):
+        screen.clear_below()
+        return
+    lines = get_live_search().search(text, limit=LIVE_LIMIT)
+    screen.update_below([highlight(text, get_task(l)[:columns - 1])
+                         for l in lines])
+
+
+def get_live_search():
+    """Returns the search of the text being typed, over the current index of
+    distinct tasks
+    """
+    global live_search
+    index = get_task_index()
+    if live_search is None or live_search.index is not index:
+        live_search = LiveSearch(index)
+    return live_search
+
+
+def clean_paste(paste, text):
+    """Returns the text pasted as a single line, without leading whitespace if
+    there is no text yet
+    """
+    paste = " ".join(paste.splitlines())
+    if not text:
+        paste = paste.lstrip()
+    return paste
+
+
+def show_timings():
+    """Displays the time spent on each startup phase
+    """
+    lines = []
+    prev = timings[0][1]
+    for phase, moment in timings[1:]:
+        lines.append("{}: {:.1f} ms".format(phase, (moment - prev) * 1000))
+        prev = moment
+    total = (timings[-1][1] - timings[0][1]) * 1000
+    lines.append("total: {:.1f} ms".format(total))
+    out(colorize(" | ".join(lines), LIGHT_GRAY))
+
+
+# Keys to group the worked time by, and columns of the query results
+GROUP_KEYS = {
+    "day": by_day,
+    "week": by_week,
+    "project": by_project,
+    "task": by_task,
+}
+INTERVAL_COLUMNS = ("start", "end", "seconds", "time", "billable", "project",
+                    "task")
+GROUP_COLUMNS = ("seconds", "time", "billable_seconds", "billable_time")
+
+# Width of the columns of the query results as a table, the last one is not
+# padded
+TABLE_WIDTHS = {
+    "start": 16,
+    "end": 16,
+    "day": 10,
+    "week": 10,
+    "seconds": 8,
+    "time": 20,
+    "billable": 8,
+    "billable_seconds": 16,
+    "billable_time": 20,
+    "project": 12,
+}
+
+
+def query(argv=None):
+    """Prints the worked time of the tasks that match the filters of the
+    command line, one row per task or per group. Rows are written as they
+    are computed, reading the log file as a stream. Returns the exit status
+    """
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="timelog query",
+        description="Prints the time worked on each task, or grouped, "
+                    "without the interactive UI")
+    parser.add_argument("--since", type=to_date, metavar="YYYY-MM-DD",
+                        help="first day, time is counted from its 00:00 as "
+                             "in the summary")
+    parser.add_argument("--until", type=to_date, metavar="YYYY-MM-DD",
+                        help="last day, included")
+    parser.add_argument("--project", action="append", default=[],
+                        help="only the tasks of the project, can be repeated")
+    parser.add_argument("--billable", action="store_true",
+                        help="only the billable tasks")
+    parser.add_argument("--group-by", choices=sorted(GROUP_KEYS),
+                        help="add up the time of each day, week, project or "
+                             "task")
+    parser.add_argument("--format", choices=("table", "csv", "json"),
+                        default="table")
+    args = parser.parse_args(argv)
+
+    until = args.until and args.until + timedelta(days=1, seconds=-1)
+    intervals = get_query_intervals(args.since, until, args.project,
+                                    args.billable)
+    if args.group_by:
+        columns = (args.group_by, ) + GROUP_COLUMNS
+        rows = get_group_rows(intervals, args.group_by)
+    else:
+        columns = INTERVAL_COLUMNS
+        rows = get_interval_rows(intervals)
 
-        # Plain text
-        if not is_intro(key):
-            text = "{}{}".format(text, key)
-            prompt(key)
+    try:
+        write_rows(rows, columns, args.format)
+    except BrokenPipeError:
+        # Piped to a command that stopped reading, e.g. head
+        sys.stderr.close()
+        return 1
+    return 0
+
+
+def to_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def get_query_intervals(since=None, until=None, projects=None,
+                        billable=False):
+    """Yields the intervals of the tasks between since and until that are
+    not start tasks, paired as the summary does, of the projects passed-in
+    and only billable ones if requested. Without since, time is counted from
+    the first entry on
+    """
+    if STORAGE == SQLITE:
+        dated = get_database().read_range(since or datetime.min,
+                                          until or datetime.max)
+        entries = to_entries(dated)
+    else:
+        entries = read_range(LOG_FILE, since, until)
+    if since is None:
+        # Lines older than the ones before them are skipped, as with since
+        first = next(entries, None)
+        if first is None:
+            return iter(())
+        since = first.date
+        entries = itertools.chain([first], entries)
+    intervals = skip_starts(pair(entries, since=since))
+    if projects:
+        intervals = only_projects(intervals, projects)
+    if billable:
+        intervals = only_billable(intervals, is_billable)
+    return intervals
+
+
+def get_interval_rows(intervals):
+    """Yields a dict for each interval with some time worked
+    """
+    billable_tasks = {}
+    for interval in intervals:
+        seconds = int(interval.seconds)
+        if seconds <= 0:
             continue
+        yield {
+            "start": interval.start.strftime("%Y-%m-%d %H:%M"),
+            "end": interval.date.strftime("%Y-%m-%d %H:%M"),
+            "seconds": seconds,
+            "time": get_hm(seconds),
+            "billable": is_billable_task(interval, billable_tasks),
+            "project": by_project(interval),
+            "task": interval.task,
+        }
+
+
+def get_group_rows(intervals, group_by):
+    """Yields a dict with the all and billable seconds of each group, sorted
+    by group once all the intervals are read. The log might not be sorted,
+    so the intervals of a day or week are not always together
+    """
+    key = GROUP_KEYS[group_by]
+    billable_tasks = {}
+    groups = {}
+    for interval in intervals:
+        totals = groups.setdefault(key(interval), [0, 0])
+        add_query_seconds(totals, interval, billable_tasks)
+    for group in sorted(groups, key=lambda g: (g is None, g or "")):
+        if groups[group][0]:
+            yield get_group_row(group_by, group, groups[group])
+
+
+def get_group_row(group_by, group, totals):
+    if group_by in ("day", "week"):
+        group = group.isoformat()
+    return {
+        group_by: group,
+        "seconds": totals[0],
+        "time": get_hm(totals[0]),
+        "billable_seconds": totals[1],
+        "billable_time": get_hm(totals[1]),
+    }
 
-        # ---------------------------------------------
-        # ENTER PRESSED - HANDLE TEXT FROM HERE ONWARDS
-        # ---------------------------------------------
 
-        if is_quit(text):
-            exit()
+def add_query_seconds(totals, interval, billable_tasks):
+    """Adds the seconds of the interval to the [all, billable] totals, if it
+    has some time worked
+    """
+    seconds = int(interval.seconds)
+    if seconds <= 0:
+        return
+    totals[0] += seconds
+    if is_billable_task(interval, billable_tasks):
+        totals[1] += seconds
 
-        elif is_list_tasks(text):
-            less(limit=20)
 
-        elif is_summary(text):
-            show_summary()
+def is_billable_task(interval, billable_tasks):
+    """Returns whether the interval is billable, resolved once per distinct
+    task and kept in the dict passed-in
+    """
+    billable = billable_tasks.get(interval.task)
+    if billable is None:
+        billable = is_billable(interval.line)
+        billable_tasks[interval.task] = billable
+    return billable
 
-        elif is_arrived(text):
-            write("arrived**")
 
-        elif is_edit(text):
-            # Open editor and jump directly to last line
-            subprocess.check_call([EDITOR, "+9999999", LOG_FILE])
+def write_rows(rows, columns, output_format):
+    """Writes the rows to the stdout as they come, as a table, CSV or a JSON
+    array
+    """
+    if output_format == "csv":
+        import csv
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns,
+                                lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict([(column, format_value(row[column]))
+                                  for column in columns]))
+
+    elif output_format == "json":
+        import json
+        sep = "["
+        for row in rows:
+            sys.stdout.write("{}\n{}".format(sep, json.dumps(row)))
+            sep = ","
+        sys.stdout.write(sep == "[" and "[]\n" or "\n]\n")
 
-        elif is_search(text):
-            # Autocomplete
-            newline()
-            tasks = show_matches(term=text, limit=10)
+    else:
+        sys.stdout.write("{}\n".format(format_row(dict(zip(columns, columns)),
+                                                  columns)))
+        for row in rows:
+            sys.stdout.write("{}\n".format(format_row(row, columns)))
+    sys.stdout.flush()
+
+
+def format_row(row, columns):
+    """Returns the row as a line of the table, with the columns padded
+    """
+    values = []
+    for column in columns:
+        value = format_value(row[column])
+        if column != columns[-1]:
+            value = value.ljust(TABLE_WIDTHS.get(column, 0))
+        values.append(value)
+    return " ".join(values)
+
+
+def format_value(value):
+    """Returns the value of a column as text, for tables and CSV
+    """
+    if value is None:
+        return ""
+    if value is True or value is False:
+        return value and "yes" or "no"
+    return str(value)
+
+
+def archive_log():
+    """Moves the tasks of the previous years into compressed segments
+    """
+    from timelog_archive import archive
+    archived = archive(LOG_FILE)
+    invalidate_cache(LOG_FILE)
+    if not archived:
+        out("Nothing to archive")
+    for year in sorted(archived):
+        out("{}: {} lines archived".format(year, archived[year]))
 
-        else:
-            # store the task
-            write(text)
 
-        # flush the text and prompt again
-        text = ""
-        prompt(newline=True)
+def open_editor():
+    """Opens the log file with the editor and jumps directly to last line
+    """
+    import subprocess
+    if STORAGE == SQLITE:
+        edit_database()
+        return
+    subprocess.check_call([EDITOR, "+9999999", LOG_FILE])
+    invalidate_cache(LOG_FILE)
+    reset_task_index()
+    reset_running_totals()
+    if appender is not None:
+        appender.reopen()
+
+
+def edit_database():
+    """Opens the tasks of the database with the editor, exported as a log
+    file, and imports them back once the editor is closed
+    """
+    import subprocess
+    import tempfile
+    fd, log_file = tempfile.mkstemp(prefix="timelog-", suffix=".txt")
+    os.close(fd)
+    try:
+        get_database().export(log_file)
+        subprocess.check_call([EDITOR, "+9999999", log_file])
+        with open(log_file) as reader:
+            get_database().replace(reader)
+    finally:
+        os.remove(log_file)
+    reset_task_index()
 
 
 def prompt(val="> ", newline=False):
     """Writes the prompt to the stdout
     """
     if newline:
-        sys.stdout.write("\n")
-    # Print the prompt and flush immediately to ensure it shows up before input
-    sys.stdout.write(val)
-    sys.stdout.flush()
+        screen.write("\n")
+    # The prompt shows up before input when the current frame is written
+    screen.prompt(val)
 
 
 def wait_for_key():
     """Captures a single keypress without requiring the user to press Enter.
-    Returns the character of the key pressed.
+    Returns the character of the key pressed, the name of special keys, or a
+    Paste with all the text pasted at once. The terminal must be in raw mode
     """
-    # Save the original terminal settings
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
-    try:
-        # Switch the terminal to raw mode
-        tty.setraw(fd)
-        # Read a single character
-        key = sys.stdin.read(1)
-    finally:
-        # Restore the original terminal settings
-        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return key
+    global key_reader
+    if key_reader is None:
+        from timelog_input import KeyReader
+        key_reader = KeyReader(sys.stdin.fileno())
+    return key_reader.read_key()
+
+
+@contextlib.contextmanager
+def interactive():
+    """Keeps the terminal in raw mode, with bracketed paste, for the block.
+    Does nothing when the input is not a terminal
+    """
+    from timelog_input import bracketed_paste
+    if not sys.stdin.isatty():
+        yield
+        return
+    with raw_mode(sys.stdin):
+        with bracketed_paste(sys.stdout):
+            yield
 
 LIST_TASKS = ("l", "list")
 AUTO_COMPLETE = ("\t", TAB, )
@@ -358,17 +967,78 @@ def write(task):
         task = "{}".format(task)
     now = datetime.now()
     msg = "{}{}: {}\n".format(pre, now.strftime("%Y-%m-%d %H:%M"), task)
-    with open(LOG_FILE, "a") as file1:
-        file1.write(msg)
+    if STORAGE == SQLITE:
+        lines = get_database().add(msg.strip())
+    else:
+        lines = get_appender().append(msg)
+
+    # Keep the autocomplete index up-to-date without reloading the log, with
+    # the tasks added by other sessions first
+    update_views(lines)
+    if task_index is not None:
+        add_to_index(task_index, msg.strip())
+    add_to_totals([msg.strip()])
 
     out("\nTask added: {}".format(green(msg.strip())))
 
+def get_appender():
+    """Returns the append channel to the log file, opening it on first use
+    """
+    global appender
+    if appender is not None and appender.log_file != LOG_FILE:
+        appender.close()
+        appender = None
+    if appender is None:
+        import atexit
+        appender = LogAppender(LOG_FILE, sync=FSYNC)
+        atexit.register(appender.close)
+    return appender
+
+
+def get_database():
+    """Returns the database of the tasks, opening it on first use
+    """
+    global database
+    if database is not None and database.path != DATABASE:
+        database.close()
+        database = None
+    if database is None:
+        from timelog_db import LogDatabase
+        database = LogDatabase(DATABASE)
+    return database
+
+
+def follow_log():
+    """Updates the in-memory views with the tasks added by other sessions
+    """
+    if STORAGE == SQLITE:
+        if database is not None:
+            update_views(database.poll())
+    elif appender is not None:
+        update_views(get_appender().poll())
+
+
+def update_views(lines):
+    """Adds the lines appended to the log file to the in-memory views. None
+    means the file was replaced and the views have to be rebuilt
+    """
+    if lines is None:
+        reset_task_index()
+        reset_running_totals()
+        return
+    if task_index is not None:
+        for line in lines:
+            if has_timestamp(line):
+                add_to_index(task_index, line)
+    add_to_totals(lines)
+
+
 def cmd():
     out(CMD, newline=False)
 
 def out(txt, newline=True):
     txt = newline and "{}\n".format(txt) or txt
-    sys.stdout.write(txt)
+    screen.write(txt)
 
 def newline():
     out("")
@@ -399,45 +1069,162 @@ def get_since_date(period):
     elif period == YEAR:
         return datetime(today.year, 1, 1)
 
-def get_diff_seconds(start_date, end_date):
-    diff = (end_date - start_date)
-    return diff.total_seconds()
-
-def show_summary():
+def show_summary(totals=None):
+    """Displays the worked and billable hours of every period. Totals are
+    computed in a single pass over the log file unless passed-in
+    """
+    if totals is None:
+        totals = get_summary_totals()
     out(colorize("ALL::", PURPLE))
-    period_summary(DAY)
-    period_summary(WEEK)
-    period_summary(MONTH)
-    period_summary(YEAR)
+    for period in PERIODS:
+        show_period(period, totals[period][0])
     out(colorize("BILLABLE::", PURPLE))
-    period_summary(DAY, billable_only=True)
-    period_summary(WEEK, billable_only=True)
-    period_summary(MONTH, billable_only=True)
-    period_summary(YEAR, billable_only=True)
+    for period in PERIODS:
+        show_period(period, totals[period][1], billable_only=True)
 
-def period_summary(period=DAY, billable_only=False):
-    total = 0
-    since_start = get_since_date(period)
-    since = since_start
-    with open(LOG_FILE, "r") as reader:
-        for line in reader:
-            line = line.strip()
-            if not line:
-                continue
 
-            task_date = get_task_date(line)
-            if task_date < since:
-                continue
+def get_summary_totals(periods=None):
+    """Returns a dict with the (all, billable) worked seconds for each period,
+    from the running totals or from the database
+    """
+    if STORAGE == SQLITE:
+        return get_database_totals(periods)
+    totals = get_running_totals().get_totals()
+    return dict([(period, totals[period]) for period in periods or PERIODS])
+
+
+def get_database_totals(periods=None):
+    """Returns a dict with the (all, billable) worked seconds for each period,
+    with a query by date range on the database for each one
+    """
+    totals = {}
+    starts = get_period_starts()
+    for period in periods or PERIODS:
+        total = billable = 0
+        for task, line, seconds in get_database().get_worked(starts[period]):
+            total += seconds
+            if is_billable(line):
+                billable += seconds
+        totals[period] = (total, billable)
+    return totals
+
+
+def get_running_totals():
+    """Returns the running totals of all the periods, loaded from disk or
+    computed by reading the log file once if they are not up-to-date
+    """
+    global running_totals
+    follow_log()
+    if running_totals is None or running_totals.key != get_log_key(LOG_FILE):
+        # Nobody appends to the log file until the totals are up-to-date
+        running_totals = None
+        with get_appender().following() as lines:
+            update_views(lines)
+            running_totals = read_totals(LOG_FILE)
+            if running_totals is None:
+                running_totals = compute_totals()
+                running_totals.key = get_appender().get_key()
+                write_totals(LOG_FILE, running_totals)
+    running_totals.roll(get_period_starts())
+    return running_totals
+
+
+def compute_totals():
+    """Returns the running totals of all the periods, computed by reading the
+    log file only once and adding every entry to all the periods, as the
+    entries appended later are
+    """
+    totals = RunningTotals()
+    totals.roll(get_period_starts())
+
+    # Lines older than all the periods are skipped by all of them
+    oldest = min([state[0] for state in totals.states.values()])
+    store = read_entries(since=from_minutes(oldest))
+
+    # Whether each task is billable, resolved on first use
+    billable_tasks = {}
+    for idx in range(store.find(oldest), len(store)):
+        if store.flags[idx] & UNDATED:
+            # Not a valid date, raise the error
+            parse_timestamp(store.get_line(idx))
+        star = store.is_star(idx)
+        billable = False
+        if not star:
+            task_id = store.task_ids[idx]
+            billable = billable_tasks.get(task_id)
+            if billable is None:
+                billable = is_billable(store.get_line(idx))
+                billable_tasks[task_id] = billable
+        totals.add(store.minutes[idx], star, billable)
+
+    return totals
+
+
+def get_period_starts():
+    """Returns a dict with the start of the current bucket of each period, as
+    minutes since 0001-01-01
+    """
+    return dict([(period, to_minutes(get_since_date(period)))
+                 for period in PERIODS])
 
-            if is_star(line):
-                since = task_date
-                continue
 
-            if not billable_only or is_billable(line):
-                total += get_diff_seconds(since, task_date)
+def add_to_totals(lines):
+    """Adds the lines just appended to the log file to the running totals,
+    without reading the log file again, and stores them
+    """
+    if running_totals is None or not lines:
+        return
+    running_totals.roll(get_period_starts())
+    for entry in parse(lines):
+        star = entry.star
+        billable = not star and is_billable(entry.line)
+        running_totals.add(to_minutes(entry.date), star, billable)
+    running_totals.key = get_appender().get_key()
+    write_totals(LOG_FILE, running_totals)
+
+
+def reset_running_totals():
+    """Discards the running totals, so they are computed again on next use
+    """
+    global running_totals
+    running_totals = None
+    invalidate_totals(LOG_FILE)
 
-            since = task_date
 
+def verify_totals():
+    """Compares the stored running totals against a full pass over the log
+    file. Returns whether they match
+    """
+    stored = read_totals(LOG_FILE)
+    if stored is None:
+        out("No running totals stored for the current log file")
+        return True
+
+    stored.roll(get_period_starts())
+    computed = compute_totals()
+    for period in PERIODS:
+        total, billable = stored.get_totals()[period]
+        msg = "{}: {} / {} billable".format(period, get_hm(total) or "0",
+                                             get_hm(billable) or "0")
+        if stored.states[period] == computed.states[period]:
+            out("{} {}".format(msg, green("OK")))
+        else:
+            total, billable = computed.get_totals()[period]
+            out("{} {}".format(msg, red("MISMATCH, expected {} / {}".format(
+                get_hm(total) or "0", get_hm(billable) or "0"))))
+    return stored == computed
+
+
+def period_summary(period=DAY, billable_only=False):
+    totals = get_summary_totals(periods=[period])
+    total = totals[period][billable_only and 1 or 0]
+    show_period(period, total, billable_only=billable_only)
+
+
+def show_period(period, total, billable_only=False):
+    """Displays the summary line of the period for the worked seconds
+    """
+    since_start = get_since_date(period)
     msg_period = period
     #if billable_only:
     #    msg_period = "{} (B)".format(period)
@@ -479,12 +1266,13 @@ def get_avg_hours_day(since, worked_hours):
 
     now = datetime.now()
     diff_days = (now - since).days + 1
+    start = since.date()
 
     # Number of days current year
     days_year = get_year_days(now.year)
 
     # Number of days current month
-    days_month = calendar.monthrange(now.year, now.month)[1]
+    days_month = get_month_days(now.year, now.month)
 
     #out("{}\n".format(diff_days))
     if diff_days <= 1:
@@ -493,19 +1281,21 @@ def get_avg_hours_day(since, worked_hours):
 
     elif diff_days <= 7:
         # Per week
-        diff_days = 7 - FREE_DAYS_WEEK
+        end = start + timedelta(days=6)
+        diff_days = get_calendar().count(start, end)
 
     elif diff_days <= days_month:
         # Per month
-        free_days = FREE_DAYS_WEEK * 4
-        diff_days = days_month - free_days
+        end = date(start.year, start.month,
+                   get_month_days(start.year, start.month))
+        diff_days = get_calendar().count(start, end)
 
     elif diff_days <= days_year:
         # Per year
         diff_days = get_working_days(now.year)
 
     #out("{} {}/{}\n".format(since.isoformat(), worked_hours, diff_days))
-    return float(worked_hours)/diff_days
+    return float(worked_hours)/max(diff_days, 1)
 
 def get_hm(seconds):
     val = float(seconds)/60/60
@@ -517,30 +1307,16 @@ def get_hm(seconds):
     return " ".join(values)
 
 
-def to_task_info(raw_task, start_date):
-    task = get_task(raw_task)
-    task_end = get_task_date(raw_task)
-    seconds = get_diff_seconds(start_date, task_end)
-    project = task.split(":")[0].strip()
-    return {
-        "start": start_date,
-        "end": task_end,
-        "seconds": seconds,
-        "task": get_task(task),
-        "raw": raw_task,
-        "project": project,
-    }
-
-
-def get_tasks(term=None, since=None, until=None, purge=False, limit=10, sort="ascending"):
-    """Searches for tasks that match with the term passed-in
+def get_tasks(term=None, since=None, until=None, purge=False, limit=10, sort="ascending", store=None):
+    """Searches for tasks that match with the term passed-in, from the log
+    file or from the EntryStore passed-in
     """
     output = []
     matches = []
 
     # We reverse because in case of duplicates, we want to always display the
     # latest date of that task.
-    for raw_task in reversed(read_timelog()):
+    for raw_task in read_timelog_reversed(store, since=since):
 
         # Get the date of the task
         task_date = get_task_date(raw_task)
@@ -559,17 +1335,18 @@ def get_tasks(term=None, since=None, until=None, purge=False, limit=10, sort="as
             continue
 
         # Remove terms ending with ** and dups
+        task = get_task(raw_task)
         if purge:
             if is_star(raw_task):
                 continue
 
             # Remove duplicates
-            if get_task(raw_task) in matches:
+            if task in matches:
                 continue
 
         # Add the match
         output.append(raw_task)
-        matches.append(get_task(raw_task))
+        matches.append(task)
 
         if 0 < limit == len(output):
             break
@@ -580,18 +1357,84 @@ def get_tasks(term=None, since=None, until=None, purge=False, limit=10, sort="as
     return output
 
 
+def get_task_index():
+    """Returns the index of distinct tasks, building it on first use
+    """
+    global task_index
+    if task_index is None:
+        index = TaskIndex()
+        if STORAGE == SQLITE:
+            # Follow the database from here, the tasks read below are all
+            # indexed
+            get_database().poll()
+            for line in get_database().read_tasks():
+                add_to_index(index, line)
+        else:
+            # Follow the log from here, the entries read below are all indexed
+            get_appender().poll()
+            store = read_entries()
+            # Only the last line of every distinct task is needed, added in
+            # the order they were last seen
+            for idx in sorted(get_last_entries(store).values()):
+                add_to_index(index, store.get_line(idx))
+        task_index = index
+    return task_index
+
+
+def get_last_entries(store):
+    """Returns a dict with the position of the last dated entry of each task
+    id of the store
+    """
+    if not any([store.flags[idx] & UNDATED for idx in store.raw]):
+        # Later positions replace the earlier ones of the same task
+        return dict(zip(store.task_ids, range(len(store))))
+    last = {}
+    for idx, task_id in enumerate(store.task_ids):
+        if not store.flags[idx] & UNDATED:
+            last[task_id] = idx
+    return last
+
+
+def reset_task_index():
+    """Discards the index of distinct tasks, so it is rebuilt on next use
+    """
+    global task_index
+    task_index = None
+
+
+def add_to_index(index, line):
+    """Adds the line to the index of distinct tasks, unless a start task
+    """
+    if is_star(line):
+        return
+    task = get_task(line)
+    if task:
+        index.add(task, line)
+
+
+def find_tasks(term, limit=10):
+    """Returns the last distinct tasks that match with the term, as
+    get_tasks(term=term, limit=limit, purge=True) does, but from the index
+    """
+    # Without term the last lines of the log are enough. Terms starting with
+    # a digit, dash or colon can match the date of the line, not indexed
+    if not term or term[0] in DATE_CHARS:
+        return get_tasks(term=term, limit=limit, purge=True)
+    if STORAGE == SQLITE:
+        return list(reversed(get_database().search(term, limit=limit)))
+    return list(reversed(get_task_index().search(term, limit=limit)))
+
+
 def show_matches(term, limit=10):
     """Displays a list in the stdout for selection
     """
-    tasks = get_tasks(term=term, limit=limit, purge=True)
+    tasks = find_tasks(term, limit=limit)
 
     # Cache them with an index
     cached = dict([(l[0], l[1]) for l in enumerate(tasks)])
 
     # Display matches in green
-    colored = green(term)
-    esc = re.compile(re.escape(term), re.IGNORECASE)
-    tasks = [esc.sub(colored, get_task(l)) for l in tasks]
+    tasks = [highlight(term, get_task(l)) for l in tasks]
     tasks = ["{}: {}".format(yellow(l[0]), l[1]) for l in enumerate(tasks)]
 
     # Join the tasks
@@ -602,6 +1445,13 @@ def show_matches(term, limit=10):
     return cached
 
 
+def highlight(term, task):
+    """Returns the task with the matches of the term in green
+    """
+    esc = re.compile(re.escape(term), re.IGNORECASE)
+    return esc.sub(green(term), task)
+
+
 def less(limit=10):
     """Returns the last lines of the LOG FILE
     """
@@ -631,7 +1481,7 @@ def blue(val):
 def is_star(line):
     """Returns whether this task is an **start** task
     """
-    return line.strip().endswith("**")
+    return is_start(line)
 
 def is_billable(line):
     """Returns whether this task is billable or not
@@ -652,30 +1502,25 @@ def is_billable(line):
     #return all(bill)
 
 
-def get_task(line):
-    """Returns the task without the Date part
-    """
-    task = line.strip()
-    try:
-        get_task_date(line)
-        task = len(line) > 18 and line[18:] or None
-    except Exception:
-        # This is a cleaned task already
-        pass
-    return task
-
-
 def get_task_date(line):
     """Returns the date part of the task
     """
-    return datetime.strptime(line[:16], "%Y-%m-%d %H:%M")
+    return parse_timestamp(line)
 
 def get_year_days(year):
     """Returns the number of days in the year
     """
+    import calendar
     return 365 + calendar.isleap(year)
 
 
+def get_month_days(year, month):
+    """Returns the number of days in the month
+    """
+    import calendar
+    return calendar.monthrange(year, month)[1]
+
+
 def get_working_days(year):
     """Returns the number of working days of the year
     """
@@ -683,15 +1528,13 @@ def get_working_days(year):
     # Días de fin de semana: Se restan los fines de semana (sábados y domingos).
     # Días festivos: Se eliminan los días festivos nacionales y los específicos de cada comunidad autónoma.
 
-    # number of total days of the year
-    days = get_year_days(year)
-
-    # remove the weekends (saturdays and sundays)
-    for num_day in range(FREE_DAYS_WEEK):
-        days -= len(list(all_weekdays(year, weekday=6-num_day)))
+    # days of the year without weekends and holidays
+    calendar = get_calendar()
+    days = calendar.count_year(year)
 
-    # remove the official free days (defaults to 12)
-    days -= dict(FREE_OFFICIAL_DAYS_YEAR).get(year, 12)
+    # remove the official free days of the years without holidays
+    if not calendar.has_holidays(year):
+        days -= dict(FREE_OFFICIAL_DAYS_YEAR).get(year, FREE_OFFICIAL_DAYS)
 
     # remove the non-working days
     days -= FREE_DAYS_YEAR
@@ -699,19 +1542,24 @@ def get_working_days(year):
     return days
 
 
-def all_weekdays(year, weekday):
-    """Return a list of dates for the given year and weekday, where Monday == 0 ... Sunday == 6
+def get_calendar():
+    """Returns the calendar of working days, with the holidays of the
+    holidays file if any
     """
-    # Set dt to January 1st of the given year
-    dt = date(year, 1, 1)
-    # Move dt to the first Sunday of the given year
-    dt += timedelta(days=weekday - dt.weekday())
-    # Iterate through all Sundays of the given year
-    while dt.year == year:
-        # Yield the current date (dt) as a result
-        yield dt
-        # Move to the next Sunday by adding 7 days
-        dt += timedelta(days=7)
+    global work_calendar
+    if work_calendar is None:
+        holidays, yearly = (), ()
+        try:
+            holidays, yearly = read_holidays(HOLIDAYS_FILE)
+        except OSError:
+            pass
+        except ValueError as e:
+            out(colorize("Warning: Could not read holidays file: {}".format(e),
+                         RED))
+        # The last days of the week are the free ones
+        free_weekdays = range(7 - FREE_DAYS_WEEK, 7)
+        work_calendar = WorkCalendar(holidays, yearly, free_weekdays)
+    return work_calendar
 
 
 if __name__ == "__main__":
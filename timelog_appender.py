@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Append channel to the timelog file, shared by concurrent sessions.
+
+The file is kept open in append mode for the whole session and every record
+is written holding an fcntl advisory lock, so records of several terminals
+are never interleaved. The file is the channel between sessions too: it
+only grows, so each appender remembers the offset it has seen and reads only
+the records appended by the others since then, before its own ones.
+
+How often the data is flushed to disk is configurable:
+
+- always: fsync after every record
+- batched: fsync every SYNC_BATCH records or SYNC_INTERVAL seconds, and on
+  close. A timer syncs the last records when no more are written
+- none: leave it to the operating system
+"""
+
+import contextlib
+import fcntl
+import os
+import threading
+import time
+
+from timelog_files import read_complete
+from timelog_parse import ENCODING
+
+SYNC_ALWAYS = "always"
+SYNC_BATCHED = "batched"
+SYNC_NONE = "none"
+SYNC_POLICIES = (SYNC_ALWAYS, SYNC_BATCHED, SYNC_NONE)
+
+# Max records and seconds without fsync with the batched policy
+SYNC_BATCH = 10
+SYNC_INTERVAL = 5.0
+
+
+class LogAppender:
+    """Keeps the log file open to append records to it, and to follow the
+    records appended by other sessions
+    """
+
+    def __init__(self, log_file, sync=SYNC_BATCHED):
+        if sync not in SYNC_POLICIES:
+            raise ValueError("Invalid sync policy: {}".format(sync))
+        self.log_file = log_file
+        self.sync = sync
+        self.file = None
+        self.offset = 0
+        # mtime of the file once the offset was last moved
+        self.mtime = None
+        self.pending = 0
+        self.synced = time.monotonic()
+        # Syncs the pending records once due, and guards them
+        self.timer = None
+        self.lock = threading.Lock()
+        self.open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """Opens the log file, following it from its current end
+        """
+        self.file = open(self.log_file, "ab")
+        stat = os.fstat(self.file.fileno())
+        self.offset = stat.st_size
+        self.mtime = stat.st_mtime_ns
+
+    def close(self):
+        if self.file is None:
+            return
+        self.sync_pending(force=True)
+        with self.lock:
+            self.file.close()
+            self.file = None
+
+    def reopen(self):
+        """Opens the log file again, e.g. after it was edited. The records
+        already in the file are not returned by poll
+        """
+        self.close()
+        self.open()
+
+    def append(self, record):
+        """Appends the record, a string ending with a newline. Returns the
+        lines appended by other sessions since the last call, or None if the
+        file was replaced, as poll does
+        """
+        data = record.encode(ENCODING)
+        replaced = False
+        while True:
+            if self.is_replaced():
+                self.reopen()
+                replaced = True
+            fd = self.file.fileno()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # The file might have been replaced while waiting for the lock
+            if not self.is_replaced():
+                break
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+        try:
+            lines = None
+            if not replaced:
+                lines = self.read_new()
+            self.file.write(data)
+            self.file.flush()
+            stat = os.fstat(fd)
+            self.offset = stat.st_size
+            self.mtime = stat.st_mtime_ns
+            with self.lock:
+                self.pending += 1
+            self.sync_pending()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return lines
+
+    def get_key(self):
+        """Returns the (inode, size, mtime) of the log file up to the last
+        record read or written
+        """
+        return os.fstat(self.file.fileno()).st_ino, self.offset, self.mtime
+
+    def poll(self):
+        """Returns the stripped, non-blank lines appended by other sessions
+        since the last call. Returns None when the file was replaced or
+        truncated, so everything read from it has to be read again
+        """
+        self.sync_pending()
+        if self.is_replaced():
+            self.reopen()
+            return None
+        if os.fstat(self.file.fileno()).st_size == self.offset:
+            return []
+
+        fd = self.file.fileno()
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            return self.read_new()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def following(self):
+        """Yields the lines appended by other sessions since the last call, as
+        poll does, holding a shared lock so no session appends to the file
+        until the block ends
+        """
+        replaced = self.is_replaced()
+        if replaced:
+            self.reopen()
+        fd = self.file.fileno()
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            lines = self.read_new()
+            if replaced:
+                lines = None
+            yield lines
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def read_new(self):
+        """Returns the complete lines after the offset seen, and moves it
+        """
+        with open(self.log_file, "rb") as reader:
+            data, end = read_complete(reader, self.offset)
+            self.mtime = os.fstat(reader.fileno()).st_mtime_ns
+        self.offset += end
+        lines = data[:end].decode(ENCODING).split("\n")
+        return [l.strip() for l in lines if l.strip()]
+
+    def is_replaced(self):
+        """Returns whether the path now points to another file, or the file
+        is smaller than the offset already seen
+        """
+        try:
+            stat = os.stat(self.log_file)
+        except OSError:
+            return True
+        if stat.st_ino != os.fstat(self.file.fileno()).st_ino:
+            return True
+        return stat.st_size < self.offset
+
+    def sync_pending(self, force=False):
+        """Flushes the records written to disk when the sync policy says it is
+        due, or always when forced. Otherwise, with the batched policy, a
+        timer syncs them once due
+        """
+        with self.lock:
+            if self.file is None or not self.pending:
+                return
+            if not force and not self.is_sync_due():
+                if self.sync == SYNC_BATCHED and self.timer is None:
+                    delay = self.synced + SYNC_INTERVAL - time.monotonic()
+                    self.timer = threading.Timer(max(delay, 0),
+                                                 self.on_timer)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            os.fsync(self.file.fileno())
+            self.pending = 0
+            self.synced = time.monotonic()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def on_timer(self):
+        with self.lock:
+            self.timer = None
+        self.sync_pending()
+
+    def is_sync_due(self):
+        if self.sync == SYNC_ALWAYS:
+            return True
+        if self.sync == SYNC_NONE:
+            return False
+        if self.pending >= SYNC_BATCH:
+            return True
+        return time.monotonic() - self.synced >= SYNC_INTERVAL
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Yearly archive of the timelog file in compressed segments.
+
+Closed years are moved from the beginning of the log file into gzip files
+next to it, one per year (timelog-2023.txt.gz for timelog.txt), and the log
+file keeps only the current entries. A manifest (timelog.manifest.json)
+records the range of dates and the number of lines of each segment, so
+readers only open the segments that overlap the dates they need.
+
+Segments are read as if they were still at the beginning of the log file:
+oldest first, followed by the log file itself.
+
+The log file being replaced is what commits an archive. Until then the
+manifest keeps the segments as they were, with the size of each one, and
+the new ones are pending, with the inode and the first bytes of the log
+file they were cut from. Readers use the pending segments only once the log
+file is not that one anymore, and read each segment up to its size, so an
+interrupted archive never shows the moved lines twice, and running it again
+starts over from the segments as they were.
+"""
+
+import fcntl
+import json
+import os
+from datetime import datetime
+
+from timelog_cache import CACHE_VERSION
+from timelog_cache import get_cache_file
+from timelog_cache import get_head
+from timelog_cache import parse_entries
+from timelog_cache import read_cache
+from timelog_cache import write_cache
+from timelog_files import atomic_write
+from timelog_files import get_sidecar_file
+from timelog_parse import DATE_FORMAT
+from timelog_parse import ENCODING
+from timelog_reader import get_line_date
+from timelog_store import EntryStore
+
+# Bump whenever the format of the cached segments changes
+SEGMENT_CACHE_VERSION = 1
+
+
+def get_manifest_file(log_file):
+    """Returns the path of the manifest of the segments of the log file
+    """
+    return get_sidecar_file(log_file, "{stem}.manifest.json")
+
+
+def get_segment_file(log_file, year):
+    """Returns the path of the segment of the year for the log file
+    """
+    return get_sidecar_file(log_file, "{stem}-{year}{ext}.gz", year=year)
+
+
+def read_manifest(log_file):
+    """Returns the list of segments of the log file, oldest first, the
+    pending ones if the log file was already replaced. Each one is a dict
+    with the file, year, since, until, lines and size
+    """
+    manifest = load_manifest(log_file)
+    segments = manifest.get("segments", [])
+    pending = manifest.get("pending")
+    if pending and not is_log_unchanged(log_file, pending["log"]):
+        segments = pending["segments"]
+    return sorted(segments, key=lambda s: s["year"])
+
+
+def load_manifest(log_file):
+    try:
+        with open(get_manifest_file(log_file)) as reader:
+            return json.load(reader)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(log_file, segments, pending=None):
+    manifest = {"segments": segments}
+    if pending is not None:
+        manifest["pending"] = pending
+    data = json.dumps(manifest, indent=2)
+    atomic_write(get_manifest_file(log_file), data.encode())
+
+
+def get_log_state(reader):
+    """Returns the inode and the checksum of the first bytes of the open log
+    file, which tell it apart from the file that replaces it
+    """
+    size = os.fstat(reader.fileno()).st_size
+    return {
+        "inode": os.fstat(reader.fileno()).st_ino,
+        "head": list(get_head(reader, size)),
+    }
+
+
+def is_log_unchanged(log_file, state):
+    """Returns whether the log file is still the one of the state passed-in
+    """
+    try:
+        with open(log_file, "rb") as reader:
+            return get_log_state(reader) == state
+    except OSError:
+        return False
+
+
+def get_segments(log_file, since=None, until=None):
+    """Returns a list of (path, size) tuples for the segments with entries
+    between since and until, oldest first. Size is None for segments
+    archived before sizes were recorded
+    """
+    output = []
+    path = os.path.dirname(os.path.abspath(log_file))
+    for segment in read_manifest(log_file):
+        if since is not None and to_datetime(segment["until"]) < since:
+            continue
+        if until is not None and to_datetime(segment["since"]) > until:
+            continue
+        output.append((os.path.join(path, segment["file"]),
+                       segment.get("size")))
+    return output
+
+
+def to_datetime(value):
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+def read_segment_lines(segment_file, size=None):
+    """Returns the stripped, non-blank lines of the first size bytes of the
+    segment, in file order
+    """
+    text = read_segment(segment_file, size).decode(ENCODING)
+    return [l.strip() for l in text.split("\n") if l.strip()]
+
+
+def read_segment(segment_file, size=None):
+    """Returns the uncompressed bytes of the first size bytes of the segment,
+    or all of it. Bytes after the size are from an interrupted archive
+    """
+    import gzip
+    with open(segment_file, "rb") as reader:
+        data = reader.read(-1 if size is None else size)
+    return gzip.decompress(data)
+
+
+def read_segments_range(log_file, since=None, until=None):
+    """Yields (datetime, line) tuples for the lines of the segments dated
+    between since and until, both included, as timelog_reader.read_range
+    does for the log file
+    """
+    for segment_file, size in get_segments(log_file, since, until):
+        for line in read_segment_lines(segment_file, size):
+            task_date = get_line_date(line)
+            if task_date is None:
+                continue
+            if since is not None and task_date < since:
+                continue
+            if until is not None and task_date > until:
+                continue
+            yield task_date, line
+
+
+def read_segments_reversed(log_file, since=None):
+    """Yields the lines of the segments with entries since the date passed-in,
+    newest first. Older segments are only opened when reached
+    """
+    for segment_file, size in reversed(get_segments(log_file, since)):
+        for line in reversed(read_segment_lines(segment_file, size)):
+            yield line
+
+
+def load_segments(log_file, since=None):
+    """Returns an EntryStore with the entries of the segments with entries
+    since the date passed-in, or None if there are no such segments. The
+    entries of each segment are cached, as segments do not change
+    """
+    segments = get_segments(log_file, since)
+    if not segments:
+        return None
+    store = EntryStore()
+    for segment_file, size in segments:
+        store.extend(load_segment(segment_file, size))
+    return store
+
+
+def load_segment(segment_file, size=None):
+    """Returns an EntryStore with the entries of the first size bytes of a
+    single segment
+    """
+    cache_file = get_cache_file(segment_file)
+    stat = os.stat(segment_file)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns, size)
+    cache = read_cache(cache_file)
+    if cache and cache.get("segment") == SEGMENT_CACHE_VERSION:
+        if cache["key"] == key:
+            return cache["store"]
+
+    store = parse_entries(read_segment(segment_file, size))
+    write_cache(cache_file, {
+        "version": CACHE_VERSION,
+        "segment": SEGMENT_CACHE_VERSION,
+        "key": key,
+        "store": store,
+    })
+    return store
+
+
+def archive(log_file, before=None):
+    """Moves the entries of the log file older than the year passed-in (the
+    current one by default) into yearly segments. Returns a dict with the
+    number of lines moved to each year
+    """
+    before = before or datetime.now().year
+    with open(log_file, "rb+") as log:
+        # Sessions appending to the log wait until it has been replaced
+        fcntl.flock(log.fileno(), fcntl.LOCK_EX)
+        try:
+            # Segments as they were, or as left by an interrupted archive
+            # that already replaced the log file
+            current = read_manifest(log_file)
+            data = log.read()
+            years, cut = split_years(data, before)
+            if not years:
+                if load_manifest(log_file).get("pending"):
+                    write_manifest(log_file, current)
+                return {}
+
+            segments = dict([(s["year"], dict(s)) for s in current])
+            for year, year_data in years:
+                add_segment(log_file, segments, year, year_data)
+
+            # The new segments are pending until the log file is replaced
+            pending = {
+                "log": get_log_state(log),
+                "segments": [segments[y] for y in sorted(segments)],
+            }
+            write_manifest(log_file, current, pending)
+            atomic_write(log_file, data[cut:].lstrip(b"\n"))
+            write_manifest(log_file, pending["segments"])
+        finally:
+            fcntl.flock(log.fileno(), fcntl.LOCK_UN)
+
+    return dict([(year, count_lines(year_data)) for year, year_data in years])
+
+
+def split_years(data, before):
+    """Returns a tuple (years, cut) where years is a list of (year, bytes)
+    with the lines of the raw data dated before the year passed-in, grouped
+    by year, and cut the offset of the first line not archived. Lines
+    without date go with the year of the previous line
+    """
+    years = []
+    year = None
+    start = 0
+    offset = 0
+    while offset < len(data):
+        end = data.find(b"\n", offset)
+        end = end < 0 and len(data) or end + 1
+        task_date = get_line_date(data[offset:end].decode(ENCODING).strip())
+        if task_date is not None and task_date.year != year:
+            if task_date.year >= before:
+                break
+            if year is not None:
+                years.append((year, data[start:offset]))
+                start = offset
+            year = task_date.year
+        offset = end
+
+    if year is not None:
+        years.append((year, data[start:offset]))
+    return merge_years(years), offset
+
+
+def merge_years(years):
+    """Joins the chunks of the same year, for logs with dates out of order
+    """
+    output = []
+    chunks = {}
+    for year, chunk in years:
+        if year not in chunks:
+            chunks[year] = []
+            output.append(year)
+        chunks[year].append(chunk)
+    return [(year, b"".join(chunks[year])) for year in sorted(output)]
+
+
+def add_segment(log_file, segments, year, data):
+    """Appends the raw lines to the segment of the year, updating its entry
+    in the manifest. Bytes after the size of the segment, left by an
+    interrupted archive, are dropped first
+    """
+    dates = []
+    for line in data.decode(ENCODING).split("\n"):
+        task_date = get_line_date(line.strip())
+        if task_date is not None:
+            dates.append(task_date)
+
+    import gzip
+    segment_file = get_segment_file(log_file, year)
+    size = segments.get(year, {"size": 0}).get("size")
+    # New members are appended to existing segments, gzip reads them all
+    with open(segment_file, "ab") as writer:
+        if size is not None:
+            writer.truncate(size)
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        writer.write(gzip.compress(data))
+        size = writer.tell()
+
+    segment = segments.get(year, {
+        "file": os.path.basename(segment_file),
+        "year": year,
+        "since": None,
+        "until": None,
+        "lines": 0,
+    })
+    since = min(dates).strftime(DATE_FORMAT)
+    until = max(dates).strftime(DATE_FORMAT)
+    segment["since"] = min([d for d in (segment["since"], since) if d])
+    segment["until"] = max([d for d in (segment["until"], until) if d])
+    segment["lines"] += count_lines(data)
+    segment["size"] = size
+    segments[year] = segment
+
+
+def count_lines(data):
+    return len([l for l in data.split(b"\n") if l.strip()])
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Sidecar cache with the parsed entries of a timelog file.
+
+The timelog file only grows through appends, so the cache keeps the store
+with the entries already parsed, together with the byte offset consumed. On
+the next run only the tail after that offset is parsed. The cache is keyed
+by the inode, size and mtime of the file, and the bytes right before the
+offset (and at the beginning of the file) are checked too. When any of them
+changed (e.g. the file was modified with an editor) the cache is discarded
+and rebuilt.
+"""
+
+import os
+import pickle
+import zlib
+
+from timelog_files import atomic_write
+from timelog_files import get_sidecar_file
+from timelog_files import read_complete
+from timelog_parse import ENCODING
+from timelog_store import EntryStore
+
+# Bump whenever the format of the stored entries changes
+CACHE_VERSION = 3
+
+# Number of bytes checked at the beginning and before the consumed offset
+ANCHOR_SIZE = 4096
+
+
+def get_cache_file(log_file):
+    """Returns the path of the cache file for the log file passed-in
+    """
+    return get_sidecar_file(log_file, ".{name}.cache")
+
+
+def read_log_entries(log_file):
+    """Returns an EntryStore with all the non-blank lines of the log file,
+    without using the cache
+    """
+    with open(log_file, "rb") as reader:
+        return parse_entries(reader.read())
+
+
+def load_entries(log_file, cache_file=None):
+    """Returns an EntryStore with all the non-blank lines of the log file,
+    parsing only the lines appended since the last call
+    """
+    cache_file = cache_file or get_cache_file(log_file)
+    cache = read_cache(cache_file)
+    with open(log_file, "rb") as reader:
+        stat = os.fstat(reader.fileno())
+        changed = not cache or not is_unchanged(cache, stat)
+        if changed and (not cache or not is_appended(cache, stat, reader)):
+            cache = get_empty_cache()
+
+        data, end = read_complete(reader, cache["offset"])
+        if changed:
+            parse_entries(data[:end], cache["store"])
+            cache["offset"] += end
+            cache["head"] = get_head(reader, cache["offset"])
+            cache["anchor"] = get_anchor(reader, cache["offset"])
+
+            stat = os.fstat(reader.fileno())
+            cache.update({
+                "inode": stat.st_ino,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+            })
+
+    if changed:
+        write_cache(cache_file, cache)
+
+    if data[end:].strip():
+        return parse_entries(data[end:], cache["store"].copy())
+    return cache["store"]
+
+
+def invalidate_cache(log_file, cache_file=None):
+    """Removes the cache of the log file, if any
+    """
+    cache_file = cache_file or get_cache_file(log_file)
+    try:
+        os.remove(cache_file)
+    except OSError:
+        pass
+
+
+def parse_entries(data, store=None):
+    """Adds the lines from the raw bytes passed-in to the store and returns it
+    """
+    if store is None:
+        store = EntryStore()
+    text = data.decode(ENCODING)
+    for line in text.split("\n"):
+        line = line.strip()
+        if line:
+            store.add(line)
+    return store
+
+
+def get_empty_cache():
+    return {
+        "version": CACHE_VERSION,
+        "inode": None,
+        "size": 0,
+        "mtime": None,
+        "offset": 0,
+        "head": None,
+        "anchor": None,
+        "store": EntryStore(),
+    }
+
+
+def is_unchanged(cache, stat):
+    """Returns whether the file is exactly the one the cache was built from
+    """
+    return (cache["inode"] == stat.st_ino
+            and cache["size"] == stat.st_size
+            and cache["mtime"] == stat.st_mtime_ns)
+
+
+def is_appended(cache, stat, reader):
+    """Returns whether the file only grew since the cache was built, so the
+    entries cached are still valid and only the tail has to be parsed
+    """
+    if cache["inode"] != stat.st_ino:
+        return False
+    if stat.st_size <= cache["size"]:
+        # Same or smaller size but different mtime: modified in place
+        return False
+    if cache["head"] != get_head(reader, cache["offset"]):
+        return False
+    return cache["anchor"] == get_anchor(reader, cache["offset"])
+
+
+def get_head(reader, offset):
+    """Returns the checksum of the first bytes of the file, up to the offset
+    """
+    return get_checksum(reader, 0, min(offset, ANCHOR_SIZE))
+
+
+def get_anchor(reader, offset):
+    """Returns the checksum of the bytes right before the offset
+    """
+    return get_checksum(reader, offset - ANCHOR_SIZE, offset)
+
+
+def get_checksum(reader, start, end):
+    """Returns the checksum of the bytes of the file between start and end
+    """
+    start = max(start, 0)
+    reader.seek(start)
+    data = reader.read(max(end - start, 0))
+    return start, len(data), zlib.crc32(data)
+
+
+def read_cache(cache_file):
+    """Returns the cache stored in the file or None if not valid
+    """
+    try:
+        with open(cache_file, "rb") as reader:
+            cache = pickle.load(reader)
+    except Exception:
+        return None
+    if not isinstance(cache, dict):
+        return None
+    if cache.get("version") != CACHE_VERSION:
+        return None
+    return cache
+
+
+def write_cache(cache_file, cache):
+    """Stores the cache, silently giving up if the file cannot be written
+    """
+    try:
+        atomic_write(cache_file,
+                     pickle.dumps(cache, pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass
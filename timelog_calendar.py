@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Calendar of working days.
+
+Every year is kept as a bitmap with a byte per day, set for the working
+days: neither a free weekday nor a holiday. The prefix sums of the bitmap
+answer the number of working days of any range of dates in O(1), and they
+are built once per year, the first time the year is queried.
+
+Holidays are read from a plain text file or from an iCalendar (.ics) file:
+
+- in a plain text file every line is a date (YYYY-MM-DD) followed by an
+  optional description. Dates without year (MM-DD) are holidays every year.
+  Blank lines and lines starting with # are skipped
+- in an iCalendar file every event is a holiday, all the days from DTSTART
+  up to DTEND. Events repeated yearly (RRULE:FREQ=YEARLY) are holidays every
+  year, any other rule is ignored
+"""
+
+import itertools
+import re
+from array import array
+from datetime import date
+from datetime import timedelta
+
+# Saturday and Sunday, where Monday == 0 ... Sunday == 6
+FREE_WEEKDAYS = (5, 6)
+
+DATE_RE = re.compile(r"(?:(\d{4})-)?(\d{2})-(\d{2})$")
+
+
+class WorkCalendar:
+    """Working days of every year, without the free weekdays and the holidays
+    passed-in. Yearly holidays are (month, day) tuples
+    """
+
+    def __init__(self, holidays=(), yearly=(), free_weekdays=FREE_WEEKDAYS):
+        self.holidays = set(holidays)
+        self.yearly = set(yearly)
+        self.free_weekdays = frozenset(free_weekdays)
+        # year -> prefix sums of the working days of the year
+        self.sums = {}
+
+    def get_bitmap(self, year):
+        """Returns a bytearray with a byte per day of the year, 1 for the
+        working days
+        """
+        start = date(year, 1, 1)
+        weekday = start.weekday()
+        days = (date(year + 1, 1, 1) - start).days
+        bitmap = bytearray([(weekday + idx) % 7 not in self.free_weekdays
+                            for idx in range(days)])
+        for holiday in self.get_holidays(year):
+            bitmap[holiday.timetuple().tm_yday - 1] = 0
+        return bitmap
+
+    def get_holidays(self, year):
+        """Returns the list of holidays of the year
+        """
+        holidays = [h for h in self.holidays if h.year == year]
+        for month, day in self.yearly:
+            try:
+                holidays.append(date(year, month, day))
+            except ValueError:
+                # February 29th out of leap years
+                pass
+        return holidays
+
+    def has_holidays(self, year):
+        return bool(self.yearly) or any([h.year == year
+                                         for h in self.holidays])
+
+    def get_sums(self, year):
+        """Returns the array of prefix sums of the working days of the year,
+        where the position n has the working days before the day n + 1
+        """
+        sums = self.sums.get(year)
+        if sums is None:
+            bitmap = self.get_bitmap(year)
+            sums = array("H", itertools.accumulate(bitmap, initial=0))
+            self.sums[year] = sums
+        return sums
+
+    def count(self, start, end):
+        """Returns the number of working days from the start to the end date,
+        both included
+        """
+        if end < start:
+            return 0
+        first = start.timetuple().tm_yday - 1
+        last = end.timetuple().tm_yday
+        if start.year == end.year:
+            sums = self.get_sums(start.year)
+            return sums[last] - sums[first]
+
+        sums = self.get_sums(start.year)
+        days = sums[-1] - sums[first]
+        for year in range(start.year + 1, end.year):
+            days += self.count_year(year)
+        return days + self.get_sums(end.year)[last]
+
+    def count_year(self, year):
+        return self.get_sums(year)[-1]
+
+    def is_working(self, day):
+        sums = self.get_sums(day.year)
+        idx = day.timetuple().tm_yday
+        return sums[idx] > sums[idx - 1]
+
+
+def read_holidays(path):
+    """Returns a tuple (holidays, yearly) with the dates of the holidays file
+    and the (month, day) of the yearly ones. iCalendar files are told apart
+    by their content
+    """
+    with open(path, encoding="utf-8") as reader:
+        text = reader.read()
+    if text.lstrip().startswith("BEGIN:VCALENDAR"):
+        return parse_ics(text)
+    return parse_holidays(text, path)
+
+
+def parse_holidays(text, path=None):
+    """Returns a tuple (holidays, yearly) with the dates of the lines of a
+    plain text holidays file
+    """
+    holidays = set()
+    yearly = set()
+    for num, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = DATE_RE.match(line.split()[0])
+        try:
+            if match is None:
+                raise ValueError("not a date")
+            year, month, day = match.groups()
+            if year is None:
+                # Validated against a leap year, so February 29th is kept
+                date(2000, int(month), int(day))
+                yearly.add((int(month), int(day)))
+            else:
+                holidays.add(date(int(year), int(month), int(day)))
+        except ValueError as e:
+            raise ValueError("Invalid holiday at {}:{}: {} ({})".format(
+                path, num, line, e))
+    return holidays, yearly
+
+
+def parse_ics(text):
+    """Returns a tuple (holidays, yearly) with the days of the events of an
+    iCalendar file
+    """
+    holidays = set()
+    yearly = set()
+    event = None
+    for line in unfold_ics(text):
+        name, _, value = line.partition(":")
+        name = name.split(";")[0].upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif name == "END" and value.upper() == "VEVENT":
+            if event and "DTSTART" in event:
+                days = get_event_days(event)
+                if "FREQ=YEARLY" in event.get("RRULE", "").upper():
+                    yearly.update([(d.month, d.day) for d in days])
+                else:
+                    holidays.update(days)
+            event = None
+        elif event is not None:
+            event[name] = value.strip()
+    return holidays, yearly
+
+
+def unfold_ics(text):
+    """Returns the lines of an iCalendar file, with the long lines split
+    across several ones joined back
+    """
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line.strip():
+            lines.append(line.strip())
+    return lines
+
+
+def get_event_days(event):
+    """Returns the list of days of an event, from DTSTART up to DTEND (not
+    included). Events without DTEND last a day
+    """
+    start = parse_ics_date(event["DTSTART"])
+    end = "DTEND" in event and parse_ics_date(event["DTEND"]) or start
+    days = max((end - start).days, 1)
+    return [start + timedelta(days=idx) for idx in range(days)]
+
+
+def parse_ics_date(value):
+    """Returns the date of an iCalendar DATE or DATE-TIME value, such as
+    20251225 or 20251225T000000Z
+    """
+    value = value.strip()
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
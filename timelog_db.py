@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""SQLite storage of the entries of a timelog, for large histories.
+
+Entries are rows in file order, with the date as minutes since 0001-01-01
+(0 for lines without a valid date), indexed by date and by project. The
+distinct tasks that are not start tasks are kept apart, with the last entry
+of each of them, and an FTS5 trigram index of their text answers the
+autocomplete searches. The database runs in WAL mode, so readers never block
+the session that adds a task, and every task is added in its own
+transaction.
+
+The plain text log stays the canonical format: the database is filled by
+importing a log file (and its archived segments) and can be exported back
+to a log file at any time
+
+    python timelog_db.py import [--log LOG_FILE] [--db DATABASE]
+    python timelog_db.py export [--log LOG_FILE] [--db DATABASE]
+"""
+
+import argparse
+import contextlib
+import os
+import sqlite3
+
+from timelog_files import atomic_write
+from timelog_parse import ENCODING
+from timelog_parse import from_minutes
+from timelog_parse import parse_timestamp
+from timelog_parse import to_minutes
+from timelog_pipeline import get_task
+from timelog_pipeline import is_start
+from timelog_pipeline import read_lines
+
+# Bump whenever the schema changes
+SCHEMA_VERSION = 1
+
+# Lines inserted at once when importing
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    minutes INTEGER NOT NULL,
+    star INTEGER NOT NULL,
+    project TEXT NOT NULL,
+    task TEXT NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_minutes ON entries (minutes);
+CREATE INDEX IF NOT EXISTS entries_project ON entries (project, minutes);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL UNIQUE,
+    last_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_last_id ON tasks (last_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5 (
+    task, content='tasks', content_rowid='id', tokenize='trigram'
+);
+"""
+
+# Worked seconds of every distinct task since a date, in file order: older
+# entries are skipped, start tasks only move the start of the next task and
+# any other task adds the minutes since the newest entry before it
+WORKED_QUERY = """
+SELECT task, MIN(line), SUM(worked) * 60 FROM (
+    SELECT task, line, star, minutes - COALESCE(MAX(minutes) OVER (
+        ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ), :since) AS worked
+    FROM entries
+    WHERE minutes >= :since
+)
+WHERE NOT star AND worked > 0
+GROUP BY task
+"""
+
+
+class LogDatabase:
+    """Entries of a timelog stored in a SQLite database
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Transactions are started explicitly
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.create_schema()
+        # Last entry returned by poll or added by this session
+        self.last_id = self.get_last_id()
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def create_schema(self):
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError("Unsupported schema version {} in {}".format(
+                version, self.path))
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(
+            "PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Runs the block in a write transaction, rolled back on errors
+        """
+        # IMMEDIATE takes the write lock upfront, so the block never fails
+        # halfway because another session is writing
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def add(self, line):
+        """Adds a stripped, non-blank line of the log file. Returns the lines
+        added by other sessions before it
+        """
+        with self.transaction():
+            lines = self.poll()
+            self.last_id = self.insert([line])
+        return lines
+
+    def insert(self, lines):
+        """Inserts the lines and updates their distinct tasks, within the
+        current transaction. Returns the id of the last entry inserted
+        """
+        cursor = self.connection.cursor()
+        rows = []
+        tasks = {}
+        entry_id = self.get_last_id()
+        for line in lines:
+            entry_id += 1
+            minutes, star, project, task = parse_line(line)
+            rows.append((entry_id, minutes, star, project, task, line))
+            if minutes and not star and task:
+                tasks[task] = entry_id
+        cursor.executemany("INSERT INTO entries (id, minutes, star, project, "
+                           "task, line) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        for task, last_id in tasks.items():
+            cursor.execute("UPDATE tasks SET last_id = ? WHERE task = ?",
+                           (last_id, task))
+            if cursor.rowcount:
+                continue
+            cursor.execute("INSERT INTO tasks (task, last_id) VALUES (?, ?)",
+                           (task, last_id))
+            cursor.execute("INSERT INTO tasks_fts (rowid, task) VALUES (?, ?)",
+                           (cursor.lastrowid, task))
+        return entry_id
+
+    def replace(self, lines):
+        """Replaces all the entries with the lines passed-in, in a single
+        transaction
+        """
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT INTO tasks_fts (tasks_fts) VALUES ('delete-all')")
+            connection.execute("DELETE FROM tasks")
+            connection.execute("DELETE FROM entries")
+            batch = []
+            for line in lines:
+                line = line.strip()
+                if line:
+                    batch.append(line)
+                if len(batch) == BATCH_SIZE:
+                    self.insert(batch)
+                    batch = []
+            self.last_id = self.insert(batch)
+
+    def get_last_id(self):
+        return self.connection.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+
+    def poll(self):
+        """Returns the lines added by other sessions since the last poll
+        """
+        rows = self.connection.execute(
+            "SELECT id, line FROM entries WHERE id > ? ORDER BY id",
+            (self.last_id, )).fetchall()
+        if rows:
+            self.last_id = rows[-1][0]
+        return [r[1] for r in rows]
+
+    def read_lines(self):
+        """Yields all the lines, in file order
+        """
+        for row in self.connection.execute(
+                "SELECT line FROM entries ORDER BY id"):
+            yield row[0]
+
+    def read_reversed(self, since=None):
+        """Yields the lines, newest first. When since is set, it stops at the
+        first line older than since, as reading the log file backwards does,
+        even if there are newer lines before it
+        """
+        since_minutes = 0
+        if since is not None:
+            since_minutes = to_minutes(since)
+            if since.second or since.microsecond:
+                since_minutes += 1
+        rows = self.connection.execute(
+            "SELECT minutes, line FROM entries ORDER BY id DESC")
+        for task_minutes, line in rows:
+            # Lines without date are yielded, there is no date to compare
+            if 0 < task_minutes < since_minutes:
+                return
+            yield line
+
+    def read_range(self, since, until):
+        """Yields (datetime, line) tuples for the lines dated between since
+        and until, both included, in file order
+        """
+        since_minutes = to_minutes(since)
+        if since.second or since.microsecond:
+            since_minutes += 1
+        rows = self.connection.execute(
+            "SELECT minutes, line FROM entries "
+            "WHERE minutes BETWEEN ? AND ? ORDER BY id",
+            (since_minutes, to_minutes(until)))
+        for task_minutes, line in rows:
+            yield from_minutes(task_minutes), line
+
+    def read_tasks(self):
+        """Yields the last line of every distinct task, in the order they
+        were last seen
+        """
+        for row in self.connection.execute(
+                "SELECT line FROM tasks JOIN entries ON entries.id = last_id "
+                "ORDER BY last_id"):
+            yield row[0]
+
+    def search(self, term, limit=10):
+        """Returns the last line of the most recent distinct tasks that
+        contain the term (case insensitive), newest first
+        """
+        pattern = "%{}%".format(escape_like(term or ""))
+        query = ("SELECT line FROM tasks_fts "
+                 "JOIN tasks ON tasks.id = tasks_fts.rowid "
+                 "JOIN entries ON entries.id = last_id "
+                 "WHERE tasks_fts.task LIKE ? ESCAPE '\\' "
+                 "ORDER BY last_id DESC")
+        params = (pattern, )
+        if limit > 0:
+            query = "{} LIMIT ?".format(query)
+            params = (pattern, limit)
+        return [r[0] for r in self.connection.execute(query, params)]
+
+    def get_worked(self, since):
+        """Returns a list of (task, line, seconds) tuples with the seconds
+        worked on each distinct task since the minutes passed-in
+        """
+        return self.connection.execute(WORKED_QUERY,
+                                       {"since": since}).fetchall()
+
+    def export(self, log_file):
+        """Writes all the lines to the log file, replacing it at once
+        """
+        output = []
+        for line in self.read_lines():
+            # Start tasks begin a new block, as when they are added
+            if is_start(line):
+                output.append("")
+            output.append(line)
+        output.append("")
+        atomic_write(log_file, "\n".join(output).encode(ENCODING))
+
+    def close(self):
+        self.connection.close()
+
+
+def parse_line(line):
+    """Returns a tuple (minutes, star, project, task) of a stripped line,
+    with the same rules as timelog_store. Lines without a valid date are
+    dated 0 and the task is the whole line
+    """
+    star = is_start(line)
+    try:
+        minutes = to_minutes(parse_timestamp(line))
+    except ValueError:
+        return 0, star, "", line
+    task = get_task(line)
+    return minutes, star, task.split(":")[0].strip(), task
+
+
+def escape_like(term):
+    for char in ("\\", "%", "_"):
+        term = term.replace(char, "\\" + char)
+    return term
+
+
+def import_log(log_file, path):
+    """Replaces the entries of the database with the ones of the log file
+    and its archived segments. Returns the number of entries
+    """
+    with LogDatabase(path) as database:
+        database.replace(read_lines(log_file))
+        return len(database)
+
+
+def export_log(path, log_file):
+    """Writes the entries of the database to the log file. Returns the number
+    of entries
+    """
+    with LogDatabase(path) as database:
+        database.export(log_file)
+        return len(database)
+
+
+def main(argv=None):
+    default_dir = os.path.join(os.path.expanduser("~"), ".timelog")
+    parser = argparse.ArgumentParser(
+        description="Imports a timelog file into a SQLite database, or "
+                    "exports the database back to a timelog file")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("--log", default=os.path.join(default_dir,
+                                                      "timelog.txt"),
+                        help="timelog file")
+    parser.add_argument("--db", default=os.path.join(default_dir,
+                                                     "timelog.db"),
+                        help="SQLite database")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        count = import_log(args.log, args.db)
+        print("{} entries imported from {}".format(count, args.log))
+    else:
+        count = export_log(args.db, args.log)
+        print("{} entries exported to {}".format(count, args.log))
+
+
+if __name__ == "__main__":
+    main()
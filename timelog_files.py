@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Files kept next to the timelog file, and how they are read and written.
+
+Sidecars (the cache, the running totals, the sorted ranges...) are named
+after the log file and live in the same directory. Every file is written to
+a temporary file first and then moved over the old one, so readers always
+see either the old or the new content, never a partial one.
+"""
+
+import contextlib
+import os
+
+
+def get_sidecar_file(log_file, pattern, **kwargs):
+    """Returns the path of a file next to the log file, named after the
+    pattern formatted with the name, stem and ext of the log file and the
+    keyword arguments, e.g. ".{name}.cache" or "{stem}-{year}{ext}.gz"
+    """
+    path, name = os.path.split(os.path.abspath(log_file))
+    stem, ext = os.path.splitext(name)
+    return os.path.join(path, pattern.format(name=name, stem=stem, ext=ext,
+                                             **kwargs))
+
+
+def atomic_write(path, data):
+    """Replaces the file with the bytes passed-in at once. The temporary file
+    is removed if anything fails, and the error is raised
+    """
+    tmp_file = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_file, "wb") as writer:
+            writer.write(data)
+        os.replace(tmp_file, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file)
+        raise
+
+
+def read_complete(reader, offset):
+    """Returns a tuple (data, end) with the bytes of the file from the offset
+    on and the length of the complete lines at their beginning. A last line
+    without a trailing newline is left out, as it might still be being
+    written by another session
+    """
+    reader.seek(offset)
+    data = reader.read()
+    return data, data.rfind(b"\n") + 1
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""In-memory index of the distinct tasks of the timelog, for autocomplete
+"""
+
+import heapq
+
+# Length of the substrings used as keys of the index
+GRAM_SIZE = 3
+
+
+class TaskIndex:
+    """Keeps the distinct task texts with the last line and position where
+    each of them was seen, plus the postings of their trigrams. Answers the
+    most recent distinct tasks containing a term without a full scan
+    """
+
+    def __init__(self):
+        # task text -> task id
+        self.ids = {}
+        # task id -> lowercased task text
+        self.lowered = []
+        # task id -> last raw line of the task
+        self.lines = []
+        # task id -> position of the last raw line of the task
+        self.last_seen = []
+        # trigram -> set of task ids
+        self.postings = {}
+        self.position = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, task, line):
+        """Adds the raw line of a task. Lines must be added in the same order
+        they have in the log file
+        """
+        self.position += 1
+        task_id = self.ids.get(task)
+        if task_id is None:
+            task_id = len(self.lowered)
+            self.ids[task] = task_id
+            lowered = task.lower()
+            self.lowered.append(lowered)
+            self.lines.append(line)
+            self.last_seen.append(self.position)
+            for gram in get_grams(lowered):
+                self.postings.setdefault(gram, set()).add(task_id)
+        else:
+            self.lines[task_id] = line
+            self.last_seen[task_id] = self.position
+
+    def search(self, term, limit=10):
+        """Returns the last raw line of the most recent distinct tasks that
+        contain the term (case insensitive), newest first
+        """
+        term = (term or "").lower()
+        return self.get_lines(self.get_matches(term), limit=limit)
+
+    def get_matches(self, term):
+        """Returns the ids of the tasks that contain the term, which must be
+        lowercase already
+        """
+        matches = self.get_candidates(term or "")
+        if term:
+            matches = [idx for idx in matches if term in self.lowered[idx]]
+        return matches
+
+    def get_lines(self, matches, limit=10):
+        """Returns the last raw line of the most recent tasks of the ids
+        passed-in, newest first
+        """
+        last_seen = self.last_seen.__getitem__
+        if limit > 0:
+            ids = heapq.nlargest(limit, matches, key=last_seen)
+        else:
+            ids = sorted(matches, key=last_seen, reverse=True)
+        return [self.lines[idx] for idx in ids]
+
+    def get_candidates(self, term):
+        """Returns the ids of the tasks that might contain the term
+        """
+        grams = get_grams(term)
+        if not grams:
+            return range(len(self.lowered))
+
+        postings = []
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if not ids:
+                return []
+            postings.append(ids)
+
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+
+class LiveSearch:
+    """Searches the index as the term is typed. When the term only grows, the
+    matches are narrowed from the ones of the previous term instead of
+    looking them up in the index again
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.term = None
+        self.matches = None
+        # Number of distinct tasks when the matches were looked up
+        self.size = 0
+
+    def search(self, term, limit=10):
+        """Returns the last raw line of the most recent distinct tasks that
+        contain the term (case insensitive), newest first
+        """
+        term = (term or "").lower()
+        lowered = self.index.lowered
+        if self.is_narrowed(term):
+            matches = [idx for idx in self.matches if term in lowered[idx]]
+        else:
+            matches = self.index.get_matches(term)
+        self.term = term
+        self.matches = matches
+        self.size = len(self.index)
+        return self.index.get_lines(matches, limit=limit)
+
+    def is_narrowed(self, term):
+        """Returns whether the matches of the term are all within the ones of
+        the previous term: it extends the previous term and no new tasks were
+        added since
+        """
+        return (self.term is not None and term.startswith(self.term)
+                and self.size == len(self.index))
+
+
+def get_grams(text):
+    """Returns the set of substrings of GRAM_SIZE characters of the text
+    """
+    return set([text[idx:idx + GRAM_SIZE]
+                for idx in range(len(text) - GRAM_SIZE + 1)])
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Keyboard input of the interactive UI.
+
+The terminal stays in raw mode for the whole session, and every read takes
+all the bytes pending at once. The bytes are split into keys:
+
+- control characters (Enter, Tab, Backspace, Ctrl-D, ...) are single keys
+- escape sequences (arrows, Home, End, Delete, ...) are single keys too,
+  with the name of the key
+- printable characters that arrive together, because they were pasted, are
+  a single Paste key with all of them, so they are applied as a single edit
+  instead of one key at a time
+
+Bracketed paste is enabled when supported by the terminal, so pasted text
+is also told apart from typing when it has control characters.
+"""
+
+import codecs
+import collections
+import contextlib
+import os
+import re
+import select
+
+from timelog_parse import ENCODING
+
+ESCAPE = "\x1b"
+
+UP = "up"
+DOWN = "down"
+RIGHT = "right"
+LEFT = "left"
+HOME = "home"
+END = "end"
+INSERT = "insert"
+DELETE = "delete"
+PAGE_UP = "page-up"
+PAGE_DOWN = "page-down"
+
+# Name of the keys, by the escape sequence they send
+SEQUENCES = {
+    "\x1b[A": UP,
+    "\x1b[B": DOWN,
+    "\x1b[C": RIGHT,
+    "\x1b[D": LEFT,
+    "\x1b[H": HOME,
+    "\x1b[F": END,
+    "\x1bOA": UP,
+    "\x1bOB": DOWN,
+    "\x1bOC": RIGHT,
+    "\x1bOD": LEFT,
+    "\x1bOH": HOME,
+    "\x1bOF": END,
+    "\x1b[1~": HOME,
+    "\x1b[2~": INSERT,
+    "\x1b[3~": DELETE,
+    "\x1b[4~": END,
+    "\x1b[5~": PAGE_UP,
+    "\x1b[6~": PAGE_DOWN,
+    "\x1b[7~": HOME,
+    "\x1b[8~": END,
+}
+SPECIAL_KEYS = frozenset([ESCAPE] + list(SEQUENCES.values()))
+
+PASTE_START = "\x1b[200~"
+PASTE_END = "\x1b[201~"
+BRACKETED_PASTE_ON = "\x1b[?2004h"
+BRACKETED_PASTE_OFF = "\x1b[?2004l"
+
+# CSI (ESC [ params final) and SS3 (ESC O final) sequences
+CSI_RE = re.compile(r"\x1b\[[0-9;?]*[@-~]")
+SS3_RE = re.compile(r"\x1bO[@-~]")
+
+# Seconds to wait for the rest of an escape sequence, before taking the ESC
+# as the Escape key
+ESCAPE_TIMEOUT = 0.05
+
+# Bytes read at once
+READ_SIZE = 4096
+
+# Key returned once the input is closed
+EOT = "\x04"
+
+
+class Paste(str):
+    """Text pasted, or typed at once, to be added to the input as a whole
+    """
+
+
+class KeyReader:
+    """Reads the keys from a file descriptor in raw mode, a burst at a time
+    """
+
+    def __init__(self, fd, encoding=ENCODING, timeout=ESCAPE_TIMEOUT):
+        self.fd = fd
+        self.timeout = timeout
+        self.decoder = codecs.getincrementaldecoder(encoding)("replace")
+        self.keys = collections.deque()
+        self.pending = ""
+
+    def read_key(self):
+        """Returns the next key, waiting for input if there are none left
+        """
+        while not self.keys:
+            self.keys.extend(self.read_burst())
+        return self.keys.popleft()
+
+    def has_pending(self, timeout=0):
+        """Returns whether there are keys left or input arrives within the
+        timeout, so more keys are coming
+        """
+        if self.keys:
+            return True
+        return bool(select.select([self.fd], [], [], timeout)[0])
+
+    def read_burst(self):
+        """Waits for input and returns the keys in all the bytes available
+        """
+        data = self.read_available()
+        if not data:
+            return [EOT]
+        text = self.pending + self.decoder.decode(data)
+
+        # Wait a little for the rest of a sequence split across reads
+        while is_incomplete(text):
+            data = self.read_available(self.timeout)
+            if not data:
+                break
+            text += self.decoder.decode(data)
+
+        keys, self.pending = parse_keys(text)
+        return keys
+
+    def read_available(self, timeout=None):
+        """Returns all the bytes available, waiting at most the timeout for
+        the first ones (forever by default). Returns b"" at end of input
+        """
+        ready = select.select([self.fd], [], [], timeout)[0]
+        if not ready:
+            return b""
+        chunks = []
+        while ready:
+            chunk = os.read(self.fd, READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            ready = select.select([self.fd], [], [], 0)[0]
+        return b"".join(chunks)
+
+
+def parse_keys(text):
+    """Returns a tuple (keys, rest) with the keys in the text, and the text of
+    a bracketed paste not finished yet
+    """
+    keys = []
+    pos = 0
+    while pos < len(text):
+        char = text[pos]
+        if text.startswith(PASTE_START, pos):
+            end = text.find(PASTE_END, pos)
+            if end < 0:
+                return keys, text[pos:]
+            keys.append(Paste(text[pos + len(PASTE_START):end]))
+            pos = end + len(PASTE_END)
+        elif char == ESCAPE:
+            match = CSI_RE.match(text, pos) or SS3_RE.match(text, pos)
+            if match is None:
+                keys.append(ESCAPE)
+                pos += 1
+            else:
+                keys.append(SEQUENCES.get(match.group(), match.group()))
+                pos = match.end()
+        elif is_control(char):
+            keys.append(char)
+            pos += 1
+        else:
+            end = pos + 1
+            while end < len(text) and not is_control(text[end]):
+                end += 1
+            run = text[pos:end]
+            keys.append(len(run) > 1 and Paste(run) or run)
+            pos = end
+    return keys, ""
+
+
+def is_control(char):
+    return char < " " or char == "\x7f"
+
+
+def is_incomplete(text):
+    """Returns whether the text ends with the beginning of an escape sequence
+    """
+    start = text.rfind(ESCAPE)
+    if start < 0:
+        return False
+    tail = text[start:]
+    if tail in (ESCAPE, "\x1b[", "\x1bO"):
+        return True
+    return tail.startswith("\x1b[") and not CSI_RE.match(tail)
+
+
+def is_paste(key):
+    return isinstance(key, Paste)
+
+
+def is_special(key):
+    """Returns whether the key is the Escape key or sends an escape sequence
+    """
+    return key in SPECIAL_KEYS or key.startswith(ESCAPE)
+
+
+@contextlib.contextmanager
+def bracketed_paste(stream):
+    """Asks the terminal to mark the text pasted within the block
+    """
+    stream.write(BRACKETED_PASTE_ON)
+    stream.flush()
+    try:
+        yield
+    finally:
+        stream.write(BRACKETED_PASTE_OFF)
+        stream.flush()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Delivery of email messages through a small pool of SMTP connections.
+
+Connections are authenticated once and reused for many messages. Messages
+are sent concurrently, with as many workers as connections in the pool, and
+transient failures (disconnections, timeouts, 4xx replies) are retried with
+an exponential backoff. The time spent on each message is reported back.
+"""
+
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Delivery:
+    """Outcome of the delivery of a single message
+    """
+    __slots__ = ("message", "recipients", "seconds", "attempts", "error")
+
+    def __init__(self, message, recipients):
+        self.message = message
+        self.recipients = recipients
+        self.seconds = 0
+        self.attempts = 0
+        self.error = None
+
+    def __repr__(self):
+        status = self.error and "failed: {}".format(self.error) or "sent"
+        return "<Delivery '{}' {} in {:.3f}s ({} attempts)>".format(
+            self.message["Subject"], status, self.seconds, self.attempts)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class SMTPPool:
+    """Pool of authenticated SMTP connections, created on demand up to size.
+    The connect function can be replaced, e.g. to use a local SMTP server
+    """
+
+    def __init__(self, host, port, user=None, password=None, size=2,
+                 timeout=30, connect=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.connect = connect or self.open_connection
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open_connection(self):
+        """Returns a new connection to the server, logged in if required
+        """
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            discard(server)
+            raise
+        return server
+
+    def acquire(self):
+        """Returns an idle connection or a new one, waiting for a free slot
+        when all connections of the pool are in use
+        """
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            server = self.connect()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.connections.append(server)
+        return server
+
+    def release(self, server, broken=False):
+        """Returns the connection to the pool, or discards it if broken
+        """
+        if broken:
+            with self.lock:
+                if server in self.connections:
+                    self.connections.remove(server)
+            discard(server)
+        else:
+            self.idle.put(server)
+        self.slots.release()
+
+    def close(self):
+        """Closes all the connections of the pool
+        """
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+        while not self.idle.empty():
+            self.idle.get_nowait()
+        for server in connections:
+            try:
+                server.quit()
+            except Exception:
+                discard(server)
+
+
+def deliver(messages, pool, workers=None, retries=3, backoff=1.0,
+            sleep=time.sleep):
+    """Sends the (sender, recipients, message) tuples through the pool, with
+    at most workers messages at once (the size of the pool by default).
+    Returns a list of Delivery, in the same order as the messages
+    """
+    workers = workers or pool.size
+    messages = list(messages)
+    if not messages:
+        return []
+
+    def send(item):
+        return send_message(pool, item, retries=retries, backoff=backoff,
+                            sleep=sleep)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(send, messages))
+
+
+def send_message(pool, item, retries=3, backoff=1.0, sleep=time.sleep):
+    """Sends a single (sender, recipients, message) tuple, retrying up to the
+    number of retries passed-in when the failure is transient
+    """
+    sender, recipients, message = item
+    delivery = Delivery(message, recipients)
+    start = time.perf_counter()
+    while True:
+        delivery.attempts += 1
+        try:
+            server = pool.acquire()
+        except Exception as e:
+            delivery.error = e
+        else:
+            try:
+                server.sendmail(sender, recipients, message.as_string())
+                delivery.error = None
+                pool.release(server)
+            except Exception as e:
+                delivery.error = e
+                # The server replied, so the connection is still usable
+                replied = (smtplib.SMTPResponseException,
+                           smtplib.SMTPRecipientsRefused)
+                pool.release(server, broken=not isinstance(e, replied))
+
+        if delivery.ok or delivery.attempts > retries:
+            break
+        if not is_transient(delivery.error):
+            break
+        sleep(backoff * 2 ** (delivery.attempts - 1))
+
+    delivery.seconds = time.perf_counter() - start
+    return delivery
+
+
+def is_transient(error):
+    """Returns whether the error might not happen again if retried
+    """
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [r[0] for r in error.recipients.values()]
+        return bool(codes) and all([400 <= c < 500 for c in codes])
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # Socket errors and timeouts
+    return isinstance(error, OSError)
+
+
+def discard(server):
+    """Closes the connection without the QUIT handshake
+    """
+    try:
+        server.close()
+    except Exception:
+        pass
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import locale
+from datetime import date
+from datetime import datetime
+from functools import lru_cache
+
+# Format of the date that prefixes every line of the timelog file
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+# Width of the date prefix (YYYY-MM-DD HH:MM)
+DATE_WIDTH = 16
+
+# Separator between the date and the task, and position of the task
+SEPARATOR = ": "
+TASK_START = DATE_WIDTH + len(SEPARATOR)
+
+# Encoding of the log file, the same open() uses by default
+ENCODING = locale.getpreferredencoding(False)
+
+# Max number of distinct prefixes/days kept in memory
+CACHE_SIZE = 4096
+
+
+def parse_timestamp(line):
+    """Returns the datetime of the YYYY-MM-DD HH:MM prefix of the line. Raises
+    a ValueError when the line does not start with a valid date
+    """
+    return _parse_prefix(line[:DATE_WIDTH])
+
+
+def has_timestamp(line):
+    """Returns whether the line starts with a valid date
+    """
+    try:
+        parse_timestamp(line)
+        return True
+    except ValueError:
+        return False
+
+
+def is_start(line):
+    """Returns whether the line is a start task, ending with **
+    """
+    return line.strip().endswith("**")
+
+
+def get_task(line):
+    """Returns the text of the task, after the date. Lines without a valid
+    date are tasks already, and are returned stripped
+    """
+    if not has_timestamp(line):
+        return line.strip()
+    return line[TASK_START:]
+
+
+def to_minutes(task_date):
+    """Returns the number of minutes since 0001-01-01 of the datetime, seconds
+    are dropped
+    """
+    return (task_date.toordinal() * 1440 + task_date.hour * 60
+            + task_date.minute)
+
+
+def from_minutes(minutes):
+    """Returns the datetime for the minutes passed-in
+    """
+    day, minutes = divmod(minutes, 1440)
+    day = date.fromordinal(day)
+    return datetime(day.year, day.month, day.day, minutes // 60, minutes % 60)
+
+
+def format_minutes(minutes):
+    """Returns the minutes passed-in as a YYYY-MM-DD HH:MM string
+    """
+    day, minutes = divmod(minutes, 1440)
+    return "{} {:02d}:{:02d}".format(_format_day(day), minutes // 60,
+                                     minutes % 60)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_day(day):
+    return date.fromordinal(day).strftime("%Y-%m-%d")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_prefix(prefix):
+    """Returns the datetime for the prefix, reading the integers from their
+    fixed positions. Falls back to strptime for non fixed-width values
+    """
+    if not _is_fixed_width(prefix):
+        return datetime.strptime(prefix, DATE_FORMAT)
+    year, month, day = _parse_day(prefix[:10])
+    return datetime(year, month, day, int(prefix[11:13]), int(prefix[14:16]))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_day(prefix):
+    """Returns a tuple (year, month, day) for a YYYY-MM-DD prefix
+    """
+    return int(prefix[:4]), int(prefix[5:7]), int(prefix[8:10])
+
+
+def _is_fixed_width(prefix):
+    """Returns whether the prefix has the YYYY-MM-DD HH:MM layout, with ascii
+    digits only at the positions where numbers are expected
+    """
+    if len(prefix) != DATE_WIDTH:
+        return False
+    if prefix[4] != "-" or prefix[7] != "-":
+        return False
+    if prefix[10] != " " or prefix[13] != ":":
+        return False
+    digits = "".join([prefix[:4], prefix[5:7], prefix[8:10], prefix[11:13],
+                      prefix[14:]])
+    return digits.isascii() and digits.isdigit()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Streaming pipeline over the entries of a timelog, shared by timelog and
+report_count_hours:
+
+    read lines -> parse entries -> pair into intervals -> filter -> aggregate
+
+Every stage is a generator over the items of the previous one, so nothing
+is computed until the last stage asks for it and the stages can be freely
+combined, e.g. the billable seconds of each project since a date:
+
+    entries = parse(read_lines(log_file))
+    intervals = skip_starts(pair(entries, since=since))
+    group_seconds(only_billable(intervals, is_billable), by_project)
+
+Readers that find the date of every line anyway (date ranges of the log
+file, the EntryStore) yield the entries already parsed. The rules of a
+line (start tasks, the task after the date) come from timelog_parse, so
+the EntryStore and the database follow them too.
+"""
+
+import itertools
+from datetime import timedelta
+
+from timelog_parse import ENCODING
+from timelog_parse import TASK_START
+from timelog_parse import get_task
+from timelog_parse import is_start
+from timelog_parse import parse_timestamp
+from timelog_parse import to_minutes
+from timelog_reader import ceil_minutes
+from timelog_reader import read_range as read_log_range
+from timelog_reader import scan_lines
+from timelog_store import UNDATED
+
+# How date ranges of the log file are read, see read_range
+SEEK = "seek"
+MMAP = "mmap"
+
+
+class Entry:
+    """Dated line of the log file
+    """
+
+    __slots__ = ("date", "line")
+
+    def __init__(self, date, line):
+        self.date = date
+        self.line = line
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.line)
+
+    @property
+    def star(self):
+        return is_start(self.line)
+
+    @property
+    def task(self):
+        # Entries are always dated
+        return self.line[TASK_START:]
+
+    @property
+    def project(self):
+        return get_project(self.line)
+
+    @property
+    def detail(self):
+        return get_detail(self.line)
+
+
+class Interval(Entry):
+    """Entry with the moment the task started, the date of the entry before
+    """
+
+    __slots__ = ("start", )
+
+    def __init__(self, start, entry):
+        Entry.__init__(self, entry.date, entry.line)
+        self.start = start
+
+    @property
+    def seconds(self):
+        return (self.date - self.start).total_seconds()
+
+
+def get_project(line):
+    """Returns the project of the task, the text before the first colon, or
+    None if the task has no project or ends with *
+    """
+    parts = line[TASK_START:].split(":")
+    if len(parts) < 2:
+        return None
+    project = parts[0]
+    if project.endswith("*"):
+        return None
+    return project
+
+
+def get_detail(line):
+    """Returns the task without the project, or None if it has no project
+    """
+    parts = line[TASK_START:].split(":")
+    if len(parts) < 2:
+        return None
+    return "".join(parts[1:]).strip()
+
+
+# Read
+
+def read_lines(log_file):
+    """Yields the stripped, non-blank lines of the archived segments of the
+    log file and then the ones of the log file, in file order
+    """
+    from timelog_archive import get_segments
+    from timelog_archive import read_segment_lines
+    for segment_file, size in get_segments(log_file):
+        for line in read_segment_lines(segment_file, size):
+            yield line
+    with open(log_file, encoding=ENCODING, errors="replace") as reader:
+        for line in reader:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def read_range(log_file, since=None, until=None, scanner=SEEK):
+    """Yields the entries of the archived segments and the log file dated
+    between since and until, both included, in file order. With SEEK the
+    start of the range is bisected in the log file, with MMAP the whole file
+    is scanned as bytes
+    """
+    from timelog_archive import read_segments_range
+    if scanner == MMAP:
+        dated = scan_lines(log_file, since, until)
+    else:
+        dated = read_log_range(log_file, since, until)
+    dated = itertools.chain(read_segments_range(log_file, since, until),
+                            dated)
+    return to_entries(dated)
+
+
+def read_store(store, since=None, until=None, strict=False):
+    """Yields the entries of the EntryStore dated between since and until,
+    both included. Dates are compared as minutes before building them, and
+    entries older than the sorted part of the store are not read. Entries
+    without a valid date are skipped, or raise a ValueError when strict
+    """
+    first = 0
+    low = None
+    if since is not None:
+        low = ceil_minutes(since)
+        first = store.find(low)
+    high = until is not None and to_minutes(until)
+    entries = zip(store.minutes[first:], store.flags[first:])
+    for idx, (task_minutes, flags) in enumerate(entries, first):
+        if flags & UNDATED:
+            if strict:
+                parse_timestamp(store.get_line(idx))
+            continue
+        if low is not None and task_minutes < low:
+            continue
+        if high is not False and task_minutes > high:
+            continue
+        yield Entry(store.get_date(idx), store.get_line(idx))
+
+
+# Parse
+
+def parse(lines, strict=False):
+    """Yields the entries of the lines. Lines without a valid date are
+    skipped, or raise a ValueError when strict
+    """
+    for line in lines:
+        try:
+            task_date = parse_timestamp(line)
+        except ValueError:
+            if strict:
+                raise
+            continue
+        yield Entry(task_date, line)
+
+
+def to_entries(dated):
+    """Yields the entries of (datetime, line) tuples
+    """
+    for task_date, line in dated:
+        yield Entry(task_date, line)
+
+
+# Pair
+
+def pair(entries, since=None):
+    """Yields the intervals of the entries, each one starting at the date of
+    the entry before it, as the time of every task is counted since the
+    previous one. Start tasks are paired too, they end the break before
+    them. With since, entries older than it or than the entry before them
+    are skipped, so intervals are never negative and the first one starts
+    at since. Without since, the first entry starts at its own date
+    """
+    start = since
+    for entry in entries:
+        if since is not None and entry.date < start:
+            continue
+        if start is None:
+            start = entry.date
+        yield Interval(start, entry)
+        start = entry.date
+
+
+# Filter
+
+def in_range(items, since=None, until=None):
+    """Yields the entries or intervals dated between since and until, both
+    included
+    """
+    for item in items:
+        if since is not None and item.date < since:
+            continue
+        if until is not None and item.date > until:
+            continue
+        yield item
+
+
+def skip_starts(items):
+    """Yields the entries or intervals that are not start tasks
+    """
+    for item in items:
+        if not item.star:
+            yield item
+
+
+def only_tasks(items):
+    """Yields the entries or intervals with some text after the date
+    """
+    for item in items:
+        if len(item.line) > TASK_START:
+            yield item
+
+
+def only_projects(items, projects):
+    """Yields the entries or intervals of the projects passed-in, compared
+    without case
+    """
+    projects = set([p.strip().upper() for p in projects])
+    for item in items:
+        project = item.project
+        if project is not None and project.strip().upper() in projects:
+            yield item
+
+
+def only_billable(items, is_billable):
+    """Yields the entries or intervals whose line is billable, as told by
+    the function passed-in. The function is called once per distinct task
+    """
+    billable_tasks = {}
+    for item in items:
+        task = item.task
+        billable = billable_tasks.get(task)
+        if billable is None:
+            billable = is_billable(item.line)
+            billable_tasks[task] = billable
+        if billable:
+            yield item
+
+
+def only_worked(intervals):
+    """Yields the intervals of a project with some time worked
+    """
+    for interval in intervals:
+        if interval.project and interval.seconds > 0:
+            yield interval
+
+
+# Aggregate
+
+def total_seconds(intervals):
+    return sum([interval.seconds for interval in intervals])
+
+
+def group_seconds(intervals, key):
+    """Returns a dict with the seconds of the intervals added by the value of
+    the key function for each of them
+    """
+    totals = {}
+    for interval in intervals:
+        group = key(interval)
+        totals[group] = totals.get(group, 0) + interval.seconds
+    return totals
+
+
+def by_day(item):
+    return item.date.date()
+
+
+def by_week(item):
+    """Returns the date of the monday of the week of the item
+    """
+    day = item.date.date()
+    return day - timedelta(days=day.weekday())
+
+
+def by_project(item):
+    project = item.project
+    return project and project.strip() or None
+
+
+def by_task(item):
+    return item.task
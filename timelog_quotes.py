@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Quotes for the header, fetched in the background.
+
+A quote is requested on a daemon thread with a strict deadline for the whole
+request, so startup never waits on the network. Fetched quotes are kept in a small pool on disk:
+when the header is rendered, the fresh quote is shown if it already arrived,
+otherwise the least recently shown quote of the pool. Quotes older than the
+TTL are evicted, and so are the least recently shown ones once the pool is
+full.
+"""
+
+import json
+import threading
+import time
+
+from timelog_files import atomic_write
+
+QUOTE_URL = "https://api.quotable.io/random"
+
+# Seconds to wait for the quote service, for the whole request
+QUOTE_TIMEOUT = 2.0
+
+# Max number of quotes kept and seconds until they expire
+POOL_SIZE = 50
+POOL_TTL = 30 * 24 * 60 * 60
+
+
+class QuotePool:
+    """Quotes fetched before, stored as JSON
+    """
+
+    def __init__(self, path, size=POOL_SIZE, ttl=POOL_TTL):
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.quotes = self.load()
+
+    def __len__(self):
+        return len(self.quotes)
+
+    def load(self):
+        """Returns the list of quotes stored, each one a dict with the content,
+        author, fetched and used times
+        """
+        try:
+            with open(self.path) as reader:
+                quotes = json.load(reader)
+        except (OSError, ValueError):
+            return []
+        if not isinstance(quotes, list):
+            return []
+        return [q for q in quotes if isinstance(q, dict) and "content" in q]
+
+    def save(self):
+        """Stores the quotes, silently giving up if the file cannot be written
+        """
+        try:
+            with self.lock:
+                atomic_write(self.path, json.dumps(self.quotes).encode())
+        except OSError:
+            pass
+
+    def add(self, quote, now=None):
+        """Adds a quote just fetched, evicting expired or old ones
+        """
+        now = now or time.time()
+        with self.lock:
+            quotes = [q for q in self.quotes
+                      if q["content"] != quote["content"]]
+            quotes.append({
+                "content": quote["content"],
+                "author": quote.get("author"),
+                "fetched": now,
+                "used": now,
+            })
+            self.quotes = quotes
+            self.evict(now)
+
+    def pick(self, now=None):
+        """Returns the least recently used quote that has not expired, and
+        marks it as used. Returns None if the pool is empty
+        """
+        now = now or time.time()
+        with self.lock:
+            self.evict(now)
+            if not self.quotes:
+                return None
+            quote = min(self.quotes, key=lambda q: q["used"])
+            quote["used"] = now
+            return quote
+
+    def evict(self, now):
+        """Drops the expired quotes, and the least recently used ones over the
+        size of the pool
+        """
+        quotes = [q for q in self.quotes if now - q["fetched"] < self.ttl]
+        quotes.sort(key=lambda q: q["used"], reverse=True)
+        self.quotes = quotes[:self.size]
+
+
+class QuoteFetcher:
+    """Fetches a quote on a background thread and adds it to the pool
+    """
+
+    def __init__(self, pool, url=QUOTE_URL, timeout=QUOTE_TIMEOUT):
+        self.pool = pool
+        self.url = url
+        self.timeout = timeout
+        self.quote = None
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        """Starts fetching the quote, without waiting for it
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            quote = fetch_quote(self.url, self.timeout)
+        except Exception as e:
+            self.error = e
+            return
+        self.pool.add(quote)
+        self.pool.save()
+        self.quote = quote
+
+    def get(self, wait=0):
+        """Returns the quote fetched if ready, waiting at most the seconds
+        passed-in, or one of the pool otherwise. None if there are none
+        """
+        if self.thread is not None and wait:
+            self.thread.join(wait)
+        quote = self.quote
+        if quote is None:
+            quote = self.pool.pick()
+            self.pool.save()
+        return quote
+
+
+def fetch_quote(url=QUOTE_URL, timeout=QUOTE_TIMEOUT):
+    """Returns a dict with the content and author of a random quote. Raises
+    a TimeoutError when the whole request, from the name lookup to the last
+    byte, takes more than the timeout: the timeouts of requests only limit
+    each connect and read, so the request runs on a daemon thread left
+    behind when late
+    """
+    result = {}
+
+    def request():
+        try:
+            result["quote"] = request_quote(url, timeout)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=request, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError("No quote after {} seconds".format(timeout))
+    if "error" in result:
+        raise result["error"]
+    return result["quote"]
+
+
+def request_quote(url, timeout):
+    """Returns a dict with the content and author of the quote of the service
+    {"_id":"rHScBNdsDKp","tags":["film"],"author":"Woody Allen",
+    "content":"I took a speed reading course and read 'War and Peace' in
+    twenty minutes. It involves Russia.","length":93}
+    """
+    import requests
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    res = response.json()
+    if isinstance(res, list):
+        res = res[0]
+    if not res.get("content"):
+        raise ValueError("No quote in the response")
+    return {"content": res.get("content"), "author": res.get("author")}
+
+
+def format_quote(quote):
+    return "{}\n.. {}".format(quote["content"], quote.get("author"))
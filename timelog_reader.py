@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Readers of the timelog file that do not load the whole file in memory
+"""
+
+import mmap
+import os
+from bisect import bisect_right
+
+from timelog_cache import CACHE_VERSION
+from timelog_cache import get_anchor
+from timelog_cache import get_head
+from timelog_cache import is_appended
+from timelog_cache import is_unchanged
+from timelog_cache import read_cache
+from timelog_cache import write_cache
+from timelog_files import get_sidecar_file
+from timelog_files import read_complete
+from timelog_parse import DATE_FORMAT
+from timelog_parse import DATE_WIDTH
+from timelog_parse import ENCODING
+from timelog_parse import format_minutes
+from timelog_parse import parse_timestamp
+from timelog_parse import to_minutes
+
+# Number of bytes read at once when reading the file backwards
+BLOCK_SIZE = 64 * 1024
+
+# Bump whenever the format of the stored unsorted ranges changes
+SORTED_VERSION = 2
+
+
+def read_lines_reversed(log_file, block_size=BLOCK_SIZE):
+    """Yields the non-blank lines of the log file, stripped and newest first.
+    The file is read backwards in blocks, so the cost depends on the number
+    of lines consumed rather than on the size of the file
+    """
+    with open(log_file, "rb") as reader:
+        position = reader.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            reader.seek(position)
+            lines = (reader.read(size) + remainder).split(b"\n")
+
+            # The first line might continue in the previous block
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                line = line.decode(ENCODING).strip()
+                if line:
+                    yield line
+
+        line = remainder.decode(ENCODING).strip()
+        if line:
+            yield line
+
+
+def read_range(log_file, since=None, until=None):
+    """Yields (datetime, line) tuples for the stripped lines of the log file
+    dated between since and until, both included, in file order.
+
+    The file is expected to be sorted by date, and the ranges where it is
+    not come from get_unsorted_ranges. Those ranges are always read line by
+    line, so lines out of order anywhere in the file are found. The start of
+    the range is bisected in the sorted lines between them, and once a
+    sorted line after the range is found only the unsorted ranges left are
+    read
+    """
+    ranges = get_unsorted_ranges(log_file)
+    with open(log_file, "rb") as reader:
+        offset = 0
+        if since is not None:
+            offset = find_offset(reader, since, ranges)
+
+        after = False
+        for start, end in ranges:
+            # Sorted lines before the unsorted range, from the first one in
+            # the date range on
+            if start > offset and not after:
+                for task_date, line in read_dated(reader, offset, start):
+                    if until is not None and task_date > until:
+                        # The rest of the sorted lines are after it too
+                        after = True
+                        break
+                    yield task_date, line
+
+            for task_date, line in read_dated(reader, start, end):
+                if is_in_range(task_date, since, until):
+                    yield task_date, line
+            if end is not None:
+                offset = max(offset, end)
+
+
+def read_dated(reader, start, end=None):
+    """Yields (datetime, line) tuples for the stripped, dated lines of the
+    file between the offsets start and end, or the end of the file
+    """
+    offset = reader.seek(start)
+    while end is None or offset < end:
+        line = reader.readline()
+        if not line:
+            break
+        offset += len(line)
+        line = line.decode(ENCODING).strip()
+        task_date = get_line_date(line)
+        if task_date is not None:
+            yield task_date, line
+
+
+def is_in_range(task_date, since=None, until=None):
+    if since is not None and task_date < since:
+        return False
+    return until is None or task_date <= until
+
+
+def find_offset(reader, since, ranges):
+    """Returns the offset of the first sorted line dated since the date
+    passed-in, bisecting the sorted lines between the unsorted ranges.
+    Returns the start of the last range, the lines not checked yet, when all
+    the sorted lines are older
+    """
+    end = ranges[-1][0]
+    low, high = 0, end
+    while low < high:
+        middle = (low + high) // 2
+        start, task_date = get_sorted_line(reader, middle, ranges, end)
+        if task_date is None or task_date >= since:
+            high = middle
+        else:
+            low = middle + 1
+
+    start = get_sorted_line(reader, low, ranges, end)[0]
+    if start is None:
+        return end
+    return start
+
+
+def get_sorted_line(reader, offset, ranges, end):
+    """Returns a tuple (offset, datetime) for the first dated line starting
+    at the offset or after, and before end, that is not in an unsorted
+    range. Returns (None, None) when there are no such lines
+    """
+    starts = [r[0] for r in ranges]
+    start, task_date = get_dated_line(reader, offset)
+    while start is not None and start < end:
+        idx = bisect_right(starts, start) - 1
+        if idx < 0 or ranges[idx][1] is None or ranges[idx][1] <= start:
+            return start, task_date
+        start, task_date = get_dated_line(reader, ranges[idx][1])
+    return None, None
+
+
+def get_sorted_file(log_file):
+    """Returns the path where the unsorted ranges of the log file are stored
+    """
+    return get_sidecar_file(log_file, ".{name}.sorted")
+
+
+def get_unsorted_ranges(log_file):
+    """Returns a list of (start, end) tuples with the byte ranges of the log
+    file that are not sorted by date, in file order. The dated lines out of
+    them are sorted, also across ranges, so they can be bisected. The last
+    range is always (offset, None): the lines after the last complete one.
+
+    A dated line older than the sorted lines before it is out of order. When
+    it is not older than the sorted line before the last one, that last line
+    is taken as the one out of order instead, so a single line dated too far
+    in the future does not leave the rest of the file unsorted.
+
+    The ranges are stored next to the log file, keyed as the cache of
+    timelog_cache, so only the bytes appended since the last call are
+    checked
+    """
+    sorted_file = get_sorted_file(log_file)
+    record = read_cache(sorted_file)
+    if record and record.get("sorted") != SORTED_VERSION:
+        record = None
+    with open(log_file, "rb") as reader:
+        stat = os.fstat(reader.fileno())
+        if not record or not is_unchanged(record, stat):
+            if not record or not is_appended(record, stat, reader):
+                record = get_empty_record()
+
+            data, end = read_complete(reader, record["offset"])
+            find_unsorted(data[:end], record["offset"], record)
+            record["offset"] += end
+            record["head"] = get_head(reader, record["offset"])
+            record["anchor"] = get_anchor(reader, record["offset"])
+
+            stat = os.fstat(reader.fileno())
+            record.update({
+                "inode": stat.st_ino,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+            })
+            write_cache(sorted_file, record)
+
+    return record["unsorted"] + [(record["offset"], None)]
+
+
+def get_empty_record():
+    return {
+        "version": CACHE_VERSION,
+        "sorted": SORTED_VERSION,
+        "inode": None,
+        "size": 0,
+        "mtime": None,
+        "offset": 0,
+        "head": None,
+        "anchor": None,
+        # Unsorted ranges, date prefixes of the last two sorted lines and
+        # the range of the last one
+        "unsorted": [],
+        "last": None,
+        "previous": None,
+        "last_line": None,
+    }
+
+
+def find_unsorted(data, offset, record):
+    """Adds the ranges of the lines of the bytes, read from the offset of the
+    file, that are out of order to the unsorted ranges of the record, as
+    described in get_unsorted_ranges.
+
+    Date prefixes are compared as bytes, as scan_lines does. Prefixes with
+    the layout of a date but not a valid one are compared too, which can
+    only make the unsorted ranges longer
+    """
+    last, previous = record["last"], record["previous"]
+    for line in data.split(b"\n"):
+        start = offset
+        offset += len(line) + 1
+        prefix = line.strip()[:DATE_WIDTH]
+        if not is_date_prefix(prefix):
+            task_date = get_line_date(line.decode(ENCODING).strip())
+            prefix = task_date and task_date.strftime(DATE_FORMAT).encode()
+        if not prefix:
+            continue
+
+        if last is None or prefix >= last:
+            previous, last = last, prefix
+            record["last_line"] = (start, offset)
+        elif previous is None or prefix >= previous:
+            # The last sorted line is the one out of order
+            add_range(record["unsorted"], *record["last_line"])
+            last = prefix
+            record["last_line"] = (start, offset)
+        else:
+            add_range(record["unsorted"], start, offset)
+    record["last"], record["previous"] = last, previous
+
+
+def add_range(ranges, start, end):
+    """Adds the range to the sorted list of ranges, joined with the ones
+    right before and after it
+    """
+    idx = bisect_right(ranges, (start, end))
+    ranges.insert(idx, (start, end))
+    if idx + 1 < len(ranges) and ranges[idx + 1][0] == end:
+        ranges[idx] = (start, ranges.pop(idx + 1)[1])
+    if idx > 0 and ranges[idx - 1][1] == start:
+        ranges[idx - 1] = (ranges[idx - 1][0], ranges.pop(idx)[1])
+
+
+def get_line_start(reader, offset):
+    """Returns the offset where the line that follows the offset begins
+    """
+    if offset <= 0:
+        return 0
+    reader.seek(offset - 1)
+    reader.readline()
+    return reader.tell()
+
+
+def get_dated_line(reader, offset):
+    """Returns a tuple (offset, datetime) for the first line with a valid date
+    starting at the offset or after. Blank lines, lines without date and the
+    line the offset falls in the middle of are skipped. Returns (None, None)
+    when there are no dated lines after the offset
+    """
+    # Re-sync with the beginning of the next line
+    reader.seek(get_line_start(reader, offset))
+
+    while True:
+        start = reader.tell()
+        line = reader.readline()
+        if not line:
+            return None, None
+        task_date = get_line_date(line.decode(ENCODING).strip())
+        if task_date is not None:
+            return start, task_date
+
+
+def get_line_date(line):
+    """Returns the datetime of the line or None if the line has no date
+    """
+    try:
+        return parse_timestamp(line)
+    except ValueError:
+        return None
+
+
+def scan_lines(log_file, since=None, until=None):
+    """Yields (datetime, line) tuples for the stripped lines of the log file
+    dated between since and until, both included, in file order.
+
+    The file is memory-mapped and scanned as raw bytes: newlines are found
+    with mmap.find and the YYYY-MM-DD HH:MM prefix of each line is compared
+    as bytes against the bounds, which sort the same way as dates. Only the
+    lines in the range are decoded and parsed
+    """
+    low = since is not None and format_minutes(ceil_minutes(since)).encode()
+    high = until is not None and format_minutes(to_minutes(until)).encode()
+    with open(log_file, "rb") as reader:
+        size = os.fstat(reader.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            find = data.find
+            start = 0
+            while start < size:
+                end = find(b"\n", start)
+                if end < 0:
+                    end = size
+                prefix = data[start:start + DATE_WIDTH]
+                if is_date_prefix(prefix):
+                    if (low and prefix < low) or (high and prefix > high):
+                        start = end + 1
+                        continue
+                    line = data[start:end].decode(ENCODING).strip()
+                else:
+                    # Blank, indented or oddly formatted line
+                    line = data[start:end].decode(ENCODING).strip()
+                    if not line:
+                        start = end + 1
+                        continue
+                start = end + 1
+
+                task_date = get_line_date(line)
+                if task_date is None:
+                    continue
+                if since is not None and task_date < since:
+                    continue
+                if until is not None and task_date > until:
+                    continue
+                yield task_date, line
+
+
+def is_date_prefix(prefix):
+    """Returns whether the bytes have the YYYY-MM-DD HH:MM layout, so they can
+    be compared with other dates as bytes
+    """
+    return (len(prefix) == DATE_WIDTH and prefix[4] == 45 and prefix[7] == 45
+            and prefix[10] == 32 and prefix[13] == 58)
+
+
+def ceil_minutes(task_date):
+    """Returns the minutes of the datetime, rounded up when it has seconds
+    """
+    minutes = to_minutes(task_date)
+    if task_date.second or task_date.microsecond:
+        minutes += 1
+    return minutes
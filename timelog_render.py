@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Frame-buffered output for the interactive UI.
+
+Everything written while a frame is open is kept in a buffer and written to
+the terminal at once when the outermost frame ends, so a whole screen
+(header, summary, matches and prompt) costs a single write and flush.
+
+The text typed after the prompt is tracked too: editing it only sends the
+ANSI sequences to move the cursor back to the first changed character,
+clear up to the end of the line and write the new characters from there.
+A few lines can be displayed below the prompt line while typing, and the
+cursor is moved back to the prompt after them.
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+
+# Move the cursor n columns left, clear up to the end of the line
+CURSOR_LEFT = "\x1b[{}D"
+CLEAR_LINE_END = "\x1b[K"
+CLEAR_LINE = "\x1b[2K\r"
+# Move the cursor n lines up or n columns right, clear up to the end of the
+# screen
+CURSOR_UP = "\x1b[{}A"
+CURSOR_RIGHT = "\x1b[{}C"
+CLEAR_SCREEN_END = "\x1b[J"
+
+
+class Renderer:
+    """Buffers the output written within frames, and the prompt line
+    """
+
+    def __init__(self, stream=None):
+        # sys.stdout by default, looked up on every flush
+        self.stream = stream
+        self.parts = []
+        self.depth = 0
+        # Prompt and text currently displayed in the prompt line
+        self.prefix = ""
+        self.line = ""
+        # Number of lines displayed below the prompt line
+        self.below = 0
+
+    @contextlib.contextmanager
+    def frame(self):
+        """Keeps everything written in the block in the buffer, written at
+        once when the outermost frame ends
+        """
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.flush()
+
+    def write(self, text):
+        self.parts.append(text)
+        if not self.depth:
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        stream = self.stream or sys.stdout
+        stream.write("".join(self.parts))
+        stream.flush()
+        self.parts = []
+
+    def prompt(self, prefix):
+        """Writes the prompt, starting a new prompt line with no text
+        """
+        self.write(prefix)
+        self.prefix = prefix
+        self.line = ""
+        self.below = 0
+
+    def update_line(self, text):
+        """Displays the text passed-in after the prompt, only redrawing from
+        the first character that changed
+        """
+        old = self.line
+        self.line = text
+        if len(self.prefix) + max(len(old), len(text)) >= get_columns():
+            # The line wraps, the cursor cannot be moved back across lines
+            self.write("{}{}{}".format(CLEAR_LINE, self.prefix, text))
+            return
+
+        common = len(os.path.commonprefix([old, text]))
+        output = []
+        if common < len(old):
+            output.append(CURSOR_LEFT.format(len(old) - common))
+            output.append(CLEAR_LINE_END)
+        output.append(text[common:])
+        self.write("".join(output))
+
+
+    def update_below(self, lines):
+        """Displays the lines passed-in below the prompt line, replacing the
+        ones displayed before, and moves the cursor back after the text. The
+        lines must fit in the width of the terminal
+        """
+        if not lines and not self.below:
+            return
+        output = [CLEAR_SCREEN_END]
+        for line in lines:
+            output.append("\n")
+            output.append(line)
+        if lines:
+            output.append(CURSOR_UP.format(len(lines)))
+        output.append("\r")
+        column = len(self.prefix) + len(self.line)
+        if column:
+            output.append(CURSOR_RIGHT.format(column))
+        self.below = len(lines)
+        self.write("".join(output))
+
+    def clear_below(self):
+        self.update_below([])
+
+
+def get_columns():
+    return shutil.get_terminal_size().columns
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compact in-memory store of the entries of a timelog file.
+
+Instead of a list of raw strings, every entry is kept as:
+
+- the date as minutes since 0001-01-01, in an array('l')
+- the id of the task (the text after the date), interned in a list
+- a flag byte, for start tasks and lines without a valid date
+
+Task texts are interned and mapped to the id of their project, so entries
+that repeat a task share the same string. Lines that cannot be rebuilt from
+their date and task (no date or unusual separator) are kept verbatim.
+"""
+
+from array import array
+from bisect import bisect_left
+
+from timelog_parse import SEPARATOR
+from timelog_parse import TASK_START
+from timelog_parse import format_minutes
+from timelog_parse import from_minutes
+from timelog_parse import is_start
+from timelog_parse import parse_timestamp
+from timelog_parse import to_minutes
+
+# Flags of the entries. Whether a task is billable is not one of them: it
+# depends on the non-billable projects of the config, and a flag saved in the
+# cache of the entries would be stale once they change. It is found per task
+# id instead, from the project of the task
+STAR = 1
+UNDATED = 2
+IRREGULAR = 4
+
+
+class EntryStore:
+    """Array-backed store of the entries of a timelog file, in file order
+    """
+
+    def __init__(self):
+        self.minutes = array("l")
+        self.task_ids = array("l")
+        self.flags = bytearray()
+        # task id -> task text and project id
+        self.tasks = []
+        self.task_projects = array("l")
+        # project id -> project name
+        self.projects = []
+        # entry position -> raw line, for lines that cannot be rebuilt
+        self.raw = {}
+        # number of entries at the beginning that are dated and sorted
+        self.sorted_until = 0
+        self._task_ids = {}
+        self._project_ids = {}
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("entry index out of range")
+        return EntryView(self, idx)
+
+    def __iter__(self):
+        """Yields (date, line) tuples, date is None for lines without date
+        """
+        for idx in range(len(self)):
+            yield self.get_date(idx), self.get_line(idx)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_task_ids"]
+        del state["_project_ids"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._task_ids = dict([(t[1], t[0]) for t in enumerate(self.tasks)])
+        self._project_ids = dict([(p[1], p[0])
+                                  for p in enumerate(self.projects)])
+
+    def copy(self):
+        """Returns a copy of the store that can be extended independently
+        """
+        other = EntryStore()
+        other.minutes = array("l", self.minutes)
+        other.task_ids = array("l", self.task_ids)
+        other.flags = bytearray(self.flags)
+        other.tasks = list(self.tasks)
+        other.task_projects = array("l", self.task_projects)
+        other.projects = list(self.projects)
+        other.raw = dict(self.raw)
+        other.sorted_until = self.sorted_until
+        other._task_ids = dict(self._task_ids)
+        other._project_ids = dict(self._project_ids)
+        return other
+
+    def extend(self, other):
+        """Adds all the entries of another store after the entries of this one
+        """
+        offset = len(self)
+        task_ids = [self.get_task_id(task) for task in other.tasks]
+
+        # The sorted part only goes on if both stores are sorted up to here
+        sorted_until = 0
+        if self.sorted_until == offset:
+            sorted_until = other.sorted_until
+            if sorted_until and offset and self.minutes[-1] > other.minutes[0]:
+                sorted_until = 0
+
+        self.minutes.extend(other.minutes)
+        self.task_ids.extend([task_ids[idx] for idx in other.task_ids])
+        self.flags.extend(other.flags)
+        for idx, line in other.raw.items():
+            self.raw[offset + idx] = line
+        self.sorted_until += sorted_until
+
+    def add(self, line):
+        """Adds a stripped, non-blank line of the log file
+        """
+        flags = 0
+        if is_start(line):
+            flags |= STAR
+        try:
+            minutes = to_minutes(parse_timestamp(line))
+        except ValueError:
+            minutes = 0
+            flags |= UNDATED | IRREGULAR
+            task = line
+        else:
+            task = line[TASK_START:]
+            prefix = "{}{}".format(format_minutes(minutes), SEPARATOR)
+            if not task or not line.startswith(prefix):
+                flags |= IRREGULAR
+
+        if flags & IRREGULAR:
+            self.raw[len(self)] = line
+
+        # Keep track of the sorted part, where entries can be bisected
+        if self.sorted_until == len(self) and not flags & UNDATED:
+            if not self.minutes or self.minutes[-1] <= minutes:
+                self.sorted_until += 1
+
+        self.minutes.append(minutes)
+        self.task_ids.append(self.get_task_id(task))
+        self.flags.append(flags)
+
+    def find(self, minutes):
+        """Returns the position from which entries have to be read to get all
+        the entries dated since the minutes passed-in. All the entries before
+        that position are older. Entries after it might be older too when the
+        log is not sorted
+        """
+        return bisect_left(self.minutes, minutes, 0, self.sorted_until)
+
+    def get_task_id(self, task):
+        """Returns the id of the task text, interning it if new
+        """
+        task_id = self._task_ids.get(task)
+        if task_id is None:
+            task_id = len(self.tasks)
+            self._task_ids[task] = task_id
+            self.tasks.append(task)
+            project = task.split(":")[0].strip()
+            self.task_projects.append(self.get_project_id(project))
+        return task_id
+
+    def get_project_id(self, project):
+        """Returns the id of the project, interning it if new
+        """
+        project_id = self._project_ids.get(project)
+        if project_id is None:
+            project_id = len(self.projects)
+            self._project_ids[project] = project_id
+            self.projects.append(project)
+        return project_id
+
+    def get_line(self, idx):
+        """Returns the line of the entry at the given position
+        """
+        if self.flags[idx] & IRREGULAR:
+            return self.raw[idx]
+        return "{}{}{}".format(format_minutes(self.minutes[idx]), SEPARATOR,
+                               self.tasks[self.task_ids[idx]])
+
+    def get_date(self, idx):
+        """Returns the datetime of the entry at the given position or None
+        """
+        if self.flags[idx] & UNDATED:
+            return None
+        return from_minutes(self.minutes[idx])
+
+    def get_task(self, idx):
+        return self.tasks[self.task_ids[idx]]
+
+    def get_project(self, idx):
+        return self.projects[self.task_projects[self.task_ids[idx]]]
+
+    def is_star(self, idx):
+        return bool(self.flags[idx] & STAR)
+
+
+class EntryView:
+    """Read-only view of a single entry of an EntryStore
+    """
+    __slots__ = ("store", "idx")
+
+    def __init__(self, store, idx):
+        self.store = store
+        self.idx = idx
+
+    def __repr__(self):
+        return "<EntryView {}: {!r}>".format(self.idx, self.line)
+
+    @property
+    def minutes(self):
+        return self.store.minutes[self.idx]
+
+    @property
+    def date(self):
+        return self.store.get_date(self.idx)
+
+    @property
+    def line(self):
+        return self.store.get_line(self.idx)
+
+    @property
+    def task(self):
+        return self.store.get_task(self.idx)
+
+    @property
+    def project(self):
+        return self.store.get_project(self.idx)
+
+    @property
+    def star(self):
+        return self.store.is_star(self.idx)
+
+    @property
+    def undated(self):
+        return bool(self.store.flags[self.idx] & UNDATED)
+
+
+def from_lines(lines):
+    """Returns an EntryStore with the stripped, non-blank lines passed-in
+    """
+    store = EntryStore()
+    for line in lines:
+        store.add(line)
+    return store
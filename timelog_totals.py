@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Running totals of the worked seconds of each summary period.
+
+For every period (day, week, month, year) the totals keep the start of the
+current bucket, the moment the next task starts from ("since") and the all
+and billable seconds. Adding a new entry only updates them, the same way a
+full pass over the log file does: entries older than since are ignored,
+start tasks move since, and any other task adds the seconds since then.
+
+The totals are stored next to the log file, with the inode, size and mtime
+of the log file they were computed for. Once the log file changes in any other
+way the totals are discarded and computed again.
+"""
+
+import json
+import os
+
+from timelog_files import atomic_write
+from timelog_files import get_sidecar_file
+
+# Bump whenever the format of the stored totals changes
+TOTALS_VERSION = 2
+
+
+class RunningTotals:
+    """Totals of the worked seconds of the current bucket of each period
+    """
+
+    def __init__(self, states=None, key=None):
+        # period -> [bucket start, since, all seconds, billable seconds],
+        # dates as minutes since 0001-01-01
+        self.states = states or {}
+        # (inode, size, mtime) of the log file the totals are up-to-date with
+        self.key = key
+
+    def __eq__(self, other):
+        return self.states == other.states
+
+    def roll(self, starts):
+        """Moves every period to the bucket starting at the minutes passed-in
+        for it in the dict, with no worked seconds yet
+        """
+        for period, start in starts.items():
+            state = self.states.get(period)
+            if state is None or state[0] != start:
+                self.states[period] = [start, start, 0, 0]
+
+    def add(self, minutes, star, billable):
+        """Adds an entry dated at the minutes passed-in, newer than the entries
+        already added
+        """
+        for state in self.states.values():
+            if minutes < state[1]:
+                continue
+            if not star:
+                seconds = (minutes - state[1]) * 60
+                state[2] += seconds
+                if billable:
+                    state[3] += seconds
+            state[1] = minutes
+
+    def get_totals(self):
+        """Returns a dict with the (all, billable) seconds of each period
+        """
+        return dict([(period, (state[2], state[3]))
+                     for period, state in self.states.items()])
+
+
+def get_totals_file(log_file):
+    """Returns the path of the running totals for the log file passed-in
+    """
+    return get_sidecar_file(log_file, ".{name}.totals")
+
+
+def get_log_key(log_file):
+    """Returns the (inode, size, mtime) of the log file, or None if missing
+    """
+    try:
+        stat = os.stat(log_file)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def read_totals(log_file):
+    """Returns the RunningTotals stored for the log file, or None if there
+    are none or the log file changed since they were stored
+    """
+    try:
+        with open(get_totals_file(log_file)) as reader:
+            data = json.load(reader)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != TOTALS_VERSION:
+        return None
+    totals = RunningTotals(data["states"], tuple(data["key"]))
+    if totals.key != get_log_key(log_file):
+        return None
+    return totals
+
+
+def write_totals(log_file, totals):
+    """Stores the totals, silently giving up if the file cannot be written
+    """
+    data = json.dumps({
+        "version": TOTALS_VERSION,
+        "key": totals.key,
+        "states": totals.states,
+    })
+    try:
+        atomic_write(get_totals_file(log_file), data.encode())
+    except OSError:
+        pass
+
+
+def invalidate_totals(log_file):
+    """Removes the stored totals of the log file, if any
+    """
+    try:
+        os.remove(get_totals_file(log_file))
+    except OSError:
+        pass